@@ -0,0 +1,134 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2014 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Benchmarks the slexer Fridge: the list-based Fridge it used to be against
+the dict-based Fridge, freezing the lexer state after every line like
+ly.document.Document and the highlighter do.
+
+Usage: python benchmarks/bench_fridge.py [file.ly ...]
+
+Without files, a generated score with a lot of Scheme and markup is used.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'frescobaldi_app'))
+
+import ly.lex
+import slexer
+
+
+ROUNDS = 5  # how often the text is tokenized, like retokenizing in a session
+
+
+class ListFridge(object):
+    """The Fridge as it was before it used a dictionary."""
+    def __init__(self, stateClass = slexer.State):
+        self._stateClass = stateClass
+        self._states = []
+
+    def freeze(self, state):
+        frozen = state.freeze()
+        try:
+            return self._states.index(frozen)
+        except ValueError:
+            i = len(self._states)
+            self._states.append(frozen)
+            return i
+
+    def count(self):
+        return len(self._states)
+
+
+def make(lines=20000):
+    """Returns LilyPond text with Scheme, markup and music nested in many ways.
+    
+    Every line opens or closes a construct, so that the lexer states at the
+    line ends are as varied as in scores that use a lot of Scheme and markup.
+    
+    """
+    rnd = random.Random(0)
+    # the constructs that can be opened in each context: (text, context, end)
+    constructs = {
+        'music': (("{", 'music', "}"), ("\\markup {", 'markup', "}"),
+                  ("#(", 'scheme', ")")),
+        'markup': (("\\line {", 'markup', "}"), ("\\bold {", 'markup', "}"),
+                   ("#(", 'scheme', ")")),
+        'scheme': (("(list", 'scheme', ")"), ("#{", 'music', "#}")),
+    }
+    result = ['\\version "2.18.0"']
+    stack = []
+    for i in range(lines):
+        context = stack[-1][0] if stack else 'music'
+        if stack and (len(stack) >= 12 or rnd.random() < .45):
+            result.append("  " * len(stack) + stack.pop()[1])
+        elif not stack:
+            result.append("v{0} = {{".format(i))
+            stack.append(('music', "}"))
+        else:
+            text, context, end = rnd.choice(constructs[context])
+            result.append("  " * len(stack) + text)
+            stack.append((context, end))
+    while stack:
+        result.append("  " * len(stack) + stack.pop()[1])
+    return "\n".join(result) + "\n"
+
+
+def run(fridge, lines):
+    """Tokenizes the lines ROUNDS times, freezing the state after each."""
+    t = time.time()
+    for i in range(ROUNDS):
+        state = ly.lex.state('lilypond')
+        for line in lines:
+            for token in state.tokens(line):
+                pass
+            fridge.freeze(state)
+    return time.time() - t
+
+
+def bench(name, text):
+    lines = text.splitlines()
+    old, new = ListFridge(), slexer.Fridge()
+    t_old = run(old, lines)
+    t_new = run(new, lines)
+    print("{0}: {1} lines, {2} states".format(name, len(lines), new.count()))
+    print("  list Fridge: {0:8.3f} s".format(t_old))
+    print("  dict Fridge: {0:8.3f} s".format(t_new))
+
+
+def main():
+    if sys.argv[1:]:
+        for filename in sys.argv[1:]:
+            with io.open(filename, encoding='utf-8') as f:
+                bench(filename, f.read())
+    else:
+        bench("generated", make())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2014 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Benchmarks the qpopplerview image cache while scrolling through a synthetic
+layout of 200 pages at a few zoom levels: the LRU cache against the cache as
+it was before, which sorted all images on every insert past the limit.
+
+Nothing is rendered; every page at a zoom level gets the same QImage, so
+only the cache bookkeeping is timed. Needs PyQt4.
+
+Usage: python benchmarks/bench_imagecache.py
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'frescobaldi_app'))
+
+from PyQt4.QtGui import QImage
+
+from qpopplerview import cache
+
+
+PAGES = 200
+VISIBLE = 3         # pages visible at a time
+ZOOMS = (0.5, 0.75, 1.0, 1.5)
+MAXSIZES = (100, 400)   # cache sizes in MB
+WIDTH, HEIGHT = 595, 842
+
+
+class Document(object):
+    """Stands in for a Poppler.Document."""
+
+
+class Page(object):
+    """Has the methods of qpopplerview.Page the cache uses."""
+    def __init__(self, document, pageNumber):
+        self._document = document
+        self._pageNumber = pageNumber
+        self._width = WIDTH
+        self._height = HEIGHT
+
+    def document(self):
+        return self._document
+
+    def pageNumber(self):
+        return self._pageNumber
+
+    def rotation(self):
+        return 0
+
+    def width(self):
+        return self._width
+
+    def height(self):
+        return self._height
+
+    def zoom(self, zoom):
+        self._width = int(WIDTH * zoom)
+        self._height = int(HEIGHT * zoom)
+
+
+class OldCache(object):
+    """The image cache as it was before it kept the images in LRU order."""
+    def __init__(self, maxsize):
+        self._cache = {}
+        self._maxsize = maxsize * 1048576
+        self._currentsize = 0
+
+    def image(self, page):
+        pageKey = (page.pageNumber(), page.rotation())
+        sizeKey = (page.width(), page.height())
+        try:
+            entry = self._cache[page.document()][pageKey][sizeKey]
+        except KeyError:
+            return
+        entry[1] = time.time()
+        return entry[0]
+
+    def add(self, image, document, pageNumber, rotation, width, height):
+        pageKey = (pageNumber, rotation)
+        sizeKey = (width, height)
+        self._cache.setdefault(document, {}).setdefault(pageKey, {})[sizeKey] = [image, time.time()]
+        self._currentsize += image.byteCount()
+        if self._currentsize > self._maxsize:
+            self.purge()
+
+    def purge(self):
+        images = iter(sorted((
+            (t, id(document), document, pageKey, sizeKey, image.byteCount())
+                for document, pageKeys in self._cache.items()
+                for pageKey, sizeKeys in pageKeys.items()
+                for sizeKey, (image, t) in sizeKeys.items()),
+                    reverse=True))
+        byteCount = 0
+        for item in images:
+            byteCount += item[5]
+            if byteCount > self._maxsize:
+                break
+        self._currentsize = byteCount
+        for t, i, document, pageKey, sizeKey, byteCount in images:
+            del self._cache[document][pageKey][sizeKey]
+
+
+def scroll(document, image, add):
+    """Scrolls down and up through all pages at every zoom level.
+
+    Returns the time it took and the number of images added.
+
+    """
+    pages = [Page(document, num) for num in range(PAGES)]
+    added = 0
+    t = time.time()
+    for zoom in ZOOMS:
+        for page in pages:
+            page.zoom(zoom)
+        img = QImage(pages[0].width(), pages[0].height(), QImage.Format_ARGB32)
+        top = list(range(PAGES - VISIBLE + 1))
+        for first in top + top[::-1]:
+            for page in pages[first:first+VISIBLE]:
+                if image(page) is None:
+                    add(img, document, page.pageNumber(), page.rotation(),
+                        page.width(), page.height())
+                    added += 1
+    return time.time() - t, added
+
+
+def main():
+    print("{0} pages, {1} zoom levels".format(PAGES, len(ZOOMS)))
+    for maxsize in MAXSIZES:
+        old = OldCache(maxsize)
+        t_old, added_old = scroll(Document(), old.image, old.add)
+
+        cache.clear()
+        cache.setmaxsize(maxsize)
+        document = Document()
+        before = cache.statistics()
+        t_new, added_new = scroll(document, cache.image, cache.add)
+        stats = cache.statistics()
+        for k in ('hits', 'misses', 'evictions'):
+            stats[k] -= before[k]
+
+        print("cache size {0} MB:".format(maxsize))
+        print("  sorting cache: {0:8.3f} s, {1} images added".format(t_old, added_old))
+        print("  LRU cache:     {0:8.3f} s, {1} images added".format(t_new, added_new))
+        print("  statistics: {0}".format(", ".join("{0}={1}".format(k, stats[k])
+            for k in ('hits', 'misses', 'evictions', 'images', 'bytes'))))
+
+
+if __name__ == '__main__':
+    main()
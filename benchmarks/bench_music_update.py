@@ -0,0 +1,85 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2014 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Benchmarks typing into a 5000-measure file: updating the music tree
+incrementally versus reading it again.
+
+Usage: python benchmarks/bench_music_update.py [keystrokes]
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'frescobaldi_app'))
+
+import ly.document
+from ly.music import items
+
+
+def make(voices=8, measures=625):
+    """Returns LilyPond text with voices times measures measures."""
+    names = "ABCDEFGH"
+    parts = ['\\version "2.18.0"\n', '\\header { title = "Test" }\n']
+    for v in range(voices):
+        parts.append("voice{0} = \\relative c' {{\n".format(names[v]))
+        for m in range(measures):
+            parts.append("  c4 d8 e f4 g | ")
+            if m % 7 == 0:
+                parts.append("\\times 2/3 { c8 d e }")
+            parts.append("\n")
+        parts.append("}\n\n")
+    parts.append("\\score {\n  <<\n")
+    for v in range(voices):
+        parts.append("    \\new Staff \\voice{0}\n".format(names[v]))
+    parts.append("  >>\n  \\layout {}\n}\n")
+    return "".join(parts)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    doc = ly.document.Document(make())
+
+    t = time.time()
+    music = items.Document(doc)
+    full = time.time() - t
+
+    # type in the middle of a voice
+    pos = doc.plaintext().index('voiceE') + 200
+    t = time.time()
+    for i in range(count):
+        with doc:
+            doc[pos:pos] = 'c'
+        music.update(pos, 0, 1)
+        pos += 1
+    update = (time.time() - t) / count
+
+    print("{0} characters, {1} toplevel items".format(
+        len(doc.plaintext()), len(music)))
+    print("full read:   {0:8.4f} s".format(full))
+    print("update:      {0:8.4f} s per keystroke".format(update))
+
+
+if __name__ == '__main__':
+    main()
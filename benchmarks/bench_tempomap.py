@@ -0,0 +1,105 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2014 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Benchmarks midifile.song.TempoMap on 100k events and 5k tempo changes:
+the linear walk it used to do, bisect in msec() and the bulk msecs().
+
+The linear walk is only timed on a sample of the events and extrapolated,
+because running it on all events takes minutes.
+
+Usage: python benchmarks/bench_tempomap.py
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'frescobaldi_app'))
+
+from midifile import event, song
+
+
+EVENTS = 100000
+TEMPOS = 5000
+SAMPLE = 100    # time the linear walk on every SAMPLE-th event
+
+
+class LinearTempoMap(song.TempoMap):
+    """The TempoMap as it was before it used bisect."""
+    def real_time(self, midi_time):
+        real_time = 0
+        times = self.times
+        for i in range(1, len(times)):
+            if times[i][0] >= midi_time:
+                real_time += (midi_time - times[i-1][0]) * times[i-1][1]
+                break
+            real_time += (times[i][0] - times[i-1][0]) * times[i-1][1]
+        else:
+            real_time += (midi_time - times[-1][0]) * times[-1][1]
+        return real_time // self.division
+
+
+def make():
+    """Returns an events dict like song.events_dict() creates."""
+    rnd = random.Random(0)
+    d = {}
+    note = event.NoteEvent(0x90, 0, 60, 64)
+    for i in range(EVENTS):
+        d.setdefault(i * 24, []).append(note)
+    for i in range(TEMPOS):
+        tempo = rnd.randint(300000, 900000)
+        data = tuple(chr(b) for b in (tempo >> 16, (tempo >> 8) & 0xFF, tempo & 0xFF))
+        d.setdefault(i * 24 * EVENTS // TEMPOS, []).insert(0, event.MetaEvent(0x51, data))
+    return d
+
+
+def main():
+    d = make()
+    midi_times = sorted(d)
+
+    t = time.time()
+    linear = LinearTempoMap(d, 384)
+    sample = [linear.msec(m) for m in midi_times[::SAMPLE]]
+    t_linear = (time.time() - t) * SAMPLE
+
+    t = time.time()
+    tempomap = song.TempoMap(d, 384)
+    result = [tempomap.msec(m) for m in midi_times]
+    t_bisect = time.time() - t
+
+    t = time.time()
+    bulk = song.TempoMap(d, 384).msecs(midi_times)
+    t_bulk = time.time() - t
+
+    assert result == bulk and result[::SAMPLE] == sample
+
+    print("{0} event times, {1} tempo changes".format(len(midi_times), len(tempomap.times)))
+    print("linear msec(): {0:8.3f} s (extrapolated)".format(t_linear))
+    print("bisect msec(): {0:8.3f} s".format(t_bisect))
+    print("bulk msecs():  {0:8.3f} s".format(t_bulk))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2014 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Benchmarks ly.document.Document against ly.document.TreeDocument for
+growing documents: one-character edits near the top, and looking up blocks
+by position.
+
+Usage: python benchmarks/bench_treedocument.py
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'frescobaldi_app'))
+
+import ly.document
+
+
+SIZES = (5000, 20000, 50000)
+EDITS = 200
+LOOKUPS = 20000
+
+
+def make(lines):
+    """Returns LilyPond text with the given number of lines."""
+    return "".join("  c'4 d'8 e' f'4 g' | % {0}\n".format(i)
+                   for i in range(lines))
+
+
+def edit(cls, text):
+    """Times EDITS one-character edits near the top of the document."""
+    doc = cls(text, 'lilypond')
+    t = time.time()
+    for i in range(EDITS):
+        with doc:
+            doc[10:10] = 'c'
+    return time.time() - t
+
+
+def lookup(cls, text):
+    """Times looking up LOOKUPS blocks and their positions."""
+    doc = cls(text, 'lilypond')
+    rnd = random.Random(0)
+    positions = [rnd.randrange(len(text)) for i in range(LOOKUPS)]
+    t = time.time()
+    for pos in positions:
+        doc.position(doc.block(pos))
+    return time.time() - t
+
+
+def main():
+    print("{0:>8} {1:>12} {2:>12} {3:>12} {4:>12}".format(
+        "lines", "edit list", "edit tree", "lookup list", "lookup tree"))
+    for lines in SIZES:
+        text = make(lines)
+        print("{0:8} {1:11.3f}s {2:11.3f}s {3:11.3f}s {4:11.3f}s".format(lines,
+            edit(ly.document.Document, text),
+            edit(ly.document.TreeDocument, text),
+            lookup(ly.document.Document, text),
+            lookup(ly.document.TreeDocument, text)))
+
+
+if __name__ == '__main__':
+    main()
@@ -25,16 +25,25 @@ from __future__ import unicode_literals
 
 import re
 
-from PyQt4.QtGui import QTextCursor
+from PyQt4.QtCore import Qt
+from PyQt4.QtGui import QCompleter, QTextCursor
 
 import app
+import listmodel
 import textformats
 import widgets.completer
 
+from . import completionindex
+
 
 class Completer(widgets.completer.Completer):
     def __init__(self):
         super(Completer, self).__init__()
+        # we filter the completions ourselves, see completionindex
+        self.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        self._source = None
+        self._model = listmodel.ListModel([])
+        self.setModel(self._model)
         self.setMaxVisibleItems(16)
         self.popup().setMinimumWidth(100)
         app.settingsChanged.connect(self.readSettings)
@@ -53,10 +62,21 @@ class Completer(widgets.completer.Completer):
             if not model:
                 return
             self._pos = cursor.block().position() + pos
-            if self.model() != model:
-                self.setModel(model)
+            self._source = model
         cursor.setPosition(self._pos, QTextCursor.KeepAnchor)
+        completionindex.fill(self._model, self._source, cursor.selectedText())
         return cursor
+    
+    def insertCompletion(self, index):
+        """Reimplemented to replace the typed text with the completion.
+        
+        The completion may differ in case or be a fuzzy match.
+        
+        """
+        text = self.completionModel().data(index, Qt.EditRole)
+        cursor = self.textCursor()
+        cursor.setPosition(self._pos, QTextCursor.KeepAnchor)
+        cursor.insertText(text)
 
     def analyzer(self):
         from . import analyzer
@@ -0,0 +1,151 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2011 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Fast matching of the completions in a model.
+
+An Index is built once for every model that is used as a source of
+completions (see index()). The completion texts are kept in a sorted list
+with lower-cased keys, so the completions starting with a prefix (case
+insensitively) are found using bisect, in a time depending on the number of
+results, and not on the number of completions in the model.
+
+After the prefix matches, fuzzy matches are listed: texts that contain the
+typed characters in the same order, but not necessarily adjacent. These
+should have the same leading symbols and first letter as the typed text,
+so only a small part of the completions needs to be looked at.
+
+"""
+
+from __future__ import unicode_literals
+
+import bisect
+import re
+import weakref
+
+from PyQt4.QtCore import QModelIndex, Qt
+
+
+
+_indices = weakref.WeakKeyDictionary()
+
+
+def index(model):
+    """Returns the Index for the model, creating it the first time."""
+    try:
+        return _indices[model]
+    except KeyError:
+        i = _indices[model] = Index.fromModel(model)
+        return i
+
+
+def fill(model, source, text):
+    """Resets the ListModel model to the completions in source matching text.
+    
+    Resetting the rows of the model, instead of setting a new model on the
+    completer, keeps its popup open while typing.
+    
+    """
+    i = index(source)
+    model.beginResetModel()
+    model._data = i.complete(text)
+    model.setRoleFunction(Qt.DisplayRole, i.display.__getitem__)
+    model.setRoleFunction(Qt.EditRole, i.edit.__getitem__)
+    model.endResetModel()
+
+
+def _stem(text):
+    """Returns the leading part of text upto and including the first letter.
+    
+    Fuzzy matches must start with the same (lower-cased) stem.
+    
+    """
+    for i, c in enumerate(text):
+        if c.isalnum():
+            return text[:i+1]
+    return text
+
+
+class Index(object):
+    """Finds the rows of completion texts matching a typed text.
+    
+    display and edit are lists with the displayed and inserted text of every
+    row. Matching is done on the edit text.
+    
+    """
+    def __init__(self, edit, display=None):
+        self.edit = edit
+        self.display = edit if display is None else display
+        keys = sorted((text.lower(), row) for row, text in enumerate(edit))
+        self._keys = [k for k, row in keys]
+        self._rows = [row for k, row in keys]
+    
+    @classmethod
+    def fromModel(cls, model):
+        """Creates an Index with the Edit and Display texts of a list model."""
+        rows = range(model.rowCount(QModelIndex()))
+        edit = [model.data(model.index(row), Qt.EditRole) or '' for row in rows]
+        display = [model.data(model.index(row), Qt.DisplayRole) or '' for row in rows]
+        return cls(edit, display if display != edit else None)
+    
+    def _range(self, prefix):
+        """Returns the slice of the sorted keys that start with prefix."""
+        lo = bisect.bisect_left(self._keys, prefix)
+        hi = bisect.bisect_left(self._keys, prefix + '\uffff', lo)
+        return lo, hi
+    
+    def prefix(self, text):
+        """Returns the rows starting with text, case insensitively.
+        
+        The rows that start with the text in the same case come first,
+        otherwise the order of the model is kept.
+        
+        """
+        lo, hi = self._range(text.lower())
+        edit = self.edit
+        return sorted(self._rows[lo:hi],
+            key = lambda row: (not edit[row].startswith(text), row))
+    
+    def fuzzy(self, text):
+        """Returns the rows containing the characters of text in that order.
+        
+        The rows that match the text case insensitively as a prefix are not
+        returned. Shorter matches come first, then shorter texts.
+        
+        """
+        key = text.lower()
+        stem = _stem(key)
+        if len(stem) == len(key):
+            return []
+        search = re.compile('.*?'.join(map(re.escape, key[len(stem):]))).search
+        lo, hi = self._range(stem)
+        results = []
+        for k, row in zip(self._keys[lo:hi], self._rows[lo:hi]):
+            if not k.startswith(key):
+                m = search(k, len(stem))
+                if m:
+                    results.append((m.end() - m.start(), len(k), row))
+        results.sort()
+        return [row for span, length, row in results]
+    
+    def complete(self, text):
+        """Returns the rows matching text, the best completions first."""
+        if not text:
+            return list(range(len(self.edit)))
+        return self.prefix(text) + self.fuzzy(text)
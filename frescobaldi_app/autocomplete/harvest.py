@@ -24,63 +24,42 @@ Harvest strings from document for autocompletion purposes.
 from __future__ import unicode_literals
 
 import itertools
-import re
 
 import documentinfo
 import fileinfo
-import tokeniter
-import ly.lex.lilypond
-import ly.lex.scheme
 
-
-def get_docinfo(cursor):
-    """Return a ly DocInfo instance for the cursor's document upto its position."""
-    dinfo = documentinfo.info(cursor.document())
-    return dinfo.lydocinfo().range(0, cursor.position())
+from . import wordindex
 
 
 def names(cursor):
     """Harvests names from assignments until the cursor."""
-    return get_docinfo(cursor).definitions()
+    return wordindex.index(cursor.document()).names(cursor.position())
 
 
 def markup_commands(cursor):
     """Harvest markup command definitions until the cursor."""
-    return get_docinfo(cursor).markup_definitions()
+    return wordindex.index(cursor.document()).markup_commands(cursor.position())
 
     
 def schemewords(document):
     """Harvests all schemewords from the document."""
-    for t in tokeniter.all_tokens(document):
-        if type(t) is ly.lex.scheme.Word:
-            yield t
+    return wordindex.index(document).schemewords()
 
 
 def include_identifiers(cursor):
     """Harvests identifier definitions from included files."""
-    dinfo = documentinfo.info(cursor.document())
-    files = fileinfo.includefiles(get_docinfo(cursor), dinfo.includepath())
+    files = documentinfo.info(cursor.document()).includefiles()
     return itertools.chain.from_iterable(fileinfo.docinfo(f).definitions()
                                          for f in files)
 
 
 def include_markup_commands(cursor):
     """Harvest markup command definitions from included files."""
-    dinfo = documentinfo.info(cursor.document())
-    files = fileinfo.includefiles(get_docinfo(cursor), dinfo.includepath())
+    files = documentinfo.info(cursor.document()).includefiles()
     return itertools.chain.from_iterable(fileinfo.docinfo(f).markup_definitions()
                                          for f in files)
-    
 
-_words = re.compile(r'\w{5,}|\w{2,}(?:[:-]\w+)+').finditer
-_word_types = (
-    ly.lex.String, ly.lex.Comment, ly.lex.Unparsed,
-    ly.lex.lilypond.MarkupWord, ly.lex.lilypond.LyricText)
 
 def words(document):
     """Harvests words from strings, lyrics, markup and comments."""
-    for t in tokeniter.all_tokens(document):
-        if isinstance(t, _word_types):
-            for m in _words(t):
-                yield m.group()
-
+    return wordindex.index(document).words()
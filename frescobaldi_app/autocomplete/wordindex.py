@@ -0,0 +1,219 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+An incremental index of the words and definitions in a Document.
+
+For every block the harvested words, scheme words, identifier definitions
+and markup command definitions are kept, together with the hash of the
+block's tokens and its lexer state at the end. The words are counted for the
+whole document.
+
+When the document changes, the changed blocks are only marked; the next time
+the index is used, those blocks (and the following blocks whose tokens
+changed as a result) are harvested again. So completion models can be built
+without going through all the tokens of the document.
+
+"""
+
+from __future__ import unicode_literals
+
+import collections
+import re
+
+import ly.document
+import ly.lex
+import ly.lex.lilypond
+import ly.lex.scheme
+import cursortools
+import plugin
+import tokeniter
+
+
+_words = re.compile(r'\w{5,}|\w{2,}(?:[:-]\w+)+').finditer
+_word_types = (
+    ly.lex.String, ly.lex.Comment, ly.lex.Unparsed,
+    ly.lex.lilypond.MarkupWord, ly.lex.lilypond.LyricText)
+
+
+def index(document):
+    """Returns the (up-to-date) WordIndex for the Document."""
+    i = WordIndex.instance(document)
+    i.update()
+    return i
+
+
+def harvest(block, tokens=None):
+    """Returns an Entry with the words and definitions in the block."""
+    if tokens is None:
+        tokens = tokeniter.tokens(block)
+    words = []
+    schemewords = []
+    names = []
+    markup = []
+    for i, t in enumerate(tokens):
+        if isinstance(t, _word_types):
+            words.extend(m.group() for m in _words(t))
+        elif type(t) is ly.lex.scheme.Word:
+            schemewords.append(t[:])
+            if t == 'define-markup-command':
+                for t1 in tokens[i+1:i+6]:
+                    if isinstance(t1, ly.lex.scheme.Word):
+                        markup.append(t1[:])
+                        break
+        elif i == 0 and t.pos == 0 and isinstance(t, ly.lex.lilypond.Name):
+            names.append(t[:])
+            # find bla = \markup { .. }
+            for t1 in tokens[1:6]:
+                if t1 == "\\markup":
+                    markup.append(t[:])
+                elif t1 == "=" or t1.isspace():
+                    continue
+                break
+    return Entry(ly.document.hash_tokens(tokens), block.userState(),
+                 tuple(words), tuple(schemewords), tuple(names), tuple(markup))
+
+
+Entry = collections.namedtuple('Entry', 'hash state words schemewords names markup')
+
+
+class WordIndex(plugin.DocumentPlugin):
+    """Keeps the harvested words and definitions of every block."""
+    def __init__(self, document):
+        self._entries = None
+        self._dirty = set()     # indices of changed blocks
+        self._words = {}        # collections.Counter() requires Python 2.7
+        self._schemewords = {}
+        document.contentsChange.connect(self.slotContentsChange)
+    
+    def slotContentsChange(self, position, removed, added):
+        """Called when the document changes, marks the changed blocks."""
+        if self._entries is None:
+            return
+        doc = self.document()
+        first = doc.findBlock(position)
+        if not first.isValid():
+            first = doc.lastBlock()
+        last = doc.findBlock(position + added)
+        if not last.isValid():
+            last = doc.lastBlock()
+        start = first.blockNumber()
+        end = last.blockNumber() + 1
+        old_end = end + len(self._entries) - doc.blockCount()
+        for entry in self._entries[start:old_end]:
+            if entry:
+                self._remove(entry)
+        delta = (end - start) - (old_end - start)
+        self._entries[start:old_end] = [None] * (end - start)
+        self._dirty = set(i if i < start else i + delta
+                          for i in self._dirty if i < start or i >= old_end)
+        self._dirty.update(range(start, end))
+        if len(self._entries) != doc.blockCount():
+            # should not happen, but harvest everything again
+            self._entries = None
+    
+    def _add(self, entry):
+        """Counts the words of the Entry."""
+        for counter, words in (
+            (self._words, entry.words), (self._schemewords, entry.schemewords)):
+            for w in words:
+                counter[w] = counter.get(w, 0) + 1
+    
+    def _remove(self, entry):
+        """Uncounts the words of the Entry."""
+        for counter, words in (
+            (self._words, entry.words), (self._schemewords, entry.schemewords)):
+            for w in words:
+                counter[w] -= 1
+    
+    def update(self):
+        """Harvests the changed blocks again."""
+        doc = self.document()
+        if self._entries is None:
+            self._words.clear()
+            self._schemewords.clear()
+            self._entries = []
+            for block in cursortools.all_blocks(doc):
+                entry = harvest(block)
+                self._add(entry)
+                self._entries.append(entry)
+            self._dirty = set()
+            return
+        if not self._dirty:
+            return
+        entries = self._entries
+        for i in sorted(self._dirty):
+            if entries[i] is not None:
+                continue    # already updated following an earlier block
+            block = doc.findBlockByNumber(i)
+            entry = entries[i] = harvest(block)
+            self._add(entry)
+            # the tokens of the following blocks can have changed too
+            i += 1
+            block = block.next()
+            while block.isValid() and entries[i] is not None:
+                old = entries[i]
+                tokens = tokeniter.tokens(block)
+                state = block.userState()
+                if ly.document.hash_tokens(tokens) != old.hash:
+                    self._remove(old)
+                    entry = entries[i] = harvest(block, tokens)
+                    self._add(entry)
+                elif state != old.state:
+                    entries[i] = old._replace(state=state)
+                if state == old.state:
+                    break
+                i += 1
+                block = block.next()
+        self._dirty = set()
+        # remove words that do not occur anymore
+        for counter in self._words, self._schemewords:
+            for word in [w for w, count in counter.items() if count <= 0]:
+                del counter[word]
+    
+    def words(self):
+        """Returns the set of words in strings, lyrics, markup and comments."""
+        return set(self._words)
+    
+    def schemewords(self):
+        """Returns the set of scheme words."""
+        return set(self._schemewords)
+    
+    def wordcount(self, word):
+        """Returns how many times the word occurs in the document."""
+        return self._words.get(word, 0)
+    
+    def names(self, position=None):
+        """Returns the identifiers defined before position (or in the whole document)."""
+        return self._definitions('names', position)
+    
+    def markup_commands(self, position=None):
+        """Returns the markup commands defined before position (or in the whole document)."""
+        return self._definitions('markup', position)
+    
+    def _definitions(self, name, position):
+        """Returns the definitions of the given Entry attribute before position."""
+        entries = self._entries
+        if position is not None:
+            entries = entries[:self.document().findBlock(position).blockNumber() + 1]
+        result = set()
+        for entry in entries:
+            result.update(getattr(entry, name))
+        return result
+
@@ -65,17 +65,62 @@ def mode(document, guess=True):
     return info(document).mode(guess)
 
     
+def includepath():
+    """Returns the configured include path.
+    
+    If there are session specific include paths, they are used.
+    Otherwise the paths are taken from the LilyPond preferences.
+    
+    """
+    import sessions
+    session_settings = sessions.currentSessionGroup()
+    try:
+        if session_settings and session_settings.contains("include-path"):
+            include_path = session_settings.value("include-path", [], type(""))
+        else:
+            include_path = QSettings().value("lilypond_settings/include_path", [], type(""))
+    except TypeError:
+        include_path = []
+    return include_path
+
+
 class DocumentInfo(plugin.DocumentPlugin):
     """Computes and caches various information about a Document."""
     def __init__(self, document):
+        self._music = None
+        self._music_change = None
+        document.contentsChange.connect(self._contentsChange)
         document.contentsChanged.connect(self._reset)
-        document.closed.connect(self._reset)
+        document.closed.connect(self._closed)
         self._reset()
         
     def _reset(self):
         """Called when the document is changed."""
         self._lydocinfo = None
+    
+    def _closed(self):
+        """Called when the document is closed."""
+        self._reset()
         self._music = None
+        self._music_change = None
+    
+    def _contentsChange(self, position, removed, added):
+        """Called on every change; records the changed range for the music tree.
+        
+        All changes since the music tree was last used are merged into one
+        range (start, old_end, new_end), with old_end pointing in the text as
+        the music tree knows it, and new_end in the current text.
+        
+        """
+        if self._music is not None:
+            if self._music_change is None:
+                start, old_end, new_end = position, position + removed, position + added
+            else:
+                start, old_end, new_end = self._music_change
+                old_end = max(old_end, position + removed - (new_end - old_end))
+                new_end = max(new_end, position + removed) + added - removed
+                start = min(start, position)
+            self._music_change = start, old_end, new_end
     
     def lydocinfo(self):
         """Return the lydocinfo instance for our document."""
@@ -91,6 +136,10 @@ class DocumentInfo(plugin.DocumentPlugin):
             import music
             doc = lydocument.Document(self.document())
             self._music = music.Document(doc)
+        elif self._music_change:
+            start, old_end, new_end = self._music_change
+            self._music.update(start, old_end - start, new_end - start)
+        self._music_change = None
         self._music.include_path = self.includepath()
         return self._music
     
@@ -117,16 +166,7 @@ class DocumentInfo(plugin.DocumentPlugin):
         If there are session specific include paths, they are used.
         Otherwise the paths are taken from the LilyPond preferences.
         Currently the document does not matter."""
-        import sessions
-        session_settings = sessions.currentSessionGroup()
-        try:
-            if session_settings and session_settings.contains("include-path"):
-                include_path = session_settings.value("include-path", [], type(""))
-            else:
-                include_path = QSettings().value("lilypond_settings/include_path", [], type(""))
-        except TypeError:
-            include_path = []
-        return include_path
+        return includepath()
         
     def jobinfo(self, create=False):
         """Returns a two-tuple(filename, includepath).
@@ -186,17 +226,20 @@ class DocumentInfo(plugin.DocumentPlugin):
             return ()
         return tuple(url.resolved(QUrl(arg)) for arg in self.lydocinfo().include_args())
         
-    def basenames(self):
+    def basenames(self, filename=None):
         """Returns a list of basenames that our document is expected to create.
         
         The list is created based on include files and the define output-suffix and
         \bookOutputName and \bookOutputSuffix commands.
         You should add '.ext' and/or '-[0-9]+.ext' to find created files.
         
+        If filename is given, it is used instead of the file the job is run on.
+        
         """
         # if the file defines an 'output' variable, it is used instead
         output = variables.get(self.document(), 'output')
-        filename = self.jobinfo()[0]
+        if filename is None:
+            filename = self.jobinfo()[0]
         if output:
             dirname = os.path.dirname(filename)
             return [os.path.join(dirname, name.strip())
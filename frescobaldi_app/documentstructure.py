@@ -28,7 +28,9 @@ import re
 from PyQt4.QtCore import QSettings
 
 import app
+import cursortools
 import plugin
+import tokeniter
 
 
 default_outline_patterns = [
@@ -93,22 +95,74 @@ def create_outline_re():
 
 
 class DocumentStructure(plugin.DocumentPlugin):
+    """Keeps the outline matches for every block of the Document.
+    
+    When the document changes, only the changed blocks are searched again.
+    
+    """
     def __init__(self, document):
-        self._outline = None
+        self._outline = None    # list of tuples of match objects per block
+        self._depths = {}       # maps highlighter state numbers to depths
     
     def invalidate(self):
-        """Called when the document changes or the settings are changed."""
+        """Called when the settings are changed."""
         self._outline = None
         app.settingsChanged.disconnect(self.invalidate)
-        self.document().contentsChanged.disconnect(self.invalidate)
+        self.document().contentsChange.disconnect(self.slotContentsChange)
+    
+    def slotContentsChange(self, position, removed, added):
+        """Called when the document changes, searches the changed blocks."""
+        doc = self.document()
+        first = doc.findBlock(position)
+        if not first.isValid():
+            first = doc.lastBlock()
+        last = doc.findBlock(position + added)
+        if not last.isValid():
+            last = doc.lastBlock()
+        start = first.blockNumber()
+        end = last.blockNumber() + 1
+        old_end = end + len(self._outline) - doc.blockCount()
+        rx = outline_re()
+        matches = []
+        block = first
+        while True:
+            matches.append(tuple(rx.finditer(block.text())))
+            if block == last:
+                break
+            block = block.next()
+        self._outline[start:old_end] = matches
+        if len(self._outline) != doc.blockCount():
+            # should not happen, but search again on the next request
+            self.invalidate()
     
     def outline(self):
-        """Return the document outline as a series of match objects."""
+        """Return the document outline as a list of (block, match) tuples.
+        
+        The match positions are relative to the block's position.
+        
+        """
+        doc = self.document()
         if self._outline is None:
-            self._outline = list(outline_re().finditer(self.document().toPlainText()))
-            self.document().contentsChanged.connect(self.invalidate)
+            rx = outline_re()
+            self._outline = [tuple(rx.finditer(block.text()))
+                             for block in cursortools.all_blocks(doc)]
+            doc.contentsChange.connect(self.slotContentsChange)
             app.settingsChanged.connect(self.invalidate, -999)
-        return self._outline
-
-
-
+        return [(doc.findBlockByNumber(num), m)
+                for num, matches in enumerate(self._outline) if matches
+                for m in matches]
+    
+    def depth(self, block):
+        """Return the depth of the lexer state at the beginning of the block.
+        
+        The depth is cached for every state number of the highlighter.
+        
+        """
+        num = block.previous().userState()
+        if num < 0:
+            return tokeniter.state(block).depth()
+        try:
+            return self._depths[num]
+        except KeyError:
+            depth = self._depths[num] = tokeniter.state(block).depth()
+            return depth
@@ -23,12 +23,17 @@ Actions to engrave the music in the documents.
 
 from __future__ import unicode_literals
 
+import glob
+import os
+
 from PyQt4.QtCore import QSettings, Qt, QUrl
-from PyQt4.QtGui import QAction, QApplication, QKeySequence, QMessageBox
+from PyQt4.QtGui import (
+    QAction, QApplication, QFileDialog, QKeySequence, QMessageBox)
 
 import app
 import actioncollection
 import actioncollectionmanager
+import documentinfo
 import jobmanager
 import jobattributes
 import plugin
@@ -54,8 +59,11 @@ class Engraver(plugin.MainWindowPlugin):
         ac.engrave_runner.triggered.connect(self.engraveRunner)
         ac.engrave_preview.triggered.connect(self.engravePreview)
         ac.engrave_publish.triggered.connect(self.engravePublish)
+        ac.engrave_score.triggered.connect(self.engraveScore)
         ac.engrave_debug.triggered.connect(self.engraveLayoutControl)
         ac.engrave_custom.triggered.connect(self.engraveCustom)
+        ac.engrave_all_documents.triggered.connect(self.engraveAllDocuments)
+        ac.engrave_folder.triggered.connect(self.engraveFolder)
         ac.engrave_abort.triggered.connect(self.engraveAbort)
         ac.engrave_autocompile.toggled.connect(self.engraveAutoCompileToggled)
         ac.engrave_show_available_fonts.triggered.connect(self.showAvailableFonts)
@@ -97,6 +105,7 @@ class Engraver(plugin.MainWindowPlugin):
         ac = self.actionCollection
         ac.engrave_preview.setEnabled(not running)
         ac.engrave_publish.setEnabled(not running)
+        ac.engrave_score.setEnabled(not running)
         ac.engrave_debug.setEnabled(not running)
         ac.engrave_abort.setEnabled(running)
         ac.engrave_runner.setIcon(icons.get('process-stop' if running else 'lilypond-run'))
@@ -118,6 +127,10 @@ class Engraver(plugin.MainWindowPlugin):
         """Starts an engrave job in publish mode (with point and click turned off)."""
         self.engrave('publish')
         
+    def engraveScore(self):
+        """Starts an engrave job in preview mode, only for the score at the cursor."""
+        self.engrave('score')
+    
     def engraveLayoutControl(self):
         """Starts an engrave job in debug mode (using the settings in the debug tool)."""
         self.engrave('layout-control')
@@ -140,9 +153,11 @@ class Engraver(plugin.MainWindowPlugin):
     def engrave(self, mode='preview', document=None, may_save=True):
         """Starts an engraving job.
         
-        The mode can be 'preview', 'publish', or 'layout-control'. The last 
-        one uses the settings in the Layout Control Options panel. The 
-        default mode is 'preview'.
+        The mode can be 'preview', 'publish', 'score' or 'layout-control'.
+        The 'score' mode is the preview mode, but only engraves the score at
+        the cursor if that is in the engraved document. The last one uses the
+        settings in the Layout Control Options panel. The default mode is
+        'preview'.
         
         If document is not specified, it is either the sticky or current
         document.
@@ -152,7 +167,7 @@ class Engraver(plugin.MainWindowPlugin):
         is run" is enabled.
         
         """
-        if mode == 'preview':
+        if mode in ('preview', 'score'):
             args = ['-dpoint-and-click']
         elif mode == 'publish':
             args = ['-dno-point-and-click']
@@ -163,7 +178,49 @@ class Engraver(plugin.MainWindowPlugin):
         if may_save:
             self.saveDocumentIfDesired()
         from . import command
-        self.runJob(command.defaultJob(doc, args), doc)
+        job = None
+        if mode == 'score' and doc is self.mainwindow().currentDocument():
+            job = command.partialJob(doc, self.mainwindow().textCursor().position(), args)
+        self.runJob(job or command.defaultJob(doc, args), doc)
+    
+    def engraveAllDocuments(self):
+        """Engraves all LilyPond documents in the session (in publish mode)."""
+        current = self.document()
+        docs = [d for d in app.documents
+                if documentinfo.mode(d) == "lilypond"
+                and not d.url().path().endswith(('.ily', '.lyi'))]
+        if not docs:
+            return
+        from . import command
+        dlg = self.batchDialog()
+        for doc in docs:
+            dlg.add(command.defaultJob(doc), doc, 0 if doc is current else 1)
+    
+    def engraveFolder(self):
+        """Asks for a directory and engraves all .ly files in it (in publish mode)."""
+        directory = os.path.dirname(self.mainwindow().currentDocument().url().toLocalFile())
+        directory = QFileDialog.getExistingDirectory(self.mainwindow(),
+            app.caption(_("Engrave All Files in Folder")), directory)
+        if not directory:
+            return
+        files = sorted(glob.glob(os.path.join(directory, '*.ly')))
+        if not files:
+            return
+        from . import command
+        dlg = self.batchDialog()
+        for filename in files:
+            dlg.add(command.fileJob(filename))
+    
+    def batchDialog(self):
+        """Returns the dialog showing the progress of batch engraving, shown."""
+        try:
+            dlg = self._batchDialog
+        except AttributeError:
+            from . import batch
+            dlg = self._batchDialog = batch.Dialog(self.mainwindow())
+        dlg.show()
+        dlg.raise_()
+        return dlg
     
     def engraveAbort(self):
         job = self.runningJob()
@@ -302,8 +359,11 @@ class Actions(actioncollection.ActionCollection):
         self.engrave_runner = QAction(parent)
         self.engrave_preview = QAction(parent)
         self.engrave_publish = QAction(parent)
+        self.engrave_score = QAction(parent)
         self.engrave_debug = QAction(parent)
         self.engrave_custom = QAction(parent)
+        self.engrave_all_documents = QAction(parent)
+        self.engrave_folder = QAction(parent)
         self.engrave_abort = QAction(parent)
         self.engrave_autocompile = QAction(parent)
         self.engrave_autocompile.setCheckable(True)
@@ -317,8 +377,11 @@ class Actions(actioncollection.ActionCollection):
         self.engrave_sticky.setIcon(icons.get('pushpin'))
         self.engrave_preview.setIcon(icons.get('lilypond-run'))
         self.engrave_publish.setIcon(icons.get('lilypond-run'))
+        self.engrave_score.setIcon(icons.get('lilypond-run'))
         self.engrave_debug.setIcon(icons.get('lilypond-run'))
         self.engrave_custom.setIcon(icons.get('lilypond-run'))
+        self.engrave_all_documents.setIcon(icons.get('lilypond-run'))
+        self.engrave_folder.setIcon(icons.get('lilypond-run'))
         self.engrave_abort.setIcon(icons.get('process-stop'))
         
 
@@ -326,8 +389,11 @@ class Actions(actioncollection.ActionCollection):
         self.engrave_runner.setText(_("Engrave"))
         self.engrave_preview.setText(_("&Engrave (preview)"))
         self.engrave_publish.setText(_("Engrave (&publish)"))
+        self.engrave_score.setText(_("Engrave (current &score)"))
         self.engrave_debug.setText(_("Engrave (&layout control)"))
         self.engrave_custom.setText(_("Engrave (&custom)..."))
+        self.engrave_all_documents.setText(_("Engrave &All Documents"))
+        self.engrave_folder.setText(_("Engrave All Files in &Folder..."))
         self.engrave_abort.setText(_("Abort Engraving &Job"))
         self.engrave_autocompile.setText(_("Automatic E&ngrave"))
         self.engrave_show_available_fonts.setText(_("Show Available &Fonts..."))
@@ -37,10 +37,12 @@ from PyQt4.QtCore import QSettings, QTimer
 
 import app
 import documentinfo
+import lydocument
 import resultfiles
 import jobattributes
 import jobmanager
 import plugin
+import ly.document
 import ly.lex
 
 from . import engraver
@@ -107,13 +109,27 @@ class AutoCompiler(plugin.MainWindowPlugin):
                 if may_compile:
                     mgr.slotJobStarted()
         if may_compile:
-            job = command.defaultJob(doc, ['-dpoint-and-click'])
+            job = None
+            if (doc is self.mainwindow().currentDocument() and QSettings().value(
+                    "lilypond_settings/autocompile_score", False, bool)):
+                job = command.partialJob(doc,
+                    self.mainwindow().textCursor().position(), ['-dpoint-and-click'])
+            if not job:
+                job = command.defaultJob(doc, ['-dpoint-and-click'])
             jobattributes.get(job).hidden = True
             eng.runJob(job, doc)
 
 
 class AutoCompileManager(plugin.DocumentPlugin):
+    """Keeps track of whether a document changed since it was last compiled.
+    
+    The token hashes of all the blocks are stored when a job is started.
+    After a change, only the hashes of the changed blocks are compared.
+    
+    """
     def __init__(self, document):
+        self._change = None
+        document.contentsChange.connect(self.slotDocumentContentsChange)
         document.contentsChanged.connect(self.slotDocumentContentsChanged)
         document.saved.connect(self.slotDocumentSaved)
         document.loaded.connect(self.initialize)
@@ -133,7 +149,58 @@ class AutoCompileManager(plugin.DocumentPlugin):
             else:
                 ext = '.pdf'
             self._dirty = not resultfiles.results(document).files(ext)
-        self._hash = None if self._dirty else documentinfo.docinfo(document).token_hash()
+        if self._dirty:
+            self._hashes = None
+            self._change = None
+        else:
+            self.storeHashes()
+    
+    def storeHashes(self):
+        """Store the token hashes of all the blocks of the document."""
+        doc = lydocument.Document(self.document())
+        self._hashes = [doc.token_hash(block) for block in doc]
+        self._change = None
+    
+    def changed(self):
+        """Return True if the tokens changed since the hashes were stored.
+        
+        Only the hashes of the changed blocks are compared, and those of the
+        blocks following them until a non-empty block has the same hash as
+        before (because a change can alter the tokenizing of the following
+        lines). Changes in whitespace, comments or empty lines are ignored.
+        If nothing changed, the stored hashes are updated.
+        
+        """
+        if self._change is None:
+            return False
+        doc = lydocument.Document(self.document())
+        hashes = self._hashes
+        delta = len(doc) - len(hashes)
+        start, end = self._change
+        block = doc.block(start)
+        first = doc.index(block)
+        last = doc.index(doc.block(min(end, doc.size() - 1)))
+        new = []
+        for i in range(first, last + 1):
+            new.append(doc.token_hash(block))
+            block = doc.next_block(block)
+        empty = ly.document.EMPTY_HASH
+        if ([h for h in new if h != empty] !=
+            [h for h in hashes[first:last + 1 - delta] if h != empty]):
+            return True
+        i = last + 1
+        while doc.isvalid(block):
+            h = doc.token_hash(block)
+            if h != hashes[i - delta]:
+                return True
+            new.append(h)
+            i += 1
+            if h != empty:
+                break
+            block = doc.next_block(block)
+        hashes[first:i - delta] = new
+        self._change = None
+        return False
     
     def may_compile(self):
         """Return True if we could need to compile the document."""
@@ -142,13 +209,21 @@ class AutoCompileManager(plugin.DocumentPlugin):
             if (dinfo.mode() == "lilypond"
                 and dinfo.complete()
                 and documentinfo.music(self.document()).has_output()):
-                h = dinfo.token_hash()
-                if h != self._hash:
-                    self._hash = h
-                    if h != hash(tuple()):
-                        return True
+                if self._hashes is None or self.changed():
+                    self.storeHashes()
+                    return True
             self._dirty = False
     
+    def slotDocumentContentsChange(self, position, removed, added):
+        """Called on every change; records the range of changed text."""
+        if self._hashes is not None:
+            if self._change is None:
+                self._change = position, position + added
+            else:
+                start, end = self._change
+                self._change = (min(start, position),
+                    max(end, position + removed) + added - removed)
+    
     def slotDocumentContentsChanged(self):
         """Called when the user modifies the document."""
         self._dirty = True
@@ -156,12 +231,12 @@ class AutoCompileManager(plugin.DocumentPlugin):
     def slotDocumentSaved(self):
         """Called when the document is saved. Forces auto-compile once."""
         self._dirty = True
-        self._hash = None
+        self._hashes = None
     
     def slotJobStarted(self):
         """Called when an engraving job is started on this document."""
         if self._dirty:
             self._dirty = False
-            self._hash = documentinfo.docinfo(self.document()).token_hash()
+            self.storeHashes()
 
 
@@ -0,0 +1,230 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Engraves many documents or files using a bounded number of processes.
+
+A Queue holds jobs ordered by priority and runs at most maximum() of them at
+the same time. The Dialog shows the aggregated progress of a Queue and allows
+the user to cancel all jobs at once.
+
+"""
+
+from __future__ import unicode_literals
+
+import heapq
+import itertools
+import time
+
+from PyQt4.QtCore import QSettings, QSize, QThread, QTimer
+from PyQt4.QtGui import QDialogButtonBox, QProgressBar
+
+import app
+import job
+import jobattributes
+import jobmanager
+import qutil
+import signals
+import widgets.dialog
+
+
+def maximum():
+    """Returns the configured maximum number of concurrent LilyPond processes."""
+    return QSettings().value("lilypond_settings/batch_processes",
+                             QThread.idealThreadCount(), int) or 1
+
+
+class Queue(object):
+    """Runs Jobs with at most maximum() of them at the same time.
+    
+    Jobs with a lower priority value are started first, jobs with the same
+    priority in the order they were added. A Job that is added with a document
+    is run via the JobManager of that document, so that the results are shown
+    like with a normal engrave job.
+    
+    """
+    
+    started = signals.Signal()  # Job
+    finished = signals.Signal() # Job, success
+    progress = signals.Signal() # finished count, total count
+    done = signals.Signal()     # (no arguments)
+    
+    def __init__(self, maximum=None):
+        self._maximum = maximum
+        self._pending = []
+        self._running = []
+        self._counter = itertools.count()
+        self._total = 0
+        self._finished = 0
+        self._failed = 0
+        self._starttime = 0.0
+        self._elapsed = 0.0
+    
+    def maximum(self):
+        """Returns the maximum number of concurrently running Jobs."""
+        return self._maximum or maximum()
+    
+    def setMaximum(self, count):
+        """Sets the maximum number of concurrently running Jobs.
+        
+        If count is None, the configured number is used.
+        
+        """
+        self._maximum = count
+        self._startJobs()
+    
+    def add(self, j, document=None, priority=0):
+        """Adds a Job, optionally on behalf of a document, and starts it if possible."""
+        if not self.isRunning():
+            self._total = self._finished = self._failed = 0
+            self._starttime = time.time()
+            self._elapsed = 0.0
+        heapq.heappush(self._pending, (priority, next(self._counter), j, document))
+        self._total += 1
+        self._startJobs()
+        self.progress(self._finished, self._total)
+    
+    def cancel(self):
+        """Removes all pending Jobs and aborts the running ones."""
+        self._total -= len(self._pending)
+        del self._pending[:]
+        if not self._running:
+            self._stop()
+        for j, document in self._running[:]:
+            j.abort()
+    
+    def isRunning(self):
+        """Returns True if there are running or pending Jobs."""
+        return bool(self._running or self._pending)
+    
+    def total(self):
+        """Returns the number of Jobs added since the queue was last empty."""
+        return self._total
+    
+    def finishedCount(self):
+        """Returns the number of finished Jobs."""
+        return self._finished
+    
+    def failedCount(self):
+        """Returns the number of finished Jobs that did not succeed."""
+        return self._failed
+    
+    def runningJobs(self):
+        """Returns the list of currently running Jobs."""
+        return [j for j, document in self._running]
+    
+    def elapsed(self):
+        """Returns the number of seconds since the first Job was started."""
+        if self._elapsed:
+            return self._elapsed
+        elif self._starttime:
+            return time.time() - self._starttime
+        return 0.0
+    
+    def _startJobs(self):
+        """Starts pending Jobs as long as the maximum is not reached."""
+        while self._pending and len(self._running) < self.maximum():
+            priority, count, j, document = heapq.heappop(self._pending)
+            self._running.append((j, document))
+            j.done.connect(lambda success, j=j: self._jobDone(j, success))
+            if document is None:
+                j.start()
+            else:
+                # cancel a running job (e.g. an autocompile job)
+                rjob = jobmanager.job(document)
+                if rjob and rjob.isRunning():
+                    rjob.abort()
+                jobmanager.manager(document).startJob(j)
+            self.started(j)
+    
+    def _jobDone(self, j, success):
+        """Called when a Job has finished."""
+        for i, (rjob, document) in enumerate(self._running):
+            if rjob is j:
+                del self._running[i]
+                break
+        else:
+            return
+        self._finished += 1
+        if not success:
+            self._failed += 1
+        self.finished(j, success)
+        self.progress(self._finished, self._total)
+        self._startJobs()
+        if not self._running:
+            self._stop()
+    
+    def _stop(self):
+        """Called when the last Job has finished."""
+        self._elapsed = time.time() - self._starttime
+        self.done()
+
+
+class Dialog(widgets.dialog.Dialog):
+    """Shows the progress of a Queue and allows cancelling all Jobs."""
+    def __init__(self, mainwindow):
+        super(Dialog, self).__init__(mainwindow, buttons=('close',))
+        self._mainwindow = mainwindow
+        self._queue = Queue()
+        self._queue.progress.connect(self.updateProgress)
+        self._queue.done.connect(self.slotDone)
+        self._progress = QProgressBar()
+        self.setMainWidget(self._progress)
+        self._timer = QTimer(interval=1000, timeout=self.updateProgress)
+        self._cancelButton = self.buttonBox().addButton("", QDialogButtonBox.ActionRole)
+        self._cancelButton.clicked.connect(self._queue.cancel)
+        self.setModal(False)
+        app.translateUI(self)
+        qutil.saveDialogSize(self, "engrave/batch/dialog/size", QSize(400, 120))
+    
+    def translateUI(self):
+        self.setWindowTitle(app.caption(_("Engrave")))
+        self._cancelButton.setText(_("Cancel All"))
+        self.updateProgress()
+    
+    def queue(self):
+        """Returns our Queue."""
+        return self._queue
+    
+    def add(self, j, document=None, priority=0):
+        """Adds a Job to the queue, on behalf of our main window."""
+        jobattributes.get(j).mainwindow = self._mainwindow
+        self._queue.add(j, document, priority)
+        self._timer.start()
+        self._cancelButton.setEnabled(True)
+    
+    def updateProgress(self, finished=None, total=None):
+        """Shows the number of finished jobs and the elapsed time."""
+        q = self._queue
+        self._progress.setMaximum(max(q.total(), 1))
+        self._progress.setValue(q.finishedCount())
+        self.setMessage(_(
+            "Engraved {finished} of {total} files ({failed} failed) "
+            "using {count} processes in {time}.").format(
+            finished=q.finishedCount(),
+            total=q.total(),
+            failed=q.failedCount(),
+            count=q.maximum(),
+            time=job.elapsed2str(q.elapsed())))
+    
+    def slotDone(self):
+        """Called when the queue has finished all jobs."""
+        self._timer.stop()
+        self._cancelButton.setEnabled(False)
+        self.updateProgress()
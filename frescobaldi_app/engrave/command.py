@@ -27,14 +27,22 @@ import os, sys
 
 from PyQt4.QtCore import QSettings
 
-import job
 import documentinfo
+import fileinfo
+import jobattributes
 import lilypondinfo
+import scratchdir
+from . import partial
+from . import resultcache
 
 
 def info(document):
     """Returns a LilyPondInfo instance that should be used by default to engrave the document."""
-    version = documentinfo.docinfo(document).version()
+    return _info(documentinfo.docinfo(document).version())
+
+
+def _info(version):
+    """Returns the LilyPondInfo instance to use for the document version."""
     if version and QSettings().value("lilypond_settings/autoversion", False, bool):
         return lilypondinfo.suitable(version)
     return lilypondinfo.preferred()
@@ -51,9 +59,81 @@ def defaultJob(document, args=None):
     
     """
     filename, includepath = documentinfo.info(document).jobinfo(True)
+    i = info(document)
+    j = _job(i, filename, includepath, args)
+    j.setTitle("{0} {1} [{2}]".format(
+        os.path.basename(i.command), i.versionString(), document.documentName()))
+    if QSettings().value("lilypond_settings/result_cache", True, bool):
+        dinfo = documentinfo.info(document)
+        resultcache.prepare(j, i.versionString(),
+            dinfo.includefiles(), dinfo.basenames())
+    return j
+
+
+def partialJob(document, position, args=None):
+    """Return a job that engraves only the score at position in the document.
+    
+    All other \score, \book and \bookpart blocks and top-level music and
+    markup are left out (see the partial module). The text is saved to the
+    scratch area of the document, keeping all lines and columns, so that
+    point and click links point to the document.
+    
+    Returns None if there is nothing to leave out; use defaultJob() then.
     
+    """
+    dinfo = documentinfo.info(document)
+    text = partial.partial_text(document.toPlainText(), dinfo.music(), position)
+    if text is None:
+        return
+    scratch = scratchdir.scratchdir(document)
+    scratch.create()
+    filename = scratch.path()
+    try:
+        data = text.encode(document.encoding() or 'utf-8')
+    except (UnicodeError, LookupError):
+        data = text.encode('utf-8')
+    with open(filename, 'wb') as f:
+        f.write(data)
+    
+    includepath = dinfo.includepath()
+    url = document.url().toLocalFile()
+    if url:
+        includepath.insert(0, os.path.dirname(url))
     i = info(document)
-    j = job.Job()
+    j = _job(i, filename, includepath, args)
+    j.setTitle("{0} {1} [{2}]".format(
+        os.path.basename(i.command), i.versionString(), document.documentName()))
+    basenames = dinfo.basenames(filename)
+    attrs = jobattributes.get(j)
+    attrs.jobfile = filename
+    attrs.basenames = basenames
+    if QSettings().value("lilypond_settings/result_cache", True, bool):
+        resultcache.prepare(j, i.versionString(), dinfo.includefiles(), basenames)
+    return j
+
+
+def fileJob(filename, args=None):
+    """Return a default job for a file that is not loaded as a document.
+    
+    The 'args' argument has the same meaning as in defaultJob().
+    
+    """
+    dinfo = fileinfo.docinfo(filename)
+    includepath = documentinfo.includepath()
+    i = _info(dinfo.version())
+    j = _job(i, filename, includepath, args)
+    j.setTitle("{0} {1} [{2}]".format(
+        os.path.basename(i.command), i.versionString(), os.path.basename(filename)))
+    if QSettings().value("lilypond_settings/result_cache", True, bool):
+        includefiles = fileinfo.includefiles(dinfo, includepath)
+        resultcache.prepare(j, i.versionString(),
+            includefiles, fileinfo.basenames(dinfo, includefiles, filename))
+    return j
+
+
+def _job(i, filename, includepath, args):
+    """Return a Job running LilyPondInfo i on the filename."""
+    j = resultcache.Job()
     
     command = [i.abscommand() or i.command]
     s = QSettings()
@@ -79,6 +159,4 @@ def defaultJob(document, args=None):
     j.command = command
     if s.value("no_translation", False, bool):
         j.environment['LANG'] = 'C'
-    j.setTitle("{0} {1} [{2}]".format(
-        os.path.basename(i.command), i.versionString(), document.documentName()))
     return j
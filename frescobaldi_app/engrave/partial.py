@@ -0,0 +1,106 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Engraves only the score at the cursor position.
+
+The text of the document is copied, but all top-level items that produce
+output (\score, \book, \bookpart, \markup and bare music expressions),
+except the one containing the cursor, are replaced with whitespace. All
+assignments, includes, \paper, \header and \layout blocks etc. are retained.
+
+Because line breaks and tabs are kept, all lines and columns are the same as
+in the original document, so the point and click links in the output point
+to the correct positions.
+
+"""
+
+from __future__ import unicode_literals
+
+import re
+
+import ly.music.items
+
+
+_blank_re = re.compile(r'[^\r\n\t]')
+
+
+def produces_output(item):
+    """Returns True if the top-level item adds something to the output."""
+    if isinstance(item, (ly.music.items.Score, ly.music.items.Book,
+                         ly.music.items.BookPart, ly.music.items.Markup,
+                         ly.music.items.MarkupList)):
+        return True
+    return (isinstance(item, ly.music.items.Music)
+            and not isinstance(item, ly.music.items.UserCommand))
+
+
+def omitted_ranges(music, position):
+    """Returns a list of (start, end) ranges that can be left out.
+    
+    music is the ly.music.items.Document of the text, position the cursor
+    position. The ranges are the items that produce output and that are
+    siblings of the \score, \book or \bookpart containing the position.
+    Nested \bookparts and scores in a \book are handled as well.
+    
+    If the position is not in such an item, an empty list is returned.
+    
+    """
+    ranges = []
+    node = music
+    while True:
+        items = [item for item in node if produces_output(item)]
+        for current in items:
+            if current.position <= position <= current.end_position():
+                break
+        else:
+            break
+        ranges.extend((item.position, item.end_position())
+                      for item in items if item is not current)
+        if not isinstance(current, (ly.music.items.Book, ly.music.items.BookPart)):
+            break
+        node = current
+    return ranges
+
+
+def blank(text, ranges):
+    """Returns the text with the characters in the ranges replaced with spaces.
+    
+    Newlines and tabs are kept.
+    
+    """
+    result = []
+    pos = 0
+    for start, end in sorted(ranges):
+        result.append(text[pos:start])
+        result.append(_blank_re.sub(' ', text[start:end]))
+        pos = end
+    result.append(text[pos:])
+    return ''.join(result)
+
+
+def partial_text(text, music, position):
+    """Returns the text with only the score at position, or None.
+    
+    None is returned if there is nothing to leave out.
+    
+    """
+    ranges = omitted_ranges(music, position)
+    if ranges:
+        return blank(text, ranges)
@@ -0,0 +1,332 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Content-addressed cache of engraving results.
+
+When LilyPond is run on a document, a key is computed from the contents of
+the document and all the files it includes, the LilyPond version and the full
+commandline. After a successful run, the created PDF, SVG and MIDI files and
+the output of LilyPond are stored in the user's cache directory under that
+key.
+
+When the same document is engraved again with the same key, the stored files
+are copied back to the place where they would have been created, so the
+result is available without running LilyPond at all.
+
+The least recently used results are removed when the cache becomes larger
+than maxsize() bytes.
+
+"""
+
+from __future__ import unicode_literals
+
+import hashlib
+import os
+import re
+import shutil
+import time
+
+from PyQt4.QtCore import QTimer
+
+import job
+import util
+
+
+# increase this when the cache layout changes
+_FORMAT = 1
+
+# the extensions of the result files that are stored
+extensions = ('.pdf', '.svg', '.midi', '.mid')
+
+_maxsize = 200 * 1024 * 1024
+
+_logname = 'log'
+_filename_re = re.compile(r'(\d+)(.*)$')
+
+
+def maxsize():
+    """Returns the maximum size in bytes of the cache directory."""
+    return _maxsize
+
+
+def setmaxsize(size):
+    """Sets the maximum size in bytes of the cache directory."""
+    global _maxsize
+    _maxsize = size
+
+
+def directory():
+    """Returns the cache directory, or None if it is not available."""
+    return util.cachedir("engrave")
+
+
+def _update_file(h, filename):
+    """Adds the name and the contents of the file to the hash object.
+    
+    Returns False if the file could not be read.
+    
+    """
+    h.update(filename.encode('utf-8') + b'\0')
+    try:
+        with open(filename, 'rb') as f:
+            while True:
+                data = f.read(65536)
+                if not data:
+                    break
+                h.update(data)
+    except (IOError, OSError):
+        return False
+    h.update(b'\0')
+    return True
+
+
+def key(j, filename, includefiles, version):
+    """Returns the key for running the job on filename, or None.
+    
+    j is the Job (its command and environment are used), includefiles the
+    filenames included by the document and version the LilyPond version
+    string. None is returned if one of the files could not be read.
+    
+    """
+    h = hashlib.sha1()
+    h.update("{0}\0{1}\0".format(_FORMAT, version).encode('utf-8'))
+    for arg in j.command:
+        h.update(arg.encode('utf-8') + b'\0')
+    for k, v in sorted(j.environment.items()):
+        h.update("{0}={1}\0".format(k, v).encode('utf-8'))
+    for name in [filename] + sorted(includefiles):
+        if not _update_file(h, name):
+            return
+    return h.hexdigest()
+
+
+def prepare(j, version, includefiles, basenames):
+    """Enables the cache for the Job j.
+    
+    Must be called when the Job is fully set up and the file it engraves
+    (the last argument of the command) has been saved. The version is the
+    LilyPond version string, includefiles the files included by the engraved
+    file and basenames the basenames of the files LilyPond will create.
+    
+    """
+    j.cachekey = key(j, j.command[-1], includefiles, version)
+    j.basenames = basenames
+
+
+def _entry(cachekey):
+    """Returns the directory for the cache key, or None."""
+    d = directory()
+    if d and cachekey:
+        return os.path.join(d, cachekey)
+
+
+def restore(cachekey, basenames):
+    """Copies the stored results for the key back to the basenames.
+    
+    Returns a two-tuple(files, log) with the list of restored files and the
+    stored output of LilyPond, or None if there is no (valid) cache entry.
+    
+    """
+    entry = _entry(cachekey)
+    if not entry or not os.path.isdir(entry):
+        return
+    files = []
+    log = ""
+    try:
+        for name in sorted(os.listdir(entry)):
+            path = os.path.join(entry, name)
+            if name == _logname:
+                with open(path, 'rb') as f:
+                    log = f.read().decode('utf-8')
+                continue
+            m = _filename_re.match(name)
+            if not m or int(m.group(1)) >= len(basenames):
+                return
+            files.append((path, basenames[int(m.group(1))] + m.group(2)))
+        if not files:
+            return
+        for path, filename in files:
+            shutil.copyfile(path, filename)
+    except (IOError, OSError, UnicodeError):
+        return
+    # mark this entry as recently used
+    try:
+        os.utime(entry, None)
+    except (IOError, OSError):
+        pass
+    return [filename for path, filename in files], log
+
+
+def store(cachekey, basenames, since=0.0, log=""):
+    """Stores the result files for the basenames under the key.
+    
+    Only files newer than the timestamp since are stored. The log is the
+    text output of LilyPond.
+    
+    """
+    entry = _entry(cachekey)
+    if not entry:
+        return
+    # longest basename first, so that the shortest suffix is stored
+    names = sorted(enumerate(basenames), key=lambda n: len(n[1]), reverse=True)
+    files = []
+    for ext in extensions:
+        for filename in util.files(basenames, ext):
+            try:
+                if os.path.getmtime(filename) < since:
+                    continue
+            except (IOError, OSError):
+                continue
+            for index, basename in names:
+                if filename.startswith(basename):
+                    files.append((filename, "{0}{1}".format(index, filename[len(basename):])))
+                    break
+    if not files:
+        return
+    temp = entry + '.tmp'
+    try:
+        shutil.rmtree(temp, ignore_errors=True)
+        os.mkdir(temp)
+        for filename, name in files:
+            shutil.copyfile(filename, os.path.join(temp, name))
+        with open(os.path.join(temp, _logname), 'wb') as f:
+            f.write(log.encode('utf-8'))
+        shutil.rmtree(entry, ignore_errors=True)
+        os.rename(temp, entry)
+    except (IOError, OSError):
+        shutil.rmtree(temp, ignore_errors=True)
+        return
+    purge()
+
+
+def _size(path):
+    """Returns the total size of the files in the directory path."""
+    size = 0
+    for name in os.listdir(path):
+        try:
+            size += os.path.getsize(os.path.join(path, name))
+        except (IOError, OSError):
+            pass
+    return size
+
+
+def purge():
+    """Removes the least recently used results until maxsize() is met."""
+    d = directory()
+    if not d:
+        return
+    entries = []
+    total = 0
+    for name in os.listdir(d):
+        path = os.path.join(d, name)
+        try:
+            mtime = os.path.getmtime(path)
+            size = _size(path)
+        except (IOError, OSError):
+            continue
+        entries.append((mtime, size, path))
+        total += size
+    if total > maxsize():
+        for mtime, size, path in sorted(entries):
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            if total <= maxsize():
+                break
+
+
+def clear():
+    """Removes all cached results."""
+    d = directory()
+    if d:
+        for name in os.listdir(d):
+            shutil.rmtree(os.path.join(d, name), ignore_errors=True)
+
+
+class Job(job.Job):
+    """A Job that uses the result cache.
+    
+    If the cachekey attribute is set (see prepare()) and results are stored
+    under that key, start() restores the results instead of running the
+    process, and the done() signal is emitted from the event loop.
+    After a successful run the results are stored.
+    
+    """
+    def __init__(self):
+        super(Job, self).__init__()
+        self.cachekey = None
+        self.basenames = []
+        self._restoring = False
+    
+    def start(self):
+        """Restores the results from the cache or starts the process."""
+        result = restore(self.cachekey, self.basenames)
+        if result is None:
+            return super(Job, self).start()
+        files, log = result
+        self.success = None
+        self.error = None
+        self._aborted = False
+        self._history = []
+        self._elapsed = 0.0
+        self._starttime = time.time()
+        self._restoring = True
+        self.startMessage()
+        if log:
+            self.message(log, job.STDERR)
+        self.message(_("Reused {count} file(s) from the engraving cache.").format(
+            count=len(files)), job.SUCCESS)
+        QTimer.singleShot(0, self._restored)
+    
+    def _restored(self):
+        """Called from the event loop after the results have been restored."""
+        if self._restoring:
+            self._finish(True)
+    
+    def _finish(self, success):
+        """Ends restoring the results and emits the done() signal."""
+        self._elapsed = time.time() - self._starttime
+        self._restoring = False
+        self.success = success
+        self.done(success)
+    
+    def isRunning(self):
+        """Returns True if this job is running."""
+        return self._restoring or super(Job, self).isRunning()
+    
+    def abort(self):
+        """Aborts the process.
+        
+        If the results are being restored from the cache, the done() signal is
+        emitted (with success False) immediately.
+        
+        """
+        if self._restoring:
+            self._aborted = True
+            self.abortMessage()
+            self._finish(False)
+        else:
+            super(Job, self).abort()
+    
+    def _bye(self, success):
+        """Stores the results if the process ran successfully."""
+        if success and self.cachekey and not self._aborted:
+            # allow for the (coarse) timestamp resolution of some filesystems
+            store(self.cachekey, self.basenames, self._starttime - 2, self.stderr())
+        super(Job, self)._bye(success)
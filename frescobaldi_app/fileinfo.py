@@ -32,6 +32,7 @@ import ly.document
 import lydocinfo
 import ly.lex
 import filecache
+import tokencache
 import util
 import variables
 
@@ -61,11 +62,16 @@ def _cached(filename):
     try:
         c = _document_cache[filename]
     except KeyError:
+        stat = os.stat(filename)
         with open(filename) as f:
             text = util.decode(f.read())
         c = _document_cache[filename] = _CachedDocument()
         c.variables = v = variables.variables(text)
-        c.document = ly.document.Document(text, v.get("mode"))
+        mode = v.get("mode")
+        c.document = tokencache.load(filename, stat, text, mode)
+        if c.document is None:
+            c.document = ly.document.Document(text, mode)
+            tokencache.save(filename, stat, c.document, mode)
         c.filename = c.document.filename = filename
     return c
 
@@ -32,6 +32,7 @@ from PyQt4.QtGui import (
 
 import ly.lex
 import ly.colorize
+import ly.document
 
 import app
 import cursortools
@@ -98,7 +99,7 @@ class Highlighter(QSyntaxHighlighter, plugin.Plugin):
     """
     def __init__(self, document):
         QSyntaxHighlighter.__init__(self, document)
-        self._fridge = ly.lex.Fridge()
+        self._fridge = ly.lex.Fridge(maxcount=1000)
         app.settingsChanged.connect(self.rehighlight)
         self._initialState = None
         self._highlighting = True
@@ -142,13 +143,17 @@ class Highlighter(QSyntaxHighlighter, plugin.Plugin):
         if not state:
             state = self.initialState()
 
-        # collect and save the tokens
+        # collect and save the tokens, and their hash
         tokens = tuple(state.tokens(text))
-        cursortools.data(self.currentBlock()).tokens = tokens
+        data = cursortools.data(self.currentBlock())
+        data.tokens = tokens
+        data.hash = ly.document.hash_tokens(tokens)
         
         # if blank thus far, keep the highlighter coming back
         # because the parsing state is not yet known; else save the state
         self.setCurrentBlockState(prev - 1 if blank else self._fridge.freeze(state))
+        if self._fridge.full():
+            self._compactFridge()
         
         # apply highlighting if desired
         if self._highlighting:
@@ -159,6 +164,17 @@ class Highlighter(QSyntaxHighlighter, plugin.Plugin):
                 if f:
                     setFormat(f)
         
+    def _compactFridge(self):
+        """Remove frozen states from the fridge that no block uses anymore."""
+        keep = set()
+        block = self.document().firstBlock()
+        while block.isValid():
+            keep.add(block.userState())
+            block = block.next()
+        keep.add(self.currentBlockState())
+        keep.add(self._initialState)
+        self._fridge.compact(keep)
+        
     def setHighlighting(self, enable):
         """Enable or disable highlighting."""
         changed = enable != self._highlighting
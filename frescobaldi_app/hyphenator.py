@@ -5,6 +5,10 @@ This is a Pure Python module to hyphenate text.
 It is inspired by Ruby's Text::Hyphen, but currently reads standard *.dic files,
 that must be installed separately.
 
+If a cache directory is set using setcachedir(), the parsed patterns of every
+*.dic file are stored there in a compiled form, that is read much faster the
+next time the dictionary is loaded.
+
 In the future it's maybe nice if dictionaries could be distributed together with
 this module, in a slightly prepared form, like in Ruby's Text::Hyphen.
 
@@ -17,14 +21,24 @@ License: LGPL. More info: http://python-hyphenator.googlecode.com/
 from __future__ import unicode_literals
 
 import codecs
+import hashlib
+import marshal
+import os
 import re
+import sys
 
 
-__all__ = ["Hyphenator"]
+__all__ = ["Hyphenator", "setcachedir"]
 
 # cache of per-file HyphenationDictionary objects
 _hdcache = {}
 
+# directory to store compiled dictionaries in
+_cachedir = None
+
+# increase this when the format of compiled dictionaries changes
+_FORMAT = 1
+
 # precompile some regular expressions
 parse = re.compile(r'(\d?)(\D?)').findall
 
@@ -35,6 +49,18 @@ _hex_re = re.compile(r'\^{2}([0-9a-f]{2})')
 # replace the matched hex string with the corresponding unicode character
 _hex_repl = lambda matchObj: unichr(int(matchObj.group(1), 16))
 
+def setcachedir(directory):
+    """Sets the directory to store compiled dictionaries in.
+    
+    A compiled dictionary is used instead of the *.dic file as long as the
+    modification time and size of the *.dic file do not change.
+    If directory is None (the default), dictionaries are not compiled.
+    
+    """
+    global _cachedir
+    _cachedir = directory
+
+
 def replace_hex(text):
     """Replaces ^^xx (where xx is a two-digit hexadecimal value) occurrences
     by the corresponding unicode character.
@@ -93,9 +119,28 @@ class HyphenationDictionary(object):
     Parameters:
     filename : filename of hyph_*.dic pattern file to read
     
+    The patterns are stored in a trie, which is a dictionary mapping every
+    pattern and every prefix of a pattern to a node. The node is an empty
+    string for a prefix that is not a pattern itself, and a tuple(start,
+    values) for a pattern. So when looking up patterns at some position in a
+    word, longer substrings only need to be tried as long as they are found.
+    
+    Nodes read from a compiled dictionary are strings, and are converted to
+    a tuple when they are first used.
+    
     """
     def __init__(self, filename):
-        self.patterns = {}
+        self.cache = {}
+        if not self.load(filename):
+            patterns = self.parse(filename)
+            self.trie = dict.fromkeys((pat[:i]
+                for pat in patterns for i in range(1, len(pat))), '')
+            self.trie.update(patterns)
+            self.save(filename)
+    
+    def parse(self, filename):
+        """Reads the *.dic file and returns a dictionary with the patterns."""
+        patterns = {}
         with open(filename) as f:
             # use correct encoding, specified in first line
             for encoding in f.readline().split():
@@ -130,9 +175,79 @@ class HyphenationDictionary(object):
                         start += 1
                     while not values[end-1]:
                         end -= 1
-                    self.patterns[''.join(tag)] = start, values[start:end]
-        self.cache = {}
-        self.maxlen = max(map(len, self.patterns))
+                    patterns[''.join(tag)] = start, values[start:end]
+        return patterns
+    
+    def compiled(self, filename):
+        """Returns the name of the compiled file for filename, or None."""
+        if _cachedir:
+            filename = os.path.abspath(filename)
+            name = hashlib.sha1(filename.encode('utf-8')).hexdigest()
+            return os.path.join(_cachedir, name + '.hyph')
+    
+    def key(self, filename):
+        """Returns the tuple that must match for a compiled file to be valid."""
+        stat = os.stat(filename)
+        return (_FORMAT, sys.version_info[:2], os.path.abspath(filename),
+                stat.st_mtime, stat.st_size)
+    
+    def load(self, filename):
+        """Reads the compiled trie, returns True if that succeeded.
+        
+        The compiled file contains the keys and the nodes of the trie as two
+        newline-separated strings. A node of a pattern is stored as one
+        character for the start offset, followed by the digits of the values.
+        Patterns with nonstandard hyphenation points are stored separately.
+        
+        """
+        compiled = self.compiled(filename)
+        if not compiled:
+            return False
+        try:
+            with open(compiled, 'rb') as f:
+                data = marshal.loads(f.read())
+            key, keys, nodes, alternatives = data
+            if key != self.key(filename):
+                return False
+        except Exception:
+            # invalid, old or unreadable compiled file
+            return False
+        self.trie = dict(zip(keys.split('\n'), nodes.split('\n')))
+        # restore the data of nonstandard hyphenation points
+        for pat, (start, values, data) in alternatives.items():
+            self.trie[pat] = start, tuple(DataInt(v, d) if d else v
+                                          for v, d in zip(values, data))
+        return True
+    
+    def save(self, filename):
+        """Stores the trie in compiled form, if a cache directory is set."""
+        compiled = self.compiled(filename)
+        if not compiled:
+            return
+        keys, nodes, alternatives = [], [], {}
+        for pat, node in self.trie.items():
+            if node:
+                start, values = node
+                data = tuple(getattr(v, 'data', None) for v in values)
+                if any(data):
+                    alternatives[pat] = start, tuple(map(int, values)), data
+                    continue
+                node = chr(48 + start) + ''.join(map(str, values))
+            keys.append(pat)
+            nodes.append(node)
+        data = (self.key(filename), '\n'.join(keys), '\n'.join(nodes), alternatives)
+        try:
+            temp = compiled + '.tmp'
+            with open(temp, 'wb') as f:
+                f.write(marshal.dumps(data))
+            try:
+                os.rename(temp, compiled)
+            except OSError:
+                # Windows does not overwrite an existing file
+                os.remove(compiled)
+                os.rename(temp, compiled)
+        except (IOError, OSError, ValueError):
+            pass
 
     def positions(self, word):
         """Returns a list of positions where the word can be hyphenated.
@@ -160,11 +275,19 @@ class HyphenationDictionary(object):
             pass
         prepWord = '.' + word + '.'
         res = [0] * (len(prepWord) + 1)
+        trie = self.trie
         for i in range(len(prepWord) - 1):
-            for j in range(i + 1, min(i + self.maxlen, len(prepWord)) + 1):
-                p = self.patterns.get(prepWord[i:j])
-                if p:
-                    offset, values = p
+            # walk the trie from this position
+            for j in range(i + 1, len(prepWord) + 1):
+                node = trie.get(prepWord[i:j])
+                if node is None:
+                    break
+                elif node:
+                    if type(node) is not tuple:
+                        # decode a node read from a compiled dictionary
+                        node = trie[prepWord[i:j]] = (
+                            ord(node[0]) - 48, tuple(map(int, node[1:])))
+                    offset, values = node
                     s = slice(i + offset, i + offset + len(values))
                     res[s] = map(max, values, res[s])
 
@@ -252,6 +375,22 @@ class Hyphenator(object):
                 l.insert(p, hyphen)
         return ''.join(l)
 
+    def inserted_words(self, words, hyphen='-'):
+        """Returns a list with inserted(word, hyphen) for every word.
+        
+        Use this to hyphenate a whole block of (lyric) text at once; words
+        that occur more than once are hyphenated only once.
+        
+        """
+        results = {}
+        def hyphenate(word):
+            try:
+                return results[word]
+            except KeyError:
+                result = results[word] = self.inserted(word, hyphen)
+                return result
+        return [hyphenate(word) for word in words]
+
     __call__ = iterate
 
 
@@ -33,6 +33,7 @@ from PyQt4.QtGui import QDialog, QDialogButtonBox, QLabel, QListWidget, QVBoxLay
 
 import app
 import qutil
+import util
 import userguide
 import language_names
 import widgets
@@ -142,6 +143,7 @@ class HyphenDialog(QDialog):
     def hyphenator(self):
         if self.exec_() and self._langs:
             lang, dic = self._langs[self.listWidget.currentRow()][1:]
+            hyphenator.setcachedir(util.cachedir("hyphenation"))
             result = hyphenator.Hyphenator(dic)
             settings().setValue("lastused", lang)
         else:
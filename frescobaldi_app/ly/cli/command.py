@@ -99,7 +99,8 @@ class language(_info_command):
 
 class _edit_command(_command):
     """a command that edits the source file"""
-    pass
+    # whether running the command again on its own output changes nothing
+    idempotent = True
 
 
 class indent(_edit_command):
@@ -144,6 +145,8 @@ class translate(_edit_command):
 
 class transpose(_edit_command):
     """transpose music"""
+    idempotent = False
+    
     def __init__(self, arg):
         result = []
         for pitch, octave in re.findall(r"([a-z]+)([,']*)", arg):
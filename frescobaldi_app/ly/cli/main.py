@@ -19,6 +19,9 @@
 
 """
 The entry point for the 'ly' command.
+
+The ly script should call sys.exit(main()). Importing this module must not
+run the command, because the worker processes of a parallel run import it too.
 """
 
 from __future__ import unicode_literals
@@ -26,9 +29,13 @@ from __future__ import unicode_literals
 import contextlib
 import copy
 import io
+import json
+import multiprocessing
 import os
 import shutil
 import sys
+import tempfile
+import time
 
 import ly.pkginfo
 
@@ -49,6 +56,9 @@ OPTIONS
   -e, --encoding ENC    (input) encoding (default UTF-8)
   --output-encoding ENC output encoding (default to input encoding)
   -d variable=value     set a variable
+  -j, --jobs N          process N files at the same time (default 1)
+  -r, --recursive       process all LilyPond files in directory arguments
+  --stats               print processing times to standard error
   --                    consider the remaining arguments to be file names
 
 ARGUMENTS
@@ -67,6 +77,21 @@ in the output filename, you can set -d replace-pattern=false.
 If you don't specify input or output filenames, standard input is read and
 standard output is written to.
 
+With -j, files are processed in parallel by N worker processes. The output
+and the warnings are still written in the order of the file arguments. Files
+are processed one after another if standard input is read or if the output of
+the files would end up in the same file (other than standard output).
+
+With -r, a directory argument is replaced by all .ly, .ily and .lyi files in
+it and in its subdirectories. If the commands only write files (using -i or
+-o, or a filename argument), the size and modification time of every file that
+was processed successfully are remembered in a '.ly-stamps' file in the
+directory, so a next run with the same commands and options skips the files
+that did not change. This is not done if a command writes to standard output,
+or if the files are changed in-place by a command that would change them again
+(like transpose). Set -d stamps=true or -d stamps=false to always or never
+skip unchanged files.
+
 
 COMMANDS
   
@@ -119,6 +144,8 @@ If there is a default value, it is written between brackets:
   backup-suffix [~]     suffix to use when editing files in-place, if set,
                         backs up the original file before overwriting it
   replace-pattern [true] whether to replace '*' and '?' in the output filename.
+  tree-document [false] whether to keep the document in a balanced tree, which
+                        makes editing very large files faster.
   indent-tabs [false]   whether to use tabs for indent
   indent-width [2]      how many spaces for each indent level (if not using
                         tabs)
@@ -130,6 +157,8 @@ If there is a default value, it is written between brackets:
                         ded.
   number-lines [false]  whether to add line numbers when creating syntax-
                         highlighted HTML.
+  stamps                whether to skip unchanged files in directories given
+                        with -r (default automatic, see above).
 
 These variables influence the output of information commands:
 
@@ -146,6 +175,10 @@ Example using the '*' in the output file name:
   ly "transpose c d" *.ly -o '*-transposed.ly'
   ly highlight *.ly -o 'html/?.html'
 
+Example reformatting a whole project in place, using four processes:
+
+  ly reformat -i -r -j 4 --stats project/
+
 
 """)
 
@@ -181,6 +214,7 @@ class Options(object):
         self.replace_pattern = True
         self.backup_suffix = '~'
         self.with_filename = None
+        self.tree_document = False
         
         self.indent_width = 2
         self.indent_tabs = False
@@ -189,6 +223,13 @@ class Options(object):
         self.inline_style = False
         self.stylesheet = None
         self.number_lines = False
+        
+        self.jobs = 1
+        self.recursive = False
+        self.stamps = None      # None: automatic, see skip_unchanged()
+        self.stats = False
+        
+        self.command = None     # the command argument, set by the parser
     
     def set_variable(self, name, value):
         name = name.replace('-', '_')
@@ -239,6 +280,7 @@ class Output(object):
         
         """
         if not filename or filename == '-':
+            sys.stdout.flush()
             filename, mode = sys.stdout.fileno(), 'w'
         else:
             if filename not in self._seen_filenames:
@@ -248,10 +290,12 @@ class Output(object):
                 mode = 'w'
             else:
                 mode = 'a'
+        # do not close standard output after writing one file
+        closefd = not isinstance(filename, int)
         if encoding in (False, "binary"):
-            f = io.open(filename, mode + 'b')
+            f = io.open(filename, mode + 'b', closefd=closefd)
         else:
-            f = io.open(filename, mode, encoding=encoding)
+            f = io.open(filename, mode, encoding=encoding, closefd=closefd)
         try:
             yield f
         finally:
@@ -262,7 +306,7 @@ def parse_command_line():
     
     options is an Options instance with all the command-line options
     commands is a list of command.command instances
-    files is the list of filename arguments
+    files is the list of filename arguments (directories are not yet expanded)
     
     Also performs error handling and may exit on certain circumstances.
     
@@ -306,6 +350,15 @@ def parse_command_line():
             except ValueError:
                 die("missing '=' in variable set")
             opts.set_variable(name, value)
+        elif arg in ('-j', '--jobs'):
+            jobs = next_arg("missing number of jobs")
+            if not jobs.isdigit() or int(jobs) < 1:
+                die("invalid number of jobs: " + jobs)
+            opts.jobs = int(jobs)
+        elif arg in ('-r', '--recursive'):
+            opts.recursive = True
+        elif arg == '--stats':
+            opts.stats = True
         elif arg in ('-e', '--encoding'):
             opts.encoding = next_arg("missing encoding name")
         elif arg == '--output-encoding':
@@ -316,6 +369,7 @@ def parse_command_line():
             die('unknown option: ' + arg)
         elif not commands:
             commands = parse_command(arg)
+            opts.command = arg
         else:
             files.append(arg)
     from . import command
@@ -323,8 +377,6 @@ def parse_command_line():
         commands.append(command.write())
     if not files:
         files.append('-')
-    if opts.with_filename is None:
-        opts.with_filename = len(files) > 1
     return opts, commands, files
 
 def parse_command(arg):
@@ -351,32 +403,281 @@ def parse_command(arg):
                 die("invalid arguments: " + c)
     return result
 
-def load(filename, encoding, mode):
-    """Load a file, returning a ly.document.Document"""
+def load(filename, encoding, mode, tree=False):
+    """Load a file, returning a ly.document.Document
+    
+    If tree is True, a ly.document.TreeDocument is returned.
+    
+    """
     import ly.document
+    cls = ly.document.TreeDocument if tree else ly.document.Document
     if filename == '-':
-        doc = ly.document.Document.load(sys.stdin.fileno(), encoding, mode)
+        doc = cls.load(sys.stdin.fileno(), encoding, mode)
         doc.filename = '-'
     else:
-        doc = ly.document.Document.load(filename, encoding, mode)
+        doc = cls.load(filename, encoding, mode)
     return doc
 
-def main():
-    opts, commands, files = parse_command_line()
-    import ly.document
-    output = Output()
-    exit_code = 0
+
+def expand(files, opts, commands):
+    """Return a list of (filename, stamps) tuples for the filename arguments.
+    
+    If opts.recursive is True, directories are replaced by the LilyPond files
+    found in them, sorted by name, and stamps is the Stamps instance for the
+    directory (or None if unchanged files can't be skipped). For other files,
+    stamps is None.
+    
+    """
+    result = []
+    skip = skip_unchanged(opts, commands)
     for filename in files:
-        options = copy.deepcopy(opts)
-        try:
-            doc = load(filename, options.encoding, options.mode)
-        except IOError as err:
-            sys.stderr.write('warning: skipping file "{0}":\n  {1}\n'.format(filename, err))
-            exit_code = 1
+        if not opts.recursive or filename == '-' or not os.path.isdir(filename):
+            result.append((filename, None))
             continue
-        cursor = ly.document.Cursor(doc)
-        for c in commands:
-            c.run(options, cursor, output)
-    return exit_code
+        stamps = Stamps(filename, opts) if skip else None
+        found = []
+        for root, dirs, names in os.walk(filename):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            found.extend(os.path.join(root, name) for name in names
+                if os.path.splitext(name)[1] in ('.ly', '.ily', '.lyi'))
+        result.extend((f, stamps) for f in sorted(found))
+    return result
+
+
+def skip_unchanged(opts, commands):
+    """Return True if files that did not change since the last run may be skipped.
+    
+    This is the case if the stamps variable is True, or, if it is not set,
+    when all commands write files and running them again on an in-place
+    edited file would not change it.
+    
+    """
+    if opts.stamps is not None:
+        return bool(opts.stamps)
+    from . import command
+    output = opts.output not in (None, '', '-')
+    for c in commands:
+        if isinstance(c, command._info_command):
+            return False
+        elif isinstance(c, command._edit_command):
+            if opts.in_place and not c.idempotent:
+                return False
+        elif isinstance(c, command.write):
+            if not (c.output or opts.in_place or output):
+                return False
+        elif isinstance(c, command._export_command):
+            if not (c.output or output):
+                return False
+    return True
+
+
+class Stamps(object):
+    """Remembers size and modification time of the files in a directory.
+    
+    The stamps are stored in a '.ly-stamps' file in the directory, for the
+    command and options that were used. Running other commands or using other
+    options starts with an empty set of stamps.
+    
+    """
+    filename = '.ly-stamps'
+    
+    def __init__(self, directory, opts):
+        self.directory = directory
+        self.path = os.path.join(directory, self.filename)
+        self.key = self.make_key(opts)
+        self.stamps = {}
+        self.changed = False
+        try:
+            with open(self.path) as f:
+                d = json.load(f)
+            if d.get('key') == self.key:
+                self.stamps = d['files']
+        except (IOError, OSError, ValueError, KeyError, AttributeError):
+            pass
+    
+    @staticmethod
+    def make_key(opts):
+        """Return a string describing the command and the options that matter."""
+        d = dict(vars(opts))
+        for name in ('jobs', 'recursive', 'stamps', 'stats', 'with_filename'):
+            d.pop(name, None)
+        return repr(sorted(d.items()))
+    
+    def _stat(self, filename):
+        s = os.stat(filename)
+        return [s.st_mtime, s.st_size]
+    
+    def _name(self, filename):
+        return os.path.relpath(filename, self.directory)
+    
+    def unchanged(self, filename):
+        """Return True if the file did not change since it was last stamped."""
+        try:
+            return self.stamps.get(self._name(filename)) == self._stat(filename)
+        except OSError:
+            return False
+    
+    def update(self, filename):
+        """Store the current size and modification time of the file."""
+        try:
+            self.stamps[self._name(filename)] = self._stat(filename)
+        except OSError:
+            return
+        self.changed = True
+    
+    def save(self):
+        """Write the stamps file back if it was changed."""
+        if self.changed:
+            try:
+                with open(self.path, 'w') as f:
+                    json.dump({'key': self.key, 'files': self.stamps}, f)
+            except (IOError, OSError):
+                pass
+            self.changed = False
+
+
+def process(filename, opts, commands, output):
+    """Run the commands on one file, returning the exit code."""
+    import ly.document
+    options = copy.deepcopy(opts)
+    try:
+        doc = load(filename, options.encoding, options.mode,
+                   options.tree_document)
+    except IOError as err:
+        sys.stderr.write('warning: skipping file "{0}":\n  {1}\n'.format(filename, err))
+        return 1
+    cursor = ly.document.Cursor(doc)
+    for c in commands:
+        c.run(options, cursor, output)
+    return 0
+
+@contextlib.contextmanager
+def captured():
+    """Context manager redirecting standard output and error to temporary files.
+    
+    The file descriptors are redirected as well, so output written by opening
+    sys.stdout.fileno() is also captured. Yields a list that contains the
+    captured output and error bytes when the context exits.
+    
+    """
+    result = []
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = os.dup(1), os.dup(2)
+    files = tempfile.TemporaryFile(), tempfile.TemporaryFile()
+    os.dup2(files[0].fileno(), 1)
+    os.dup2(files[1].fileno(), 2)
+    try:
+        yield result
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        for fd, f in zip((1, 2), files):
+            os.dup2(saved[fd - 1], fd)
+            os.close(saved[fd - 1])
+            f.seek(0)
+            result.append(f.read())
+            f.close()
 
-sys.exit(main())
+def process_captured(args):
+    """Run process() in a worker process, capturing output and warnings.
+    
+    args is a (filename, opts, commands) tuple. Returns a tuple
+    (exit_code, elapsed_time, output_bytes, error_bytes).
+    
+    """
+    filename, opts, commands = args
+    start = time.time()
+    exit_code = 1
+    with captured() as result:
+        try:
+            exit_code = process(filename, opts, commands, Output())
+        except Exception:
+            import traceback
+            traceback.print_exc()
+    return (exit_code, time.time() - start) + tuple(result)
+
+def parallel(files, opts, commands):
+    """Return True if the files can be processed by a process pool."""
+    if opts.jobs < 2 or len(files) < 2 or '-' in files:
+        return False
+    if any(getattr(c, 'output', None) for c in commands):
+        return False    # all files write to the same named file
+    if opts.output and not opts.in_place:
+        output = Output()
+        names = [output.get_filename(opts, f) for f in files]
+        if '-' not in names and len(set(names)) < len(names):
+            return False
+    return True
+
+def write_stats(stats, skipped, jobs, wall):
+    """Write processing times to standard error.
+    
+    stats is a list of (filename, exit_code, elapsed) tuples.
+    
+    """
+    w = sys.stderr.write
+    for filename, exit_code, elapsed in stats:
+        w("{0:9.3f}s  {1}{2}\n".format(elapsed, filename,
+            "" if exit_code == 0 else "  (failed)"))
+    for filename in skipped:
+        w("  skipped  {0}\n".format(filename))
+    failed = sum(1 for s in stats if s[1] != 0)
+    w("{0} files processed, {1} skipped, {2} failed; "
+      "{3:.3f}s processing time, {4:.3f}s elapsed, {5} job{6}\n".format(
+        len(stats), len(skipped), failed, sum(s[2] for s in stats), wall,
+        jobs, "" if jobs == 1 else "s"))
+
+def main():
+    """Run the ly command, returning the exit code."""
+    opts, commands, files = parse_command_line()
+    start = time.time()
+    files = expand(files, opts, commands)
+    if opts.with_filename is None:
+        opts.with_filename = len(files) > 1
+    
+    todo, skipped = [], []
+    for filename, stamps in files:
+        if stamps and stamps.unchanged(filename):
+            skipped.append(filename)
+        else:
+            todo.append((filename, stamps))
+    names = [filename for filename, stamps in todo]
+    
+    if parallel(names, opts, commands):
+        jobs = min(opts.jobs, len(names))
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pool = multiprocessing.Pool(jobs)
+        stats = []
+        try:
+            tasks = [(filename, opts, commands) for filename in names]
+            # imap() yields the results in the order of the files
+            results = pool.imap(process_captured, tasks)
+            for filename, (exit_code, elapsed, out, err) in zip(names, results):
+                for stream, data in ((sys.stdout, out), (sys.stderr, err)):
+                    if data:
+                        getattr(stream, 'buffer', stream).write(data)
+                        stream.flush()
+                stats.append((filename, exit_code, elapsed))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        jobs = 1
+        output = Output()
+        stats = []
+        for filename in names:
+            t = time.time()
+            exit_code = process(filename, opts, commands, output)
+            stats.append((filename, exit_code, time.time() - t))
+    
+    for (filename, stamps), (f, exit_code, elapsed) in zip(todo, stats):
+        if stamps and exit_code == 0:
+            stamps.update(filename)
+    for stamps in set(stamps for filename, stamps in files if stamps):
+        stamps.save()
+    
+    if opts.stats:
+        write_stats(stats, skipped, jobs, time.time() - start)
+    return 1 if any(s[1] for s in stats) else 0
@@ -58,7 +58,8 @@ class DocInfo(object):
     
     The tokens are requested from the document using the 
     tokens_with_position() method, so you can always locate them back in the 
-    original document using their pos attribute.
+    original document using their pos attribute. This is done on first
+    access of the tokens or classes attribute.
     
     DocInfo does not update when the document changes, you should just 
     instantiate a new one.
@@ -67,14 +68,40 @@ class DocInfo(object):
     def __init__(self, doc):
         """Initialize with ly.document.DocumentBase instance."""
         self._d = doc
-        blocks = iter(doc)
-        for b in blocks:
-            tokens = doc.tokens_with_position(b)
-            self.tokens = sum(map(
-                lambda b: ((ly.lex.Newline('\n', doc.position(b) - 1),) +
-                           doc.tokens_with_position(b)),
-                blocks), tokens)
-        self.classes = tuple(map(type, self.tokens))
+    
+    @property
+    def tokens(self):
+        """The tuple of all tokens, with Newline tokens between the lines."""
+        try:
+            return self._tokens
+        except AttributeError:
+            doc = self._d
+            blocks = iter(doc)
+            self._tokens = ()
+            for b in blocks:
+                tokens = doc.tokens_with_position(b)
+                self._tokens = sum(map(
+                    lambda b: ((ly.lex.Newline('\n', doc.position(b) - 1),) +
+                               doc.tokens_with_position(b)),
+                    blocks), tokens)
+            return self._tokens
+    
+    @tokens.setter
+    def tokens(self, tokens):
+        self._tokens = tokens
+    
+    @property
+    def classes(self):
+        """The tuple of the classes of all the tokens."""
+        try:
+            return self._classes
+        except AttributeError:
+            self._classes = tuple(map(type, self.tokens))
+            return self._classes
+    
+    @classes.setter
+    def classes(self, classes):
+        self._classes = classes
     
     @property
     def document(self):
@@ -314,10 +341,11 @@ class DocInfo(object):
         """Return an integer hash for all non-whitespace and non-comment tokens.
         
         This hash does not change when only comments or whitespace are changed.
+        It is combined from the token hashes of the blocks, see
+        ly.document.DocumentBase.range_hash().
         
         """
-        return hash(tuple(t for t in self.tokens
-                          if not isinstance(t, (ly.lex.Space, ly.lex.Comment))))
+        return self._d.range_hash()
     
     @_cache
     def complete(self):
@@ -25,7 +25,8 @@ Represents a lilypond source document (the text contents).
 
 The Document implementation keeps the document in a (unicode) text string, 
 but you can inherit from the DocumentBase class to support other 
-representations of the text content.
+representations of the text content. The TreeDocument implementation keeps 
+the lines in a balanced tree, which is faster for very large documents.
 
 Modifying is done inside a context (the with statement), e.g.:
 
@@ -71,11 +72,25 @@ import io
 import sys
 import operator
 import collections
+import random
 import weakref
 
 import ly.lex
 
 
+def hash_tokens(tokens):
+    """Return an integer hash for the tokens, ignoring whitespace and comments.
+    
+    The classes of the tokens are included in the hash. The tokens of a line
+    without anything but whitespace and comments have the hash EMPTY_HASH.
+    
+    """
+    return hash(tuple((type(t), t) for t in tokens
+                      if not isinstance(t, (ly.lex.Space, ly.lex.Comment))))
+
+EMPTY_HASH = hash(())
+
+
 class DocumentBase(object):
     """Abstract base class for Document instances.
     
@@ -288,6 +303,38 @@ class DocumentBase(object):
         """
         pos = self.position(block)
         return tuple(type(t)(t, pos + t.pos) for t in self.tokens(block))
+    
+    def token_hash(self, block):
+        """Return an integer hash for the tokens of the specified block.
+        
+        Whitespace and comments are ignored (see hash_tokens()). Inherit this
+        method if your blocks can cache the hash.
+        
+        """
+        return hash_tokens(self.tokens(block))
+    
+    def range_hash(self, start=0, end=None):
+        """Return an integer hash for the tokens of the blocks from start to end.
+        
+        The token hashes of the blocks containing the start and end positions
+        and the blocks in between are combined. Blocks with only whitespace
+        and comments are skipped, so the hash does not change when only
+        whitespace, comments or empty lines are changed. Comparing the hash of
+        a range before and after a change tells whether anything semantic
+        changed. An empty range has the hash EMPTY_HASH.
+        
+        """
+        block = self.block(start)
+        last = self[len(self) - 1] if end is None else self.block(end)
+        hashes = []
+        while self.isvalid(block):
+            h = self.token_hash(block)
+            if h != EMPTY_HASH:
+                hashes.append(h)
+            if block == last:
+                break
+            block = self.next_block(block)
+        return hash(tuple(hashes))
         
     def initial_state(self):
         """Return the state at the beginning of the document."""
@@ -340,9 +387,10 @@ class Document(DocumentBase):
     
     def __init__(self, text='', mode=None):
         super(Document, self).__init__()
-        self._fridge = ly.lex.Fridge()
+        self._fridge = ly.lex.Fridge(maxcount=1000)
         self._mode = mode
         self._guessed_mode = None
+        self._mode_block = 0
         self.setplaintext(text)
     
     @classmethod
@@ -361,6 +409,10 @@ class Document(DocumentBase):
         """Return the block at the specified index."""
         return self._blocks[index]
     
+    def __iter__(self):
+        """Iter over all blocks."""
+        return iter(self._blocks)
+    
     def setmode(self, mode):
         """Sets the mode to one of the ly.lex modes.
         
@@ -373,7 +425,7 @@ class Document(DocumentBase):
             return
         self._mode, old_mode = mode, self._mode
         if not mode:
-            self._guessed_mode = ly.lex.guessMode(self.plaintext())
+            self._guessed_mode = self._guess_mode()
             if self._guessed_mode == old_mode:
                 return
         elif not old_mode:
@@ -385,8 +437,36 @@ class Document(DocumentBase):
         """Return the mode (lilypond, html, etc). None means automatic mode."""
         return self._mode
     
+    @classmethod
+    def from_tokens(cls, text, mode, blocks):
+        """Construct a document from text that already has been tokenized.
+        
+        The blocks argument is a list containing a (tokens, frozen) tuple for
+        every line of the text, where tokens is the tuple of tokens of that
+        line and frozen the frozen state (see ly.lex.State.freeze()) at the
+        end of that line. This can be used to restore a document from a cache
+        without tokenizing it again.
+        
+        Raises ValueError if the number of blocks does not match the text.
+        
+        """
+        doc = cls('', mode)
+        doc._settext(text)
+        if len(doc) != len(blocks):
+            raise ValueError("number of blocks does not match the text")
+        for b, (tokens, frozen) in zip(doc, blocks):
+            b.tokens = tokens
+            b.state = doc._fridge.store(frozen)
+        return doc
+    
     def setplaintext(self, text):
         """Set the text of the document, sets modified to False."""
+        self._settext(text)
+        self._update_all_tokens()
+        self.modified = False
+    
+    def _settext(self, text):
+        """Set the text of the document, without tokenizing it."""
         text = text.replace('\r', '')
         lines = text.split('\n')
         self._blocks = [_Block(t, n) for n, t in enumerate(lines)]
@@ -395,15 +475,56 @@ class Document(DocumentBase):
             b.position = pos
             pos += len(b.text) + 1
         if not self._mode:
-            self._guessed_mode = ly.lex.guessMode(text)
-        self._update_all_tokens()
-        self.modified = False
+            self._guessed_mode = self._guess_mode()
+    
+    def _guess_mode(self):
+        """Guess the mode and remember the first non-blank block.
+        
+        Edits in or before that block may change the guessed mode, see
+        apply_changes().
+        
+        """
+        for i, b in enumerate(self):
+            if not self.isblank(b):
+                self._mode_block = i
+                break
+        else:
+            self._mode_block = len(self)
+        return ly.lex.guessMode(self.plaintext())
+    
+    def _affects_mode(self, block, start, end, text):
+        """Return True if replacing start:end with text could change the mode.
+        
+        The block is the block containing the start position. This method is
+        used by apply_changes(), before the change is applied.
+        
+        """
+        if self.index(block) <= self._mode_block:
+            return True
+        e = None if end is None else self.block(end)
+        lines = []
+        for b in self.blocks_forward(block):
+            lines.append(self.text(b))
+            if b == e:
+                break
+        old = '\n'.join(lines)
+        pos = self.position(block)
+        new = old[:start - pos] + text
+        if end is not None:
+            new += old[end - pos:]
+        return ly.lex.containsModeMarker(old) or ly.lex.containsModeMarker(new)
     
     def _update_all_tokens(self):
         state = self.initial_state()
-        for b in self._blocks:
+        for b in self:
             b.tokens = tuple(state.tokens(b.text))
             b.state = self._fridge.freeze(state)
+        self._compact_fridge()
+    
+    def _compact_fridge(self):
+        """Remove frozen states from the fridge that no block uses anymore."""
+        if self._fridge.full():
+            self._fridge.compact(b.state for b in self)
     
     def initial_state(self):
         """Return the state at the beginning of the document."""
@@ -447,8 +568,13 @@ class Document(DocumentBase):
         return block.tokens
     
     def apply_changes(self):
+        changed = set()
+        guess = False
         for start, end, text in self._changes_list:
             s = self.block(start)
+            # only guess the mode again if this change could alter it
+            if not self._mode and not guess:
+                guess = self._affects_mode(s, start, end, text)
             # first remove the old contents
             if end is None:
                 # all text to the end should be removed
@@ -458,15 +584,22 @@ class Document(DocumentBase):
                 # remove til end position
                 e = self.block(end)
                 s.text = s.text[:start - s.position] + e.text[end - e.position:]
+                if e is not s:
+                    # the block after e was parsed starting with e's state
+                    s.state = e.state
                 del self._blocks[s.index+1:e.index+1]
+                changed.discard(e)
             # now insert the new stuff
             if text:
                 lines = text.split('\n')
                 lines[-1] += s.text[start - s.position:]
                 s.text = s.text[:start - s.position] + lines[0]
-                self._blocks[s.index+1:s.index+1] = map(_Block, lines[1:])
+                new = [_Block(t) for t in lines[1:]]
+                self._blocks[s.index+1:s.index+1] = new
+                changed.update(new)
             # make sure this line gets reparsed
             s.tokens = None
+            changed.add(s)
         
         # update the position of all the new blocks
         pos = s.position
@@ -475,27 +608,49 @@ class Document(DocumentBase):
             b.position = pos
             pos += len(b.text) + 1
         
+        self._finish_changes(s, changed, guess)
+    
+    def _finish_changes(self, block, changed, guess):
+        """Called by apply_changes() when the text has been changed.
+        
+        The block is the first changed block, the changed set contains all
+        changed blocks and guess is True if the mode should be guessed again.
+        
+        """
         self.modified = True
         
         # if the initial state has changed, reparse everything
-        if not self._mode:
-            mode = ly.lex.guessMode(self.plaintext())
+        if guess:
+            mode = self._guess_mode()
             if mode != self._guessed_mode:
                 self._guessed_mode = mode
                 self._update_all_tokens()
                 return
         
-        # update the tokens starting at block s
-        state = self.state(s)
+        self._update_tokens(block, changed)
+    
+    def _update_tokens(self, block, changed):
+        """Update the tokens starting at the block.
+        
+        The changed set contains the blocks that need to be parsed again, the
+        first of them is block. Blocks following a changed block are also
+        parsed again, as long as their starting state is different from before.
+        
+        """
+        state = self.state(block)
         reparse = False
-        for block in self._blocks[s.index:]:
+        for block in self.blocks_forward(block):
             if reparse or block.tokens is None:
+                changed.discard(block)
                 block.tokens = tuple(state.tokens(block.text))
                 frozen = self._fridge.freeze(state)
                 reparse = block.state != frozen
                 block.state = frozen
+            elif not changed:
+                break
             else:
                 state = self._fridge.thaw(block.state)
+        self._compact_fridge()
 
 
 class _Block(object):
@@ -514,6 +669,263 @@ class _Block(object):
         self.index = index
 
 
+class TreeDocument(Document):
+    """A Document that keeps its blocks in a balanced tree.
+    
+    The Document implementation keeps the blocks in a list, and after every
+    change, the index and position of all following blocks are updated. That
+    becomes slow for very large documents.
+    
+    This implementation stores the blocks in a randomized balanced binary tree
+    (a treap) where every node knows the number of blocks and the number of
+    characters in its subtree. Finding a block by position or index, computing
+    the position or index of a block, and inserting or removing lines all take
+    O(log n) time.
+    
+    Apart from that, it behaves exactly the same as Document, and can be used
+    wherever a Document is used.
+    
+    """
+    def __len__(self):
+        """Return the number of blocks"""
+        return _count(self._root)
+    
+    def __getitem__(self, index):
+        """Return the block at the specified index."""
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("block index out of range")
+        node = self._root
+        while True:
+            left = _count(node.left)
+            if index < left:
+                node = node.left
+            elif index == left:
+                return node
+            else:
+                index -= left + 1
+                node = node.right
+    
+    def __iter__(self):
+        """Iter over all blocks."""
+        node = self._root
+        while node and node.left:
+            node = node.left
+        return self.blocks_forward(node)
+    
+    def _settext(self, text):
+        """Set the text of the document, without tokenizing it."""
+        text = text.replace('\r', '')
+        self._root = _build([_TreeBlock(t) for t in text.split('\n')])
+        if not self._mode:
+            self._guessed_mode = self._guess_mode()
+    
+    def block(self, position):
+        """Return the text block at the specified character position."""
+        if 0 <= position < self._root.length:
+            node = self._root
+            while True:
+                left = _length(node.left)
+                if position < left:
+                    node = node.left
+                    continue
+                position -= left + len(node.text) + 1
+                if position < 0:
+                    return node
+                node = node.right
+    
+    def index(self, block):
+        """Return the linenumber of the block (starting with 0)."""
+        index = _count(block.left)
+        while block.parent:
+            if block is block.parent.right:
+                index += _count(block.parent.left) + 1
+            block = block.parent
+        return index
+    
+    def position(self, block):
+        """Return the position of the specified block."""
+        pos = _length(block.left)
+        while block.parent:
+            if block is block.parent.right:
+                pos += _length(block.parent.left) + len(block.parent.text) + 1
+            block = block.parent
+        return pos
+    
+    def next_block(self, block):
+        """Return the next block, which may be invalid."""
+        if block.right:
+            block = block.right
+            while block.left:
+                block = block.left
+            return block
+        while block.parent and block is block.parent.right:
+            block = block.parent
+        return block.parent
+    
+    def previous_block(self, block):
+        """Return the previous block, which may be invalid."""
+        if block.left:
+            block = block.left
+            while block.right:
+                block = block.right
+            return block
+        while block.parent and block is block.parent.left:
+            block = block.parent
+        return block.parent
+    
+    def apply_changes(self):
+        changed = set()
+        guess = False
+        for start, end, text in self._changes_list:
+            s = self.block(start)
+            # only guess the mode again if this change could alter it
+            if not self._mode and not guess:
+                guess = self._affects_mode(s, start, end, text)
+            index = self.index(s)
+            head = s.text[:start - self.position(s)]
+            if end is None:
+                # all text to the end should be removed
+                tail = ""
+                last = len(self)
+            else:
+                # remove til end position
+                e = self.block(end)
+                tail = e.text[end - self.position(e):]
+                last = self.index(e) + 1
+                if e is not s:
+                    # the block after e was parsed starting with e's state
+                    s.state = e.state
+                changed.discard(e)
+            lines = (head + text + tail).split('\n')
+            s.text = lines[0]
+            _update_path(s)
+            new = [_TreeBlock(t) for t in lines[1:]]
+            self._root = _splice(self._root, index + 1, last, new)
+            changed.update(new)
+            # make sure this line gets reparsed
+            s.tokens = None
+            changed.add(s)
+        self._finish_changes(s, changed, guess)
+
+
+class _TreeBlock(object):
+    """A line of text, and a node in the tree of a TreeDocument."""
+    
+    __slots__ = (
+        'text', 'state', 'tokens',
+        'parent', 'left', 'right', 'priority', 'count', 'length',
+    )
+    
+    def __init__(self, text=""):
+        self.text = text
+        self.state = None
+        self.tokens = None
+        self.parent = self.left = self.right = None
+        self.priority = random.random()
+        self.count = 1
+        self.length = len(text) + 1
+
+
+def _count(node):
+    """Return the number of blocks in the subtree."""
+    return node.count if node else 0
+
+
+def _length(node):
+    """Return the number of characters (including newlines) in the subtree."""
+    return node.length if node else 0
+
+
+def _update(node):
+    """Recompute the count and length of the node from its children."""
+    node.count = _count(node.left) + _count(node.right) + 1
+    node.length = _length(node.left) + _length(node.right) + len(node.text) + 1
+
+
+def _update_path(node):
+    """Recompute the count and length of the node and all its ancestors."""
+    while node:
+        _update(node)
+        node = node.parent
+
+
+def _split(node, index):
+    """Split the tree in two trees, the first one with index blocks."""
+    if not node:
+        return None, None
+    if _count(node.left) < index:
+        left, right = _split(node.right, index - _count(node.left) - 1)
+        node.right = left
+        if left:
+            left.parent = node
+        _update(node)
+        return node, right
+    else:
+        left, right = _split(node.left, index)
+        node.left = right
+        if right:
+            right.parent = node
+        _update(node)
+        return left, node
+
+
+def _merge(left, right):
+    """Merge two trees, all blocks of left coming before the blocks of right."""
+    if not left:
+        return right
+    if not right:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        left.right.parent = left
+        _update(left)
+        return left
+    else:
+        right.left = _merge(left, right.left)
+        right.left.parent = right
+        _update(right)
+        return right
+
+
+def _build(nodes):
+    """Build a tree from the list of nodes in O(n) time, return the root."""
+    stack = []
+    for node in nodes:
+        last = None
+        while stack and stack[-1].priority < node.priority:
+            last = stack.pop()
+            _update(last)
+        node.left = last
+        if last:
+            last.parent = node
+        if stack:
+            stack[-1].right = node
+            node.parent = stack[-1]
+        stack.append(node)
+    while stack:
+        _update(stack.pop())
+    if nodes:
+        root = node
+        while root.parent:
+            root = root.parent
+        return root
+
+
+def _splice(root, start, end, nodes):
+    """Replace the blocks from start to end with the list of nodes.
+    
+    Returns the new root.
+    
+    """
+    left, rest = _split(root, start)
+    middle, right = _split(rest, end - start)
+    root = _merge(_merge(left, _build(nodes)), right)
+    root.parent = None
+    return root
+
+
 class Cursor(object):
     """Defines a certain range (selection) in a Document.
     
@@ -88,14 +88,14 @@ import re
 
 import slexer
 from ._token import *
-from ._mode import extensions, modes, guessMode
+from ._mode import extensions, modes, guessMode, containsModeMarker
 
 
 __all__ = [
     'State',
     'Parser', 'FallthroughParser',
     'Fridge',
-    'extensions', 'modes', 'guessMode',
+    'extensions', 'modes', 'guessMode', 'containsModeMarker',
     'state', 'guessState',
     'Token',
     'Unparsed',
@@ -157,8 +157,8 @@ class State(slexer.State):
 
 
 class Fridge(slexer.Fridge):
-    def __init__(self, stateClass = State):
-        super(Fridge, self).__init__(stateClass)
+    def __init__(self, stateClass = State, maxcount = None):
+        super(Fridge, self).__init__(stateClass, maxcount)
 
 
 def state(mode):
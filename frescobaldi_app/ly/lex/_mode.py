@@ -43,7 +43,7 @@ tokenize module.
 
 from __future__ import unicode_literals
 
-__all__ = ['modes', 'guessMode']
+__all__ = ['modes', 'guessMode', 'containsModeMarker']
 
 
 def _modes():
@@ -114,6 +114,25 @@ def guessMode(text):
     return "lilypond"
 
 
+# strings guessMode() searches for in the whole text, not only at the start
+_markers = (
+    '\\version', '\\relative', '\\score',
+    '\\documentclass', '\\begin{document}',
+    'DOCTYPE book', '<programlisting',
+)
+
+
+def containsModeMarker(text):
+    """Returns True if text contains a string guessMode() looks for.
+    
+    If an edit does not touch the start of a text and neither the old nor the
+    new text of the modified lines contain such a string, the result of
+    guessMode() can't be changed by that edit.
+    
+    """
+    return any(m in text for m in _markers)
+
+
 
 # dictionary mapping mode name to a default extension for a file of that mode.
 extensions = {
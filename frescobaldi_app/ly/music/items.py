@@ -51,6 +51,8 @@ from ly import lex
 from ly.lex import lilypond
 from ly.lex import scheme
 
+from . import event
+
 
 class Item(node.WeakNode):
     """Represents any item in the music of a document.
@@ -73,6 +75,17 @@ class Item(node.WeakNode):
         s = ' ' + repr(self.token[:]) if self.token else ''
         return '<{0}{1}>'.format(self.__class__.__name__, s)
     
+    def _set_parent(self, node):
+        """(Internal) Set the parent; forgets the cached lengths of the old
+        and the new parent and their ancestors.
+        
+        """
+        for n in (self.parent(), node):
+            while n is not None:
+                n.__dict__.pop('_lengths', None)
+                n = n.parent()
+        super(Item, self)._set_parent(node)
+    
     def end_position(self):
         """Return the end position of this node."""
         def ends():
@@ -215,12 +228,98 @@ class Document(Item):
         self.include_node = None
         self.include_path = []
         self.relative_includes = True
+        self._starts = []
+        for start, item in self._read():
+            self._starts.append(start)
+            self.append(item)
+    
+    def _read(self, position=0, start=None, stop=None):
+        """(Internal) Read toplevel items from the document, starting at position.
+        
+        Yields two-tuples (start, item). The start tuple contains the first
+        token of the item, the reader state (language and previous duration)
+        before the item and the frozen lexer state after the first token. It
+        is used by update() to find the point where reading can stop.
+        
+        If start is given, it is the start tuple of the item at position, and
+        is used to restore the reader state. If stop is given, it is called
+        with every start tuple, and reading stops if it returns True.
+        
+        """
         import ly.document
-        c = ly.document.Cursor(doc)
+        from .read import Reader, skip
+        c = ly.document.Cursor(self.document, position)
         s = ly.document.Source(c, True, tokens_with_position=True)
-        from .read import Reader
         r = Reader(s)
-        self.extend(r.read())
+        if start:
+            r.language, r.prev_duration = start[1:3]
+        for t in skip(s):
+            start = (t, r.language, r.prev_duration, s.state.freeze())
+            if stop and stop(start):
+                return
+            item = r.read_item(t, s)
+            if item:
+                yield start, item
+    
+    def update(self, position, removed, added):
+        """Update the tree after the text of the document has changed.
+        
+        The text was changed at position, where removed characters were
+        replaced with added characters. Only the toplevel items that are
+        touched by the change are read again; the items after it are kept and
+        their positions are adjusted.
+        
+        """
+        starts = self._starts
+        delta = added - removed
+        # the last item starting before the change may extend into it
+        lo, hi = 0, len(starts)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if starts[mid][0].pos < position:
+                lo = mid + 1
+            else:
+                hi = mid
+        first = max(0, lo - 1)
+        before = lo
+        # the first item that could be kept: it must start after the change
+        end = position + removed
+        while lo < len(starts) and starts[lo][0].pos < end:
+            lo += 1
+        end += delta
+        keep = [lo, False]
+        
+        def stop(start):
+            t = start[0]
+            i = keep[0]
+            while i < len(starts) and starts[i][0].pos + delta < t.pos:
+                i += 1
+            keep[0] = i
+            if i < len(starts) and t.pos >= end:
+                old = starts[i]
+                # same token, reader state and lexer state: the rest of
+                # the document is read the same way, keep the old items
+                keep[1] = (old[0].pos + delta == t.pos and type(old[0]) is type(t)
+                           and old[0] == t and old[1:] == start[1:])
+                return keep[1]
+        
+        if before:
+            items = self._read(starts[first][0].pos, starts[first], stop)
+        else:
+            items = self._read(stop=stop)
+        new_items, new_starts = [], []
+        for start, item in items:
+            new_items.append(item)
+            new_starts.append(start)
+        lo = keep[0] if keep[1] else len(starts)
+        if delta:
+            seen = set()
+            for item in self[lo:]:
+                _shift(item, delta, seen)
+            for start in starts[lo:]:
+                _shift_token(start[0], delta, seen)
+        self[first:lo] = new_items
+        starts[first:lo] = new_starts
     
     def node(self, position, depth=-1):
         """Return the node at or just before the specified position."""
@@ -299,15 +398,7 @@ class Document(Item):
         """
         events = self.music_events_til_position(position)
         if events:
-            from . import event
-            e = event.Events()
-            time = 0
-            scaling = 1
-            for parent, nodes, s in events:
-                scaling *= s
-                for n in nodes:
-                    time = e.traverse(n, time, scaling)
-            return time
+            return _time(events)
     
     def time_length(self, start, end):
         """Return the length of the music between start and end positions.
@@ -315,16 +406,6 @@ class Document(Item):
         Returns None if start and end are not in the same expression.
         
         """
-        def mk_list(evts):
-            """Make a flat list of all the events."""
-            l = []
-            scaling = 1
-            for p, nodes, s in evts:
-                scaling *= s
-                for n in nodes:
-                    l.append((n, scaling))
-            return l
-        
         if start > end:
             start, end = end, start
         
@@ -333,26 +414,7 @@ class Document(Item):
             end_evts = self.music_events_til_position(end)
             if end_evts and start_evts[0][0] is end_evts[0][0]:
                 # yes, we have the same toplevel expression.
-                start_evts = mk_list(start_evts)
-                end_evts = mk_list(end_evts)
-                from . import event
-                e = event.Events()
-                time = 0
-                i = 0
-                # traverse the common events only once
-                for i, ((evt, s), (end_evt, end_s)) in enumerate(zip(start_evts, end_evts)):
-                    if evt is end_evt:
-                        time = e.traverse(evt, time, s)
-                    else:
-                        break
-                end_time = time
-                # handle the remaining events for the start position
-                for evt, s in start_evts[i::]:
-                    time = e.traverse(evt, time, s)
-                # handle the remaining events for the end position
-                for evt, s in end_evts[i::]:
-                    end_time = e.traverse(evt, end_time, s)
-                return end_time - time
+                return _time(end_evts) - _time(start_evts)
         
     def substitute_for_node(self, node):
         """Returns a node that replaces the specified node (e.g. in music).
@@ -419,12 +481,142 @@ class Document(Item):
         """Return the music Document for the specified filename.
         
         This implementation loads a ly.document.Document using utf-8 
-        encoding. Inherit from this class to implement other loading 
-        mechanisms or caching.
+        encoding. (If our document is an instance of a ly.document.Document
+        subclass, such as TreeDocument, that class is used instead.)
+        Inherit from this class to implement other loading mechanisms or
+        caching.
         
         """
         import ly.document
-        return type(self)(ly.document.Document.load(filename))
+        cls = type(self.document)
+        if not issubclass(cls, ly.document.Document):
+            cls = ly.document.Document
+        return type(self)(cls.load(filename))
+
+
+def _shift(item, delta, seen):
+    """(Internal) Move the item and all its tokens and child items.
+    
+    The ids of the moved items and tokens are added to the seen set, so that
+    they are moved only once.
+    
+    """
+    nodes = [item]
+    while nodes:
+        n = nodes.pop()
+        if id(n) in seen:
+            continue
+        seen.add(id(n))
+        # a Duration without tokens always has position 0
+        if n.tokens or not isinstance(n, Duration):
+            n.position += delta
+        nodes.extend(n)
+        for v in vars(n).values():
+            if isinstance(v, lex.Token):
+                _shift_token(v, delta, seen)
+            elif isinstance(v, (tuple, list)):
+                for v in v:
+                    if isinstance(v, lex.Token):
+                        _shift_token(v, delta, seen)
+                    elif isinstance(v, Item) and not isinstance(v, Document):
+                        nodes.append(v)
+            elif isinstance(v, Item) and not isinstance(v, Document):
+                nodes.append(v)
+
+
+def _shift_token(token, delta, seen):
+    """(Internal) Move the token delta characters, if not yet seen."""
+    if id(token) not in seen:
+        seen.add(id(token))
+        token.pos += delta
+        token.end += delta
+
+
+class _LengthEvents(event.Events):
+    """(Internal) Events that computes the time using the cached lengths.
+    
+    Because the length of a node does not depend on the time it starts, and
+    scales with the scaling, traversing a node just adds its length.
+    
+    """
+    def traverse(self, node, time, scaling):
+        return time + scaling * _length(node)
+
+
+# the nodes whose lengths are being computed, innermost last, each in a list
+# with a flag telling whether the result may be cached
+_computing = []
+
+
+def _lengths(node):
+    """(Internal) Return a two-tuple (length, prefix) for a music node with children.
+    
+    The length is the musical duration of the node, and prefix is a list
+    with, for every child index, the summed lengths of the children before it
+    (and at the end, the summed lengths of all children). The tuple is cached
+    in the node until a child is added or removed somewhere below it.
+    
+    Lengths that depend on the value of a variable are not cached, because the
+    assignment may change without touching the node. A variable referring to
+    music that contains the reference itself gets length 0.
+    
+    """
+    try:
+        return node.__dict__['_lengths']
+    except KeyError:
+        pass
+    if any(n is node for n, cache in _computing):
+        return 0, [0] * (len(node) + 1)
+    frame = [node, True]
+    _computing.append(frame)
+    try:
+        prefix = [0]
+        for n in node:
+            prefix.append(prefix[-1] + _length(n))
+        length = node.events(_LengthEvents(), 0, 1)
+    finally:
+        _computing.pop()
+    result = length, prefix
+    if frame[1]:
+        node._lengths = result
+    return result
+
+
+def _length(node):
+    """(Internal) Return the musical duration of the node, as computed by a
+    default event.Events instance (i.e. not unfolding volta repeats).
+    
+    """
+    if isinstance(node, UserCommand):
+        for frame in _computing:
+            frame[1] = False
+    if len(node) and isinstance(node, Music):
+        return _lengths(node)[0]
+    return node.events(_LengthEvents(), 0, 1)
+
+
+def _time(events):
+    """(Internal) Return the time of the events from music_events_til_position().
+    
+    Uses the prefix index of the parent node when the nodes are the first
+    children of it, which is the case for the nodes returned by
+    Music.preceding().
+    
+    """
+    time = 0
+    scaling = 1
+    for parent, nodes, s in events:
+        scaling *= s
+        if not nodes:
+            continue
+        i = len(nodes)
+        if (isinstance(parent, Music) and len(parent) >= i
+            and nodes[0] is parent[0] and nodes[-1] is parent[i-1]):
+            length = _lengths(parent)[1][i]
+        else:
+            length = sum(_length(n) for n in nodes)
+        time += scaling * length
+    return time
 
 
 class Token(Item):
@@ -508,8 +700,7 @@ class Music(Container):
     
     def length(self):
         """Return the musical duration."""
-        from . import event
-        return event.Events().read(self)
+        return _length(self)
     
     def preceding(self, node=None):
         """Return a two-tuple (nodes, scaling).
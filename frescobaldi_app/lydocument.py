@@ -198,6 +198,13 @@ class Document(ly.document.DocumentBase):
     def tokens(self, block):
         """Return the tuple of tokens of the specified block."""
         return tokeniter.tokens(block)
+    
+    def token_hash(self, block):
+        """Return the hash of the tokens of the block, cached by the highlighter."""
+        try:
+            return block.userData().hash
+        except AttributeError:
+            return super(Document, self).token_hash(block)
         
     def initial_state(self):
         """Return the state at the beginning of the document."""
@@ -90,9 +90,9 @@ class Lyrics(plugin.MainWindowPlugin):
             import hyphendialog
             h = hyphendialog.HyphenDialog(self.mainwindow()).hyphenator()
             if h:
+                hyph_words = h.inserted_words((word for start, end, word in found), ' -- ')
                 with c.document as d:
-                    for start, end, word in found:
-                        hyph_word = h.inserted(word, ' -- ')
+                    for (start, end, word), hyph_word in zip(found, hyph_words):
                         if word != hyph_word:
                             d[start:end] = hyph_word
             
@@ -258,8 +258,11 @@ def menu_lilypond(mainwindow):
     m.addSeparator()
     m.addAction(ac.engrave_preview)
     m.addAction(ac.engrave_publish)
+    m.addAction(ac.engrave_score)
     m.addAction(ac.engrave_debug)
     m.addAction(ac.engrave_custom)
+    m.addAction(ac.engrave_all_documents)
+    m.addAction(ac.engrave_folder)
     m.addAction(ac.engrave_abort)
     m.addSeparator()
     m.addMenu(menu_lilypond_generated_files(mainwindow))
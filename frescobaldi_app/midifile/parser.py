@@ -27,13 +27,20 @@ its tracks.
 A basic event factory returns the MIDI events as simple named tuples,
 but you can subclass the event factory for more sophisticated behaviour.
 
-Runs with Python 2.6, 2.7.
+The parse functions accept bytes strings as well as memoryview objects, so
+a MIDI file can be parsed from a memory-mapped file without copying the data
+(see map_file()). The merge_time_events() functions merge the tracks in time
+order while they are parsed.
+
+Runs with Python 2.6, 2.7 (memoryview and mmap require 2.7).
 For Python 3 you can remove the ord() calls.
 
 """
 
 from __future__ import unicode_literals
 
+import heapq
+import mmap
 import struct
 
 from . import event
@@ -41,17 +48,54 @@ from . import event
 unpack_midi_header = struct.Struct(b'>hhh').unpack
 unpack_int = struct.Struct(b'>i').unpack
 
+try:
+    memoryview
+except NameError:
+    # Python 2.6
+    memoryview = None
+
+
+def map_file(filename):
+    """Returns the contents of the file without reading it in memory.
+    
+    The file is memory-mapped and a memoryview of the map is returned, which
+    can be given to parse_midi_data(). The tracks it returns are then
+    memoryviews as well, pointing into the same map.
+    
+    If the file can't be mapped (e.g. because it is empty), it is read.
+    
+    """
+    with open(filename, 'rb') as f:
+        try:
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, EnvironmentError):
+            return f.read()
+    try:
+        return memoryview(m)
+    except TypeError:
+        # the mmap of Python 2 does not support the new buffer interface,
+        # slicing it copies only the sliced data
+        return m
+
+
+def tobytes(s):
+    """Returns s as a bytes string; s may be a memoryview."""
+    if memoryview and isinstance(s, memoryview):
+        return s.tobytes()
+    return s
+
 
 def get_chunks(s):
-    """Splits a MIDI file bytes string into chunks.
+    """Splits a MIDI file bytes string (or memoryview) into chunks.
     
-    Yields (b'Name', b'data') tuples.
+    Yields (b'Name', data) tuples. If s is a memoryview, the data is
+    a memoryview as well, so no data is copied.
     
     """
     pos = 0
     while pos < len(s):
-        name = s[pos:pos+4]
-        size, = unpack_int(s[pos+4:pos+8])
+        name = tobytes(s[pos:pos+4])
+        size, = unpack_int(tobytes(s[pos+4:pos+8]))
         yield name, s[pos+8:pos+8+size]
         pos += size + 8
 
@@ -60,7 +104,8 @@ def parse_midi_data(s):
     """Parses MIDI file data from the bytes string s.
     
     Returns a three tuple (format_type, time_division, tracks).
-    Every track is an unparsed bytes string.
+    Every track is an unparsed bytes string (or a memoryview if s is a
+    memoryview).
     
     May raise ValueError or IndexError in case of invalid MIDI data.
     
@@ -68,7 +113,7 @@ def parse_midi_data(s):
     chunks = get_chunks(s)
     for name, data in chunks:
         if name == b'MThd':
-            fmt, ntracks, division = unpack_midi_header(data[:6])
+            fmt, ntracks, division = unpack_midi_header(tobytes(data[:6]))
             tracks = [data for name, data in chunks if name == b'MTrk']
             return fmt, division, tracks
         break
@@ -135,13 +180,13 @@ def parse_midi_events(s, factory=None):
                 # meta event
                 meta_type = ord(s[pos])
                 meta_size, pos = read_var_len(s, pos+1)
-                meta_data = s[pos:pos+meta_size]
+                meta_data = tobytes(s[pos:pos+meta_size])
                 pos += meta_size
                 ev = factory.meta_event(meta_type, meta_data)
             else:
                 # some sort of sysex
                 sysex_size, pos = read_var_len(s, pos)
-                sysex_data = s[pos:pos+sysex_size]
+                sysex_data = tobytes(s[pos:pos+sysex_size])
                 pos += sysex_size
                 ev = factory.sysex_event(status, sysex_data)
         elif ev_type == 0x0E:
@@ -200,6 +245,49 @@ def time_events_grouped(track, time=0):
         yield time, evs
 
 
+def merge_time_events(tracks, factory=None):
+    """Yields three-tuples (time, track_number, event) for all tracks.
+    
+    The tracks (unparsed bytes strings or memoryviews) are parsed lazily,
+    while the events are merged in time order. Events on the same time are
+    yielded in track order. The factory is given to parse_midi_events().
+    
+    """
+    heap = []
+    for n, track in enumerate(tracks):
+        events = time_events(parse_midi_events(track, factory))
+        for time, ev in events:
+            heap.append((time, n, ev, events))
+            break
+    heapq.heapify(heap)
+    while heap:
+        time, n, ev, events = heap[0]
+        yield time, n, ev
+        for time, ev in events:
+            heapq.heapreplace(heap, (time, n, ev, events))
+            break
+        else:
+            heapq.heappop(heap)
+
+
+def merge_time_events_grouped(tracks, factory=None):
+    """Yields two-tuples (time, events_dict) for all tracks, in time order.
+    
+    Every events_dict maps the track number to the list of the events
+    happening on that time in that track. See merge_time_events().
+    
+    """
+    d = {}
+    for time, n, ev in merge_time_events(tracks, factory):
+        if d and time != last:
+            yield last, d
+            d = {}
+        last = time
+        d.setdefault(n, []).append(ev)
+    if d:
+        yield last, d
+
+
 
 if __name__ == '__main__':
     """Test specified MIDI files."""
@@ -42,6 +42,7 @@ class Player(object):
     def __init__(self):
         self._song = None
         self._events = []
+        self._source = None
         self._position = 0
         self._offset = 0
         self._sync_time = 0
@@ -62,13 +63,17 @@ class Player(object):
         """Returns the currently set Output instance."""
         return self._output
         
-    def load(self, filename, time=1000, beat=True):
+    def load(self, filename, time=1000, beat=True, stream=False):
         """Convenience function, loads a MIDI file.
         
-        See set_song() for the other arguments.
+        If stream is True, the file is loaded as a SongStream, see
+        set_stream(). See set_song() for the other arguments.
         
         """
-        self.set_song(song.load(filename), time, beat)
+        if stream:
+            self.set_stream(song.stream(filename), time, beat)
+        else:
+            self.set_song(song.load(filename), time, beat)
     
     def set_song(self, song, time=1000, beat=True):
         """Loads the specified Song (see song.py).
@@ -84,13 +89,34 @@ class Player(object):
             self.timer_stop_playing()
         self._song = song
         self._events = make_event_list(song, time, beat)
+        self._source = None
+        self._position = 0
+        self._offset = 0
+        if playing:
+            self.timer_start_playing()
+    
+    def set_stream(self, stream, time=1000, beat=True):
+        """Loads the specified SongStream (see song.py).
+        
+        The events are read from the stream while playing, so playback can
+        start before the whole MIDI file has been parsed. Until the stream has
+        been read completely, total_time() returns the time of the last event
+        read so far. See set_song() for the other arguments.
+        
+        """
+        playing = self._playing
+        if playing:
+            self.timer_stop_playing()
+        self._song = stream
+        self._events = []
+        self._source = iter_stream_events(stream, time, beat)
         self._position = 0
         self._offset = 0
         if playing:
             self.timer_start_playing()
     
     def song(self):
-        """Returns the current Song."""
+        """Returns the current Song (or SongStream)."""
         return self._song
     
     def clear(self):
@@ -99,6 +125,7 @@ class Player(object):
             self.stop()
         self._song = None
         self._events = []
+        self._source = None
         self._position = 0
         self._offset = 0
         
@@ -144,6 +171,10 @@ class Player(object):
         pos = 0
         offset = 0
         if time:
+            # read a stream until the time has been reached
+            while ((not self._events or self._events[-1][0] < time)
+                   and self._fill(len(self._events) + 1)):
+                pass
             # bisect our way in the events list.
             end = len(self._events)
             while pos < end:
@@ -163,10 +194,13 @@ class Player(object):
         
         """
         result = False
-        for i, (t, e) in enumerate(self._events):
+        i = 0
+        while self._fill(i + 1):
+            t, e = self._events[i]
+            i += 1
             if e.beat:
                 if e.beat[0] == measnum:
-                    position = i
+                    position = i - 1
                     result = True
                     if e.beat[1] >= beat:
                         break
@@ -194,7 +228,20 @@ class Player(object):
         
     def has_events(self):
         """Returns True if there are events left to play."""
-        return bool(self._events) and self._position < len(self._events)
+        return self._fill(self._position + 1)
+    
+    def _fill(self, count):
+        """(Private) Reads events from a stream until there are count events.
+        
+        Returns True if there are (now) at least count events.
+        
+        """
+        while len(self._events) < count and self._source:
+            try:
+                self._events.append(next(self._source))
+            except StopIteration:
+                self._source = None
+        return len(self._events) >= count
         
     def next_event(self):
         """(Private) Handles the current event and advances to the next.
@@ -210,7 +257,7 @@ class Player(object):
             time, event = self._events[self._position]
             self.handle_event(time, event)
             self._position += 1
-            if self._position < len(self._events):
+            if self._fill(self._position + 1):
                 return self._events[self._position][0] - time
         return 0
     
@@ -415,3 +462,32 @@ def make_event_list(song, time=None, beat=None):
     return [(t, d[t]) for t in sorted(d)]
 
 
+def iter_stream_events(stream, time=None, beat=None):
+    """Yields all the events in a SongStream, while it is being read.
+    
+    Each item is a two-tuple(time, Event), like in the list returned by
+    make_event_list(). Events of different MIDI times that fall on the same
+    msec are combined in one Event.
+    
+    """
+    d = collections.defaultdict(Event)
+    next_time = 0
+    for msec, evs, b in stream:
+        if time:
+            while next_time <= msec:
+                d[next_time].time = True
+                next_time += time
+        # the stream is in time order, so earlier events are complete
+        for t in sorted(t for t in d if t < msec):
+            yield t, d.pop(t)
+        if evs:
+            e = d[msec]
+            if e.midi:
+                for n, l in evs.items():
+                    e.midi.setdefault(n, []).extend(l)
+            else:
+                e.midi = evs
+        elif beat:
+            d[msec].beat = b
+    for t in sorted(d):
+        yield t, d[t]
@@ -24,6 +24,7 @@ midifile.song -- structures MIDI file data as a song.
 
 from __future__ import unicode_literals
 
+import bisect
 import collections
 
 from . import event
@@ -36,12 +37,24 @@ def load(filename):
     If the filename is a type 2 MIDI file, just returns the first track.
     
     """
-    fmt, div, tracks = parser.parse_midi_data(open(filename, 'rb').read())
+    fmt, div, tracks = parser.parse_midi_data(parser.map_file(filename))
     if fmt == 2:
         tracks = tracks[:1]
     return Song(div, tracks)
 
 
+def stream(filename):
+    """Convenience function to instantiate a SongStream from a filename.
+    
+    If the filename is a type 2 MIDI file, just returns the first track.
+    
+    """
+    fmt, div, tracks = parser.parse_midi_data(parser.map_file(filename))
+    if fmt == 2:
+        tracks = tracks[:1]
+    return SongStream(div, tracks)
+
+
 def events_dict(tracks):
     """Returns all events from the track grouped per and mapped to time-step.
     
@@ -133,23 +146,39 @@ class TempoMap(object):
                         break
         if not times or times[0][0] != 0:
             times.insert(0, (0, 500000))
+        # the MIDI time of every tempo change, and the real time (multiplied
+        # by the division) at that point, to be able to bisect
+        self._midi_times = [midi_time for midi_time, tempo in times]
+        self._real_times = real_times = [0]
+        for (time, tempo), (next_time, next_tempo) in zip(times, times[1:]):
+            real_times.append(real_times[-1] + (next_time - time) * tempo)
         
     def real_time(self, midi_time):
         """Returns the real time in microseconds for the given MIDI time."""
-        real_time = 0
-        times = self.times
-        for i in range(1, len(times)):
-            if times[i][0] >= midi_time:
-                real_time += (midi_time - times[i-1][0]) * times[i-1][1]
-                break
-            real_time += (times[i][0] - times[i-1][0]) * times[i-1][1]
-        else:
-            real_time += (midi_time - times[-1][0]) * times[-1][1]
-        return real_time // self.division
+        i = max(0, bisect.bisect_left(self._midi_times, midi_time) - 1)
+        time, tempo = self.times[i]
+        return (self._real_times[i] + (midi_time - time) * tempo) // self.division
     
     def msec(self, midi_time):
         """Returns the real time in milliseconds."""
         return self.real_time(midi_time) // 1000
+    
+    def msecs(self, midi_times):
+        """Returns a list with the real time in milliseconds for every MIDI time.
+        
+        The MIDI times must be sorted. This is faster than calling msec() for
+        every MIDI time, because the tempo changes are walked only once.
+        
+        """
+        result = []
+        times, real_times = self.times, self._real_times
+        i, last = 0, len(times) - 1
+        for midi_time in midi_times:
+            while i < last and times[i+1][0] < midi_time:
+                i += 1
+            time, tempo = times[i]
+            result.append((real_times[i] + (midi_time - time) * tempo) // self.division // 1000)
+        return result
 
 
 def beats(d, division):
@@ -192,6 +221,23 @@ def beats(d, division):
         beat = beat % num + 1
 
 
+def find_beat(beats, time):
+    """Returns the item of a Song.beats list for the beat at time."""
+    if not beats:
+        return (0, 0, 0, 4, 2)
+    pos = 0
+    if time:
+        # bisect our way in the beats list.
+        end = len(beats)
+        while pos < end:
+            mid = (pos + end) // 2
+            if time > beats[mid][0]:
+                pos = mid + 1
+            else:
+                end = mid
+    return beats[min(pos, len(beats) - 1)]
+
+
 class Song(object):
     """A loaded MIDI file.
     
@@ -218,27 +264,92 @@ class Song(object):
 
         self.beats = b = []
         measnum = 0
-        for midi_time, beat, num, den in beats(self.events, division):
+        beat_list = list(beats(self.events, division))
+        for msec, (midi_time, beat, num, den) in zip(
+                t.msecs(beat[0] for beat in beat_list), beat_list):
             if beat == 1:
                 measnum += 1
-            b.append((t.msec(midi_time), measnum, beat, num, den))
-        self.music = [(t.msec(midi_time), evs)
-                      for midi_time, evs in sorted(self.events.items())]
+            b.append((msec, measnum, beat, num, den))
+        music = sorted(self.events.items())
+        self.music = list(zip(t.msecs(midi_time for midi_time, evs in music),
+                              (evs for midi_time, evs in music)))
 
     def beat(self, time):
         """Returns (time, measnum, beat, num, den) for the beat at time."""
-        if not self.beats:
-            return (0, 0, 0, 4, 2)
-        pos = 0
-        if time:
-            # bisect our way in the beats list.
-            end = len(self.beats)
-            while pos < end:
-                mid = (pos + end) // 2
-                if time > self.beats[mid][0]:
-                    pos = mid + 1
-                else:
-                    end = mid
-        return self.beats[min(pos, len(self.beats) - 1)]
+        return find_beat(self.beats, time)
 
 
+class SongStream(object):
+    """A MIDI file that is parsed while its events are read.
+    
+    Iterating over a SongStream yields the same information as the music and
+    beats attributes of a Song, but without building the events dictionary
+    first. The tracks are parsed lazily and merged in time order, and the
+    tempo map and time signatures are followed while iterating.
+    
+    Every yielded item is a three-tuple (msec, d, beat). For the events on a
+    time, d is a dict mapping the track number to the list of events and beat
+    is None. For every beat, d is None and beat is a four-tuple
+    (measnum, beat, num, den).
+    
+    The following instance attributes are set on init:
+    
+    division: the division set in the MIDI header
+    ntracks: the number of tracks
+    
+    """
+    def __init__(self, division, tracks):
+        """Initialize the SongStream with the given division and track chunks."""
+        self.division = division
+        self.ntracks = len(tracks)
+        self._tracks = tracks
+        self._beats = None
+    
+    def beat(self, time):
+        """Returns (time, measnum, beat, num, den) for the beat at time.
+        
+        The first call reads the whole stream to collect the beats.
+        
+        """
+        if self._beats is None:
+            self._beats = [(msec,) + b for msec, d, b in self if b]
+        return find_beat(self._beats, time)
+    
+    def __iter__(self):
+        division = smpte_division(self.division)
+        # the MIDI time and real time (multiplied by the division) of the
+        # last tempo change, and the tempo
+        tempo_time, tempo_real, tempo = 0, 0, 500000
+        def msec(midi_time):
+            return (tempo_real + (midi_time - tempo_time) * tempo) // division // 1000
+        
+        # the time of the next beat, and the current time signature
+        beat_time, beat, measnum = 0, 1, 0
+        num, den, clocks, n32s = 4, 4, 24, 8
+        step = (4 * self.division) // (2 ** den)
+        
+        for midi_time, d in parser.merge_time_events_grouped(self._tracks):
+            while beat_time < midi_time:
+                if beat == 1:
+                    measnum += 1
+                yield msec(beat_time), None, (measnum, beat, num, den)
+                beat_time += step
+                beat = beat % num + 1
+            evs = list(iter_events_dict(d))
+            for e in evs:
+                if is_tempo(e):
+                    tempo_real += (midi_time - tempo_time) * tempo
+                    tempo_time, tempo = midi_time, get_tempo(e)
+                    break
+            for e in evs:
+                if is_time_signature(e):
+                    num, den, clocks, n32s = get_time_signature(e)
+                    step = (4 * self.division) // (2 ** den)
+                    beat_time, beat = midi_time, 1
+            if beat_time == midi_time:
+                if beat == 1:
+                    measnum += 1
+                yield msec(beat_time), None, (measnum, beat, num, den)
+                beat_time += step
+                beat = beat % num + 1
+            yield msec(midi_time), d, None
@@ -36,6 +36,7 @@ except ImportError:
 
 import app
 import plugin
+import qpopplerview
 import resultfiles
 import signals
 import popplertools
@@ -43,6 +44,9 @@ import popplertools
 
 _cache = weakref.WeakValueDictionary()
 
+# the (mtime, size) of the PDF data the documents were loaded from
+_stamps = weakref.WeakKeyDictionary()
+
 
 # This signal gets emitted when a finished Job has created new PDF document(s).
 documentUpdated = signals.Signal() # Document
@@ -76,6 +80,9 @@ def load(filename):
         doc = popplerqt4.Poppler.Document.loadFromData(data)
         if doc:
             _cache[key] = doc
+            _stamps[doc] = (mtime, data.size())
+            # allows rendering multiple pages at the same time
+            qpopplerview.cache.setdata(doc, data)
         return doc or None
 
 
@@ -86,6 +93,15 @@ def filename(poppler_document):
             return filename
 
 
+def stamp(poppler_document):
+    """Returns (mtime, size) of the PDF file the document was loaded from.
+    
+    Returns None if the document was not loaded via our cache.
+    
+    """
+    return _stamps.get(poppler_document)
+
+
 class Document(popplertools.Document):
     """Represents a (lazily) loaded PDF document."""
     updated = True
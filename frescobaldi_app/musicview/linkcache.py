@@ -0,0 +1,192 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Persistent on-disk cache of the point and click links of PDF documents.
+
+For every PDF file, the textedit links of all pages are stored in the user's
+cache directory, keyed by the PDF's path, modification time and size. When
+the same PDF is opened again (e.g. when LilyPond did not need to rerun, or in
+a later session), the links do not need to be read from the pages again.
+
+The link table is stored as a flat sequence of numbers, marshalled and
+compressed.
+
+"""
+
+from __future__ import unicode_literals
+
+import hashlib
+import marshal
+import os
+import sys
+import zlib
+
+from PyQt4.QtCore import QRectF
+
+import util
+
+
+# increase this when the file format changes
+_FORMAT = 1
+
+_VERSION = (_FORMAT, sys.version_info[:2])
+
+_maxsize = 20 * 1024 * 1024
+
+# the number of values stored per link
+_FIELDS = 8
+
+
+def maxsize():
+    """Returns the maximum size in bytes of the cache directory."""
+    return _maxsize
+
+
+def setmaxsize(size):
+    """Sets the maximum size in bytes of the cache directory."""
+    global _maxsize
+    _maxsize = size
+
+
+def directory():
+    """Returns the cache directory, or None if it is not available."""
+    return util.cachedir("pointandclick")
+
+
+def _cachefile(filename):
+    """Returns the name of the cache file for the PDF filename."""
+    d = directory()
+    if d:
+        name = hashlib.sha1(filename.encode('utf-8')).hexdigest()
+        return os.path.join(d, name + '.links')
+
+
+def _key(filename, stamp):
+    """Returns the tuple that must match for a cache file to be valid."""
+    mtime, size = stamp
+    return (_VERSION, filename, mtime, size)
+
+
+def load(filename, stamp):
+    """Returns the cached links of the PDF file, or None.
+    
+    stamp is the tuple (mtime, size) of the PDF data the document was loaded
+    from (see documents.stamp()). The links are returned as a list of
+    (filename, line, column, (pageNum, QRectF)) tuples, like they are added
+    to pointandclick.Links.
+    
+    """
+    cachefile = _cachefile(filename)
+    if not cachefile:
+        return
+    try:
+        key = _key(filename, stamp)
+        with open(cachefile, 'rb') as f:
+            data = marshal.loads(zlib.decompress(f.read()))
+        k, filenames, values = data
+        if k != key:
+            return
+        links = []
+        for i in range(0, len(values), _FIELDS):
+            page, f, line, column, x, y, w, h = values[i:i+_FIELDS]
+            links.append((filenames[f], line, column, (page, QRectF(x, y, w, h))))
+    except Exception:
+        # invalid, old or unreadable cache file
+        return
+    # mark this cache file as recently used
+    try:
+        os.utime(cachefile, None)
+    except (IOError, OSError):
+        pass
+    return links
+
+
+def save(filename, stamp, links):
+    """Stores the links of the PDF file in the cache.
+    
+    stamp is the tuple (mtime, size) of the PDF data the document was loaded
+    from, the links were read from that document. links is a list of tuples
+    like load() returns.
+    
+    """
+    cachefile = _cachefile(filename)
+    if not cachefile:
+        return
+    files, filenames = {}, []
+    values = []
+    for f, line, column, (page, rect) in links:
+        try:
+            index = files[f]
+        except KeyError:
+            index = files[f] = len(filenames)
+            filenames.append(f)
+        values.extend((page, index, line, column,
+                       rect.x(), rect.y(), rect.width(), rect.height()))
+    try:
+        data = zlib.compress(marshal.dumps((_key(filename, stamp), filenames, values)))
+        temp = cachefile + '.tmp'
+        with open(temp, 'wb') as f:
+            f.write(data)
+        try:
+            os.rename(temp, cachefile)
+        except OSError:
+            # Windows does not overwrite an existing file
+            os.remove(cachefile)
+            os.rename(temp, cachefile)
+    except (IOError, OSError, ValueError):
+        return
+    purge()
+
+
+def purge():
+    """Removes the least recently used cache files until maxsize() is met."""
+    d = directory()
+    if not d:
+        return
+    files = []
+    total = 0
+    for name in os.listdir(d):
+        path = os.path.join(d, name)
+        try:
+            s = os.stat(path)
+        except (IOError, OSError):
+            continue
+        files.append((s.st_mtime, s.st_size, path))
+        total += s.st_size
+    if total > maxsize():
+        for mtime, size, path in sorted(files):
+            try:
+                os.remove(path)
+            except (IOError, OSError):
+                continue
+            total -= size
+            if total <= maxsize():
+                break
+
+
+def clear():
+    """Removes all cache files."""
+    d = directory()
+    if d:
+        for name in os.listdir(d):
+            try:
+                os.remove(os.path.join(d, name))
+            except (IOError, OSError):
+                pass
@@ -27,34 +27,49 @@ from __future__ import absolute_import
 import re
 import os
 import sys
+import threading
 import weakref
 
+from PyQt4.QtCore import QThread, pyqtSignal
+
 import qpopplerview
 
 import util
 import textedit
 import pointandclick
 
+from . import documents
+from . import linkcache
+
 
 # cache point and click handlers for poppler documents
 _cache = weakref.WeakKeyDictionary()
 
+# keep running extractors alive
+_extractors = set()
+
 
 def links(document):
+    """Returns the Links for the Poppler document.
+    
+    The first time, the links are restored from the link cache, or else
+    they are read in a background thread. In the latter case the Links
+    object is filled while the pages are read, see Links.isDone().
+    
+    """
     try:
         return _cache[document]
     except KeyError:
         l = _cache[document] = Links()
-        with l:
-            import popplerqt4
-            with qpopplerview.lock(document):
-                for num in range(document.numPages()):
-                    page = document.page(num)
-                    for link in page.links():
-                        if isinstance(link, popplerqt4.Poppler.LinkBrowse):
-                            t = textedit.link(link.url())
-                            if t:
-                                l.add_link(t.filename, t.line, t.column, (num, link.linkArea()))
+        l.finish()
+        filename = documents.filename(document)
+        stamp = documents.stamp(document)
+        cached = linkcache.load(filename, stamp) if filename and stamp else None
+        if cached is not None:
+            for t in cached:
+                l.add_link(*t)
+        else:
+            l.extract(document, filename, stamp)
         return l
 
 
@@ -64,6 +79,53 @@ class Links(pointandclick.Links):
     Only textedit:// urls are stored.
     
     """
+    def __init__(self):
+        super(Links, self).__init__()
+        self._extractor = None
+        self._filename = None
+        self._stamp = None
+        self._all = []
+    
+    def extract(self, document, filename=None, stamp=None):
+        """Starts reading the links of the document in a background thread.
+        
+        If filename and stamp (the (mtime, size) of the PDF data the document
+        was loaded from) are given, the links are saved in the link cache when
+        done.
+        
+        """
+        if filename and stamp:
+            self._filename, self._stamp = filename, stamp
+        self._extractor = e = Extractor(document)
+        e.pageExtracted.connect(self._pageExtracted)
+        e.finished.connect(self._extractorFinished)
+        _extractors.add(e)
+        e.start()
+    
+    def isDone(self):
+        """Returns True if all links of the document have been read."""
+        return self._extractor is None
+    
+    def prioritize(self, pageNumbers):
+        """Lets the links of the specified pages be read first (if not done)."""
+        if self._extractor:
+            self._extractor.prioritize(pageNumbers)
+    
+    def _pageExtracted(self, num, links):
+        """Called when the links of a page have been read."""
+        for filename, line, column, rect in links:
+            link = (filename, line, column, (num, rect))
+            self._all.append(link)
+            self.add_link(*link)
+    
+    def _extractorFinished(self):
+        """Called when the Extractor has finished."""
+        e, self._extractor = self._extractor, None
+        _extractors.discard(e)
+        if self._filename:
+            linkcache.save(self._filename, self._stamp, self._all)
+        self._all = []
+    
     def cursor(self, link, load=False):
         """Returns the destination of a link as a QTextCursor of the destination document.
         
@@ -79,6 +141,69 @@ class Links(pointandclick.Links):
             return super(Links, self).cursor(t.filename, t.line, t.column, load)
 
 
-positions = pointandclick.positions
+class Extractor(QThread):
+    """Reads the textedit links of all pages of a Poppler document.
+    
+    If the PDF data is registered in the qpopplerview cache, an independent
+    copy of the document is used, so rendering is not blocked. Otherwise the
+    document itself is used, locking it for every page.
+    
+    The pages given to prioritize() are read first, the others in order.
+    For every page, pageExtracted(num, links) is emitted, links being a list
+    of (filename, line, column, QRectF) tuples.
+    
+    """
+    pageExtracted = pyqtSignal(int, object)
+    
+    def __init__(self, document):
+        super(Extractor, self).__init__()
+        self._document = document
+        self._lock = threading.Lock()
+        self._priority = []
+        self._next = 0
+        self._done = set()
+    
+    def prioritize(self, pageNumbers):
+        """Reads the specified pages first."""
+        with self._lock:
+            self._priority = list(pageNumbers)
+    
+    def _nextPage(self, count):
+        """Returns the number of the next page to read, or None."""
+        with self._lock:
+            while self._priority:
+                num = self._priority.pop(0)
+                if 0 <= num < count and num not in self._done:
+                    self._done.add(num)
+                    return num
+            while self._next < count:
+                num = self._next
+                self._next += 1
+                if num not in self._done:
+                    self._done.add(num)
+                    return num
+    
+    def run(self):
+        """Main method of this thread, called by Qt on start()."""
+        import popplerqt4
+        document = self._document
+        data = qpopplerview.cache.data(document)
+        if data is not None:
+            document = popplerqt4.Poppler.Document.loadFromData(data) or document
+        with qpopplerview.lock(document):
+            count = document.numPages()
+        while True:
+            num = self._nextPage(count)
+            if num is None:
+                break
+            links = []
+            with qpopplerview.lock(document):
+                for link in document.page(num).links():
+                    if isinstance(link, popplerqt4.Poppler.LinkBrowse):
+                        t = textedit.link(link.url())
+                        if t:
+                            links.append((t.filename, t.line, t.column, link.linkArea()))
+            self.pageExtracted.emit(num, links)
 
 
+positions = pointandclick.positions
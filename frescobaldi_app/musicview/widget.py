@@ -85,6 +85,7 @@ class MusicView(QWidget):
         self.view.surface().setShowUrlTips(False)
         self.view.surface().linkHelpRequested.connect(self.slotLinkHelpRequested)
         
+        self.view.verticalScrollBar().valueChanged.connect(self.prioritizeLinks)
         self.view.viewModeChanged.connect(self.updateZoomInfo)
         self.view.surface().pageLayout().scaleChanged.connect(self.updateZoomInfo)
         self.view.setContextMenuPolicy(Qt.CustomContextMenu)
@@ -114,6 +115,7 @@ class MusicView(QWidget):
             self.view.load(document)
             position = self._positions.get(doc, (0, 0, 0))
             self.view.setPosition(position, True)
+            self.prioritizeLinks()
 
     def clear(self):
         """Empties the view."""
@@ -126,6 +128,11 @@ class MusicView(QWidget):
         self._highlightTimer.stop()
         self.view.clear()
         
+    def prioritizeLinks(self):
+        """Lets the links of the visible pages be read first, if not done yet."""
+        if self._links and not self._links.isDone():
+            self._links.prioritize(page.pageNumber() for page in self.view.visiblePages())
+        
     def readSettings(self):
         """Reads the settings from the user's preferences."""
         # background and highlight colors of music view
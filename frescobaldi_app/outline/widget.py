@@ -29,7 +29,6 @@ from PyQt4.QtGui import QBrush, QFont, QTextCursor, QTreeWidget, QTreeWidgetItem
 import app
 import qutil
 import cursortools
-import tokeniter
 import documentstructure
 
 
@@ -38,6 +37,9 @@ class Widget(QTreeWidget):
         super(Widget, self).__init__(tool,
             headerHidden=True)
         self._timer = QTimer(singleShot=True, timeout=self.updateView)
+        self._document = None
+        self._entries = []  # (text, style, depth, parent) tuples
+        self._items = []    # the corresponding QTreeWidgetItems
         tool.mainwindow().currentDocumentChanged.connect(self.slotCurrentDocumentChanged)
         self.itemClicked.connect(self.slotItemClicked)
         self.itemActivated.connect(self.slotItemClicked)
@@ -64,86 +66,177 @@ class Widget(QTreeWidget):
             self._timer.start(2000)
         
     def updateView(self):
-        """Recreate the items in the view."""
+        """Update the items in the view.
+        
+        Only the items that changed are replaced, so the collapsed state
+        of the other items and the scroll position are retained.
+        If the document changed, all items are recreated.
+        
+        """
+        doc = self.parent().mainwindow().currentDocument()
         with qutil.signalsBlocked(self):
-            self.clear()
-            doc = self.parent().mainwindow().currentDocument()
             if not doc:
+                self.clear()
+                self._document = None
+                self._entries, self._items = [], []
                 return
-            view_cursor_position = self.parent().mainwindow().textCursor().position()
+            if doc is not self._document:
+                self.clear()
+                self._document = doc
+                self._entries, self._items = [], []
+                scroll = True
+            else:
+                scroll = False
             structure = documentstructure.DocumentStructure.instance(doc)
-            last_item = None
+            outline = structure.outline()
+            entries = self.outlineEntries(structure, outline)
+            items = self.applyEntries(outline, entries)
+        if scroll:
+            view_cursor_position = self.parent().mainwindow().textCursor().position()
             current_item = None
-            last_block = None
-            for i in structure.outline():
-                position = i.start()
-                block = doc.findBlock(position)
-                depth = tokeniter.state(block).depth()
-                if block == last_block:
-                    parent = last_item
-                elif last_block is None or depth == 1:
-                    # a toplevel item anyway
-                    parent = self
+            for item in items:
+                if item.position > view_cursor_position:
+                    break
+                current_item = item
+            if current_item:
+                self.scrollToItem(current_item)
+    
+    def outlineEntries(self, structure, outline):
+        """Return a list of (text, style, depth, parent) tuples for the outline.
+        
+        The outline is a list of (block, match) tuples as returned by
+        DocumentStructure.outline(). The style is None, 'title' or 'alert'
+        and the parent is the index of the parent entry, or -1.
+        
+        """
+        entries = []
+        last = -1
+        last_block = None
+        for block, i in outline:
+            depth = structure.depth(block)
+            if block == last_block:
+                parent = last
+            elif last_block is None or depth == 1:
+                # a toplevel item anyway
+                parent = -1
+            else:
+                while last != -1 and depth <= entries[last][2]:
+                    last = entries[last][3]
+                if last == -1:
+                    parent = -1
                 else:
-                    while last_item and depth <= last_item.depth:
-                        last_item = last_item.parent()
-                    if not last_item:
-                        parent = self
-                    else:
-                        # the item could belong to a parent item, but see if they
-                        # really are in the same (toplevel) state
-                        b = last_block.next()
-                        while b < block:
-                            depth2 = tokeniter.state(b).depth()
-                            if depth2 == 1:
-                                parent = self
-                                break
-                            while last_item and depth2 <= last_item.depth:
-                                last_item = last_item.parent()
-                            if not last_item:
-                                parent = self
-                                break
-                            b = b.next()
-                        else:
-                            parent = last_item
-                
-                item = last_item = QTreeWidgetItem(parent)
-                
-                # set item text and display style bold if 'title' was used
-                for name, text in i.groupdict().items():
-                    if text:
-                        if name.startswith('title'):
-                            font = item.font(0)
-                            font.setWeight(QFont.Bold)
-                            item.setFont(0, font)
+                    # the item could belong to a parent item, but see if they
+                    # really are in the same (toplevel) state
+                    b = last_block.next()
+                    while b < block:
+                        depth2 = structure.depth(b)
+                        if depth2 == 1:
+                            parent = -1
                             break
-                        elif name.startswith('alert'):
-                            color = item.foreground(0).color()
-                            color = qutil.addcolor(color, 128, 0, 0)
-                            item.setForeground(0, QBrush(color))
-                            font = item.font(0)
-                            font.setStyle(QFont.StyleItalic)
-                            item.setFont(0, font)
-                        elif name.startswith('text'):
+                        while last != -1 and depth2 <= entries[last][2]:
+                            last = entries[last][3]
+                        if last == -1:
+                            parent = -1
                             break
-                else:
-                    text = i.group()
-                item.setText(0, text)
-                
-                # remember whether is was collapsed by the user
-                try:
-                    collapsed = block.userData().collapsed
-                except AttributeError:
-                    collapsed = False
-                item.setExpanded(not collapsed)
-                item.depth = depth
-                item.position = position
-                last_block = block
-                # scroll to the item at the view's cursor later
-                if position <= view_cursor_position:
-                    current_item = item
-            if current_item:
-                self.scrollToItem(current_item)
+                        b = b.next()
+                    else:
+                        parent = last
+            
+            # determine the text and display style bold if 'title' was used
+            style = None
+            for name, text in i.groupdict().items():
+                if text:
+                    if name.startswith('title'):
+                        style = 'title'
+                        break
+                    elif name.startswith('alert'):
+                        style = 'alert'
+                    elif name.startswith('text'):
+                        break
+            else:
+                text = i.group()
+            entries.append((text, style, depth, parent))
+            last = len(entries) - 1
+            last_block = block
+        return entries
+    
+    def applyEntries(self, outline, entries):
+        """Update the tree to show the entries, only touching changed items.
+        
+        Returns the list of all items, in document order.
+        
+        """
+        old_entries, old_items = self._entries, self._items
+        delta = len(entries) - len(old_entries)
+        
+        # find the number of unchanged entries at the start
+        prefix = 0
+        for old, new in zip(old_entries, entries):
+            if old != new:
+                break
+            prefix += 1
+        
+        # find the unchanged entries at the end, their parents must be unchanged too
+        size = min(len(old_entries), len(entries)) - prefix
+        suffix = 0
+        while suffix < size:
+            old = old_entries[-1 - suffix]
+            new = entries[-1 - suffix]
+            if old[:3] != new[:3]:
+                break
+            p_old, p_new = old[3], new[3]
+            if not (p_old == p_new < prefix or p_old >= prefix and p_new == p_old + delta):
+                break
+            suffix += 1
+        start = len(old_entries) - suffix
+        for index in range(start, len(old_entries)):
+            p = old_entries[index][3]
+            if prefix <= p < start:
+                start = index + 1
+        suffix = len(old_entries) - start
+        
+        # remove the changed items, children first
+        for item in reversed(old_items[prefix:start]):
+            (item.parent() or self.invisibleRootItem()).removeChild(item)
+        
+        # insert the new items
+        items = old_items[:prefix]
+        childcount = {}
+        for text, style, depth, parent in entries[:prefix]:
+            childcount[parent] = childcount.get(parent, 0) + 1
+        for index in range(prefix, len(entries) - suffix):
+            text, style, depth, parent = entries[index]
+            item = QTreeWidgetItem()
+            item.setText(0, text)
+            if style == 'title':
+                font = item.font(0)
+                font.setWeight(QFont.Bold)
+                item.setFont(0, font)
+            elif style == 'alert':
+                color = item.foreground(0).color()
+                color = qutil.addcolor(color, 128, 0, 0)
+                item.setForeground(0, QBrush(color))
+                font = item.font(0)
+                font.setStyle(QFont.StyleItalic)
+                item.setFont(0, font)
+            count = childcount.get(parent, 0)
+            childcount[parent] = count + 1
+            (items[parent] if parent != -1 else self.invisibleRootItem()).insertChild(count, item)
+            # remember whether is was collapsed by the user
+            try:
+                collapsed = outline[index][0].userData().collapsed
+            except AttributeError:
+                collapsed = False
+            item.setExpanded(not collapsed)
+            items.append(item)
+        items.extend(old_items[start:])
+        
+        # update the positions
+        for item, (block, i), entry in zip(items, outline, entries):
+            item.position = block.position() + i.start()
+            item.depth = entry[2]
+        self._entries, self._items = entries, items
+        return items
     
     def cursorForItem(self, item):
         """Returns a cursor for the specified item.
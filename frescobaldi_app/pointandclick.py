@@ -42,6 +42,7 @@ class Links(object):
     def __init__(self):
         self._links = collections.defaultdict(lambda: collections.defaultdict(list))
         self._docs = {}
+        self._finished = False
        
     def add_link(self, filename, line, column, destination):
         """Add a link.
@@ -50,8 +51,18 @@ class Links(object):
         
         destination can be any object that describes where the link points to.
         
+        Links may also be added after finish() has been called, e.g. when they
+        are read in the background; they are then added to the bound links
+        immediately.
+        
         """
-        self._links[filename][(line, column)].append(destination)
+        new = self._finished and filename not in self._links
+        destinations = self._links[filename][(line, column)]
+        destinations.append(destination)
+        if new:
+            self._bindLoaded(filename)
+        elif len(destinations) == 1 and filename in self._docs:
+            self._docs[filename].add(line, column, destinations)
     
     def finish(self):
         """Call this when you are done with adding links.
@@ -64,13 +75,18 @@ class Links(object):
         
         """
         for filename in self._links:
-            for d in app.documents:
-                s = scratchdir.scratchdir(d)
-                if (s.directory() and util.equal_paths(filename, s.path())
-                    or d.url().toLocalFile() == filename):
-                    self.bind(filename, d)
+            self._bindLoaded(filename)
         app.documentLoaded.connect(self.slotDocumentLoaded)
         app.documentClosed.connect(self.slotDocumentClosed)
+        self._finished = True
+    
+    def _bindLoaded(self, filename):
+        """Binds the filename to a loaded document, if there is one."""
+        for d in app.documents:
+            s = scratchdir.scratchdir(d)
+            if (s.directory() and util.equal_paths(filename, s.path())
+                or d.url().toLocalFile() == filename):
+                self.bind(filename, d)
     
     def __enter__(self):
         return self
@@ -146,6 +162,25 @@ class BoundLinks(object):
                 cursors.append(c)
                 destinations.append(dest)
         
+    def add(self, line, column, destinations):
+        """Adds a cursor for a new line/col, keeping the cursors sorted."""
+        b = self.document.findBlockByNumber(line - 1)
+        if not b.isValid():
+            return
+        c = self._cursor_dict[(line, column)] = QTextCursor(self.document)
+        c.setPosition(b.position() + column)
+        pos = c.position()
+        cursors = self._cursors
+        lo, hi = 0, len(cursors)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if pos < cursors[mid].position():
+                hi = mid
+            else:
+                lo = mid + 1
+        cursors.insert(lo, c)
+        self._destinations.insert(lo, destinations)
+    
     def cursor(self, line, column):
         """Returns the QTextCursor for the give line/col."""
         return self._cursor_dict.get((line, column))
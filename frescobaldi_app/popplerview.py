@@ -26,7 +26,7 @@ This is used throughout Frescobaldi, to obey color settings etc.
 
 from __future__ import unicode_literals
 
-from PyQt4.QtCore import QSettings
+from PyQt4.QtCore import QSettings, QThread
 
 import app
 import textformats
@@ -47,6 +47,15 @@ _setbackground()
 qpopplerview.cache.options().setOversampleThreshold(96)
 
 
+# number of pages to render at the same time
+def _setworkers():
+    qpopplerview.cache.setworkers(QSettings().value("musicview/render_threads",
+        QThread.idealThreadCount(), int))
+
+app.settingsChanged.connect(_setworkers, -1)
+_setworkers()
+
+
 class View(qpopplerview.View):
     def __init__(self, parent=None):
         super(View, self).__init__(parent)
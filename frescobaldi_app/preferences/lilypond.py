@@ -272,6 +272,12 @@ class Running(preferences.Group):
         self.saveDocument = QCheckBox(clicked=self.changed)
         self.deleteFiles = QCheckBox(clicked=self.changed)
         self.noTranslation = QCheckBox(clicked=self.changed)
+        self.resultCache = QCheckBox(clicked=self.changed)
+        self.autocompileScore = QCheckBox(clicked=self.changed)
+        self.batchLabel = QLabel()
+        self.batchProcesses = QSpinBox(minimum=1, maximum=64)
+        self.batchProcesses.valueChanged.connect(self.changed)
+        self.batchLabel.setBuddy(self.batchProcesses)
         self.includeLabel = QLabel()
         self.include = widgets.listedit.FilePathEdit()
         self.include.listBox.setDragDropMode(QAbstractItemView.InternalMove)
@@ -279,6 +285,12 @@ class Running(preferences.Group):
         layout.addWidget(self.saveDocument)
         layout.addWidget(self.deleteFiles)
         layout.addWidget(self.noTranslation)
+        layout.addWidget(self.resultCache)
+        layout.addWidget(self.autocompileScore)
+        hbox = QHBoxLayout()
+        hbox.addWidget(self.batchLabel)
+        hbox.addWidget(self.batchProcesses)
+        layout.addLayout(hbox)
         layout.addWidget(self.includeLabel)
         layout.addWidget(self.include)
         app.translateUI(self)
@@ -296,6 +308,16 @@ class Running(preferences.Group):
         self.noTranslation.setToolTip(_(
             "If checked, LilyPond's output messages will be in English.\n"
             "This can be useful for bug reports."))
+        self.resultCache.setText(_("Reuse earlier engraving results"))
+        self.resultCache.setToolTip(_(
+            "If checked, the output of LilyPond is kept in a cache, and reused\n"
+            "when a document with the same contents and include files is\n"
+            "engraved again with the same LilyPond version and options."))
+        self.autocompileScore.setText(_("Automatic Engrave only engraves the current score"))
+        self.autocompileScore.setToolTip(_(
+            "If checked, Automatic Engrave only engraves the \\score or \\bookpart\n"
+            "at the cursor, leaving out the other scores in the document."))
+        self.batchLabel.setText(_("Maximum number of processes when engraving many files:"))
         self.includeLabel.setText(_("LilyPond include path:"))
     
     def loadSettings(self):
@@ -303,6 +325,9 @@ class Running(preferences.Group):
         self.saveDocument.setChecked(s.value("save_on_run", False, bool))
         self.deleteFiles.setChecked(s.value("delete_intermediate_files", True, bool))
         self.noTranslation.setChecked(s.value("no_translation", False, bool))
+        self.resultCache.setChecked(s.value("result_cache", True, bool))
+        self.autocompileScore.setChecked(s.value("autocompile_score", False, bool))
+        self.batchProcesses.setValue(s.value("batch_processes", QThread.idealThreadCount(), int))
         try:
             include_path = s.value("include_path", [], type(""))
         except TypeError:
@@ -314,6 +339,9 @@ class Running(preferences.Group):
         s.setValue("save_on_run", self.saveDocument.isChecked())
         s.setValue("delete_intermediate_files", self.deleteFiles.isChecked())
         s.setValue("no_translation", self.noTranslation.isChecked())
+        s.setValue("result_cache", self.resultCache.isChecked())
+        s.setValue("autocompile_score", self.autocompileScore.isChecked())
+        s.setValue("batch_processes", self.batchProcesses.value())
         s.setValue("include_path", self.include.value())
 
 
@@ -25,7 +25,7 @@ from __future__ import unicode_literals
 
 import re
 
-from PyQt4.QtCore import QSettings, Qt
+from PyQt4.QtCore import QSettings, QThread, Qt
 from PyQt4.QtGui import (
     QAbstractItemView, QCheckBox, QDoubleSpinBox, QFont, QFontComboBox,
     QGridLayout, QHBoxLayout, QLabel, QPushButton, QSlider, QSpinBox,
@@ -159,6 +159,12 @@ class MusicView(preferences.Group):
         layout.addWidget(self.enableKineticScrolling)
         self.showScrollbars = QCheckBox(toggled=self.changed)
         layout.addWidget(self.showScrollbars)
+        
+        self.renderThreadsLabel = QLabel()
+        self.renderThreads = QSpinBox(valueChanged=self.changed)
+        self.renderThreads.setRange(1, 32)
+        layout.addWidget(self.renderThreadsLabel, 5, 0)
+        layout.addWidget(self.renderThreads, 5, 1)
         app.translateUI(self)
         
     def translateUI(self):
@@ -179,6 +185,9 @@ class MusicView(preferences.Group):
         # L10N: "Kinetic Scrolling" is a checkbox label, as in "Enable Kinetic Scrolling"
         self.enableKineticScrolling.setText(_("Kinetic Scrolling"))
         self.showScrollbars.setText(_("Show Scrollbars"))
+        self.renderThreadsLabel.setText(_("Rendering Threads:"))
+        self.renderThreadsLabel.setToolTip(_(
+            "The number of pages of a PDF document to render at the same time."))
             
     def loadSettings(self):
         s = popplerview.MagnifierSettings.load()
@@ -193,6 +202,7 @@ class MusicView(preferences.Group):
         self.enableKineticScrolling.setChecked(kineticScrollingActive)
         showScrollbars = s.value("show_scrollbars", True, bool)
         self.showScrollbars.setChecked(showScrollbars)
+        self.renderThreads.setValue(s.value("render_threads", QThread.idealThreadCount(), int))
     
     def saveSettings(self):
         s = popplerview.MagnifierSettings()
@@ -205,6 +215,7 @@ class MusicView(preferences.Group):
         s.setValue("newer_files_only", self.newerFilesOnly.isChecked())
         s.setValue("kinetic_scrolling", self.enableKineticScrolling.isChecked())
         s.setValue("show_scrollbars", self.showScrollbars.isChecked())
+        s.setValue("render_threads", self.renderThreads.value())
 
 
 class CharMap(preferences.Group):
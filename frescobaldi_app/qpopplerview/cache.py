@@ -22,7 +22,7 @@
 Caching of generated images.
 """
 
-import time
+import collections
 import weakref
 
 try:
@@ -30,25 +30,53 @@ try:
 except ImportError:
     from . import popplerqt4_dummy as popplerqt4
 
-from PyQt4.QtCore import Qt, QThread
+from PyQt4.QtCore import QRect, Qt, QThread
 
 from . import render
 from . import rectangles
 from .locking import lock
 
-__all__ = ['maxsize', 'setmaxsize', 'image', 'generate', 'clear', 'links', 'options']
+__all__ = [
+    'maxsize', 'setmaxsize', 'image', 'generate', 'clear', 'links', 'options',
+    'statistics', 'setdata', 'data', 'workers', 'setworkers',
+    'prefetch', 'prefetchcount', 'setprefetchcount', 'istiled', 'tiles',
+]
 
 
 _cache = weakref.WeakKeyDictionary()
 _schedulers = weakref.WeakKeyDictionary()
 _options = weakref.WeakKeyDictionary()
 _links = weakref.WeakKeyDictionary()
+_data = weakref.WeakKeyDictionary()
 
+# the least recently used order of the images in the cache, oldest first,
+# mapping (docref, pageKey, sizeKey) to the byte count of the image.
+_lru = collections.OrderedDict()
+_docrefs = weakref.WeakKeyDictionary()
 
 # cache size
 _maxsize = 104857600 # 100M
 _currentsize = 0
 
+# statistics
+_hits = 0
+_misses = 0
+_evictions = 0
+_prefetched = 0
+_waits = 0
+_waittime = 0.0
+_maxwaittime = 0.0
+
+# number of pages before and after the visible pages to render in advance
+_prefetchcount = 2
+
+# pages larger than this number of pixels are rendered in square tiles
+_tilethreshold = 2048 * 2048
+_tilesize = 512
+
+# maximum number of pages of one document to render at the same time
+_workers = QThread.idealThreadCount()
+
 _globaloptions = None
 
 
@@ -66,97 +94,290 @@ def maxsize():
 
 def clear(document=None):
     """Clears the whole cache or the cache for the given Poppler.Document."""
+    global _currentsize
     if document:
         try:
             del _cache[document]
         except KeyError:
             pass
+        else:
+            _forget(_docrefs[document])
     else:
         _cache.clear()
-        global _currentsize
+        _lru.clear()
         _currentsize = 0
 
 
-def image(page, exact=True):
+def workers():
+    """Returns the maximum number of pages of a document rendered at the same time."""
+    return _workers
+
+
+def setworkers(count):
+    """Sets the maximum number of pages of a document rendered at the same time.
+    
+    This only has effect for documents that the PDF data was registered for
+    using setdata().
+    
+    """
+    global _workers
+    _workers = max(1, count)
+    for scheduler in _schedulers.values():
+        scheduler.checkStart()
+
+
+def setdata(document, data):
+    """Registers the PDF data (a QByteArray) the Poppler.Document was loaded from.
+    
+    Poppler-Qt4 crashes when different pages from a Document are rendered at
+    the same time. If the data is known, we can load independent copies of
+    the Poppler.Document, and render multiple pages at the same time, using
+    up to workers() threads.
+    
+    """
+    _data[document] = data
+
+
+def data(document):
+    """Returns the PDF data registered using setdata(), or None."""
+    return _data.get(document)
+
+
+def statistics():
+    """Returns a dictionary with statistics about the cache.
+    
+    The keys are 'hits' and 'misses' (the number of exact image lookups that
+    did and did not find an image), 'evictions' (the number of images removed
+    to limit the size), 'images' (the number of cached images) and 'bytes'
+    (their total size), 'prefetched' (the number of images rendered in
+    advance), and 'waits', 'waittime' and 'maxwaittime' (how many times a
+    painted page had to wait for its exact image, and the total and longest
+    time in seconds until that image was painted).
+    
+    """
+    return {
+        'hits': _hits,
+        'misses': _misses,
+        'evictions': _evictions,
+        'images': len(_lru),
+        'bytes': _currentsize,
+        'prefetched': _prefetched,
+        'waits': _waits,
+        'waittime': _waittime,
+        'maxwaittime': _maxwaittime,
+    }
+
+
+def waited(seconds):
+    """(Internal) Called by a Page when its exact image is painted after waiting."""
+    global _waits, _waittime, _maxwaittime
+    _waits += 1
+    _waittime += seconds
+    _maxwaittime = max(_maxwaittime, seconds)
+
+
+def prefetchcount():
+    """Returns the number of pages before and after the visible pages to render in advance."""
+    return _prefetchcount
+
+
+def setprefetchcount(count):
+    """Sets the number of pages before and after the visible pages to render in advance.
+    
+    Use 0 to disable rendering pages in advance.
+    
+    """
+    global _prefetchcount
+    _prefetchcount = count
+
+
+def istiled(page):
+    """Returns True if the page is large enough to be rendered in tiles.
+    
+    See tiles().
+    
+    """
+    return page.width() * page.height() > _tilethreshold
+
+
+def tiles(page, rect):
+    """Yields the tiles needed to display the rect of the page.
+    
+    The rect and the yielded tiles are QRect instances, relative to the page.
+    Tiles can be given to image() and generate() to render only a part of a
+    large page, so that the memory and time needed depend on the size of the
+    view instead of the zoom level.
+    
+    """
+    rect = rect & QRect(0, 0, page.width(), page.height())
+    if rect:
+        for y in range(rect.top() // _tilesize, rect.bottom() // _tilesize + 1):
+            for x in range(rect.left() // _tilesize, rect.right() // _tilesize + 1):
+                yield QRect(x * _tilesize, y * _tilesize, _tilesize, _tilesize) & \
+                      QRect(0, 0, page.width(), page.height())
+
+
+def _sizeKey(width, height, tile=None):
+    """Returns the key for the size of an image, or a tile of it."""
+    if tile is None:
+        return (width, height)
+    return (width, height, tile.x(), tile.y())
+
+
+def image(page, exact=True, tile=None):
     """Returns a rendered image for given Page if in cache.
     
     If exact is True (default), the function returns None if the exact size was
     not in the cache. If exact is False, the function may return a temporary
     rendering of the page scaled from a different size, if that was available.
     
+    If a tile (see tiles()) is given, only the image for that tile is
+    returned. This only works with exact set to True.
+    
     """
+    global _hits, _misses
     document = page.document()
     pageKey = (page.pageNumber(), page.rotation())
-    sizeKey = (page.width(), page.height())
+    sizeKey = _sizeKey(page.width(), page.height(), tile)
     
     if exact:
         try:
-            entry = _cache[document][pageKey][sizeKey]
+            image = _cache[document][pageKey][sizeKey]
         except KeyError:
+            _misses += 1
             return
         else:
-            entry[1] = time.time()
-            return entry[0]
+            _hits += 1
+            key = (_docrefs[document], pageKey, sizeKey)
+            _lru[key] = _lru.pop(key)
+            return image
     try:
-        sizes = _cache[document][pageKey].keys()
+        sizes = [s for s in _cache[document][pageKey] if len(s) == 2]
     except KeyError:
         return
     # find the closest size (assuming aspect ratio has not changed)
     if sizes:
         sizes.sort(key=lambda s: abs(1 - s[0] / float(page.width())))
-        return _cache[document][pageKey][sizes[0]][0]
+        return _cache[document][pageKey][sizes[0]]
 
 
-def generate(page):
-    """Schedule an image to be generated for the cache."""
+def generate(page, tile=None):
+    """Schedule an image to be generated for the cache.
+    
+    If a tile (see tiles()) is given, only that part of the page is rendered.
+    
+    """
     # Poppler-Qt4 crashes when different pages from a Document are rendered at the same time,
-    # so we schedule them to be run in sequence.
-    document = page.document()
+    # so we schedule them to be run in sequence, or using independent copies
+    # of the document (see setdata()).
+    _scheduler(page.document()).schedulejob(page, tile=tile)
+
+
+def prefetch(layout):
+    """Schedule images to be generated for pages near the visible pages of the layout.
+    
+    The prefetchcount() pages after and before the visible pages (see
+    Layout.visibleRect()) are rendered at their current size, with a lower
+    priority than pages that are actually displayed. Pages are only rendered
+    in advance as long as all images fit in the cache together with the
+    images of the visible pages. Jobs for pages whose size has changed, e.g.
+    because the layout was zoomed, are dropped. The pages are looked up with
+    Layout.pagesAround(), which uses the position index of the layout.
+    
+    """
+    rect = layout.visibleRect()
+    if not _prefetchcount or rect.isNull():
+        return
+    visible, before, after = layout.pagesAround(rect, _prefetchcount)
+    if not visible:
+        return
+    # estimate the size of the images (32 bits per pixel); of tiled pages
+    # only the visible part is rendered
+    size = lambda r: r.width() * r.height() * 4
+    budget = _maxsize - sum(size(page.rect() & rect if istiled(page)
+                                 else page.rect()) for page in visible)
+    for distance in range(_prefetchcount):
+        for pages in after, before:
+            if distance < len(pages) and not istiled(pages[distance]):
+                page = pages[distance]
+                budget -= size(page.rect())
+                if budget < 0:
+                    return
+                if not _cached(page):
+                    _scheduler(page.document()).schedulejob(page, True)
+
+
+def _scheduler(document):
+    """Returns the Scheduler for the document, creating it if needed."""
     try:
-        scheduler = _schedulers[document]
+        return _schedulers[document]
     except KeyError:
-        scheduler = _schedulers[document] = Scheduler()
-    scheduler.schedulejob(page)
+        scheduler = _schedulers[document] = Scheduler(document)
+        return scheduler
+
 
+def _cached(page):
+    """Returns True if the exact image for the page is in the cache.
+    
+    Unlike image(), this does not count as an image lookup.
+    
+    """
+    try:
+        _cache[page.document()][(page.pageNumber(), page.rotation())][(page.width(), page.height())]
+    except KeyError:
+        return False
+    return True
 
-def add(image, document, pageNumber, rotation, width, height):
+
+def add(image, document, pageNumber, rotation, width, height, tile=None):
     """(Internal) Adds an image to the cache."""
+    global _currentsize
     pageKey = (pageNumber, rotation)
-    sizeKey = (width, height)
-    _cache.setdefault(document, {}).setdefault(pageKey, {})[sizeKey] = [image, time.time()]
+    sizeKey = _sizeKey(width, height, tile)
+    _cache.setdefault(document, {}).setdefault(pageKey, {})[sizeKey] = image
+    
+    try:
+        docref = _docrefs[document]
+    except KeyError:
+        docref = _docrefs[document] = weakref.ref(document, _forget)
+    key = (docref, pageKey, sizeKey)
+    _currentsize -= _lru.pop(key, 0)
+    _lru[key] = image.byteCount()
+    _currentsize += _lru[key]
     
     # maintain cache size
-    global _maxsize, _currentsize
-    _currentsize += image.byteCount()
     if _currentsize > _maxsize:
         purge()
 
 
 def purge():
-    """Removes old images from the cache to limit the space used.
+    """Removes the least recently used images from the cache to limit the space used.
     
     (Not necessary to call, as the cache will monitor its size automatically.)
     
     """
-    # make a list of the images, sorted on time, newest first
-    images = iter(sorted((
-        (time, document, pageKey, sizeKey, image.byteCount())
-            for document, pageKeys in _cache.items()
-            for pageKey, sizeKeys in pageKeys.items()
-            for sizeKey, (image, time) in sizeKeys.items()),
-                reverse=True))
-
-    # sum the size of the newest images
-    global _maxsize, _currentsize
-    byteCount = 0
-    for item in images:
-        byteCount += item[4]
-        if byteCount > _maxsize:
-            break
-    _currentsize = byteCount
-    # delete the other images
-    for time, document, pageKey, sizeKey, byteCount in images:
-        del _cache[document][pageKey][sizeKey]
+    global _currentsize, _evictions
+    while _currentsize > _maxsize and _lru:
+        (docref, pageKey, sizeKey), byteCount = _lru.popitem(False)
+        _currentsize -= byteCount
+        _evictions += 1
+        document = docref()
+        if document is not None:
+            sizeKeys = _cache[document][pageKey]
+            del sizeKeys[sizeKey]
+            if not sizeKeys:
+                del _cache[document][pageKey]
+
+
+def _forget(docref):
+    """(Internal) Removes the images of a document from the LRU bookkeeping.
+    
+    Called when a document is cleared or garbage collected.
+    
+    """
+    global _currentsize
+    for key in [key for key in _lru if key[0] is docref]:
+        _currentsize -= _lru.pop(key)
 
 
 def links(page):
@@ -166,8 +387,8 @@ def links(page):
         return _links[document][pageNumber]
     except KeyError:
         with lock(document):
-            links = rectangles.Rectangles(document.page(pageNumber).links(),
-                                        lambda link: link.linkArea().normalized().getCoords())
+            links = rectangles.Grid(document.page(pageNumber).links(),
+                                    lambda link: link.linkArea().normalized().getCoords())
         _links.setdefault(document, {})[pageNumber] = links
         return links
 
@@ -208,78 +429,229 @@ def setoptions(options, document=None):
 
 
 class Scheduler(object):
-    """Manages running rendering jobs in sequence for a Document."""
-    def __init__(self):
+    """Manages running rendering jobs for a Document.
+    
+    Visible pages are rendered first, and jobs for pages that have scrolled
+    out of view are dropped. If the PDF data of the document is registered
+    using setdata(), up to workers() jobs run at the same time, each using
+    its own copy of the Poppler.Document.
+    
+    """
+    def __init__(self, document):
+        self._document = weakref.ref(document)
         self._schedule = []     # order
         self._jobs = {}         # jobs on key
-        self._waiting = weakref.WeakKeyDictionary()      # jobs on page
-        self._running = None
+        self._waiting = weakref.WeakKeyDictionary()      # list of jobs on page
+        self._running = {}      # runners on job
+        self._copies = []       # unused independent copies of the document
+        self._ncopies = 0       # number of copies made
         
-    def schedulejob(self, page):
+    def schedulejob(self, page, prefetch=False, tile=None):
         """Creates or retriggers an existing Job.
         
-        If a Job was already scheduled for the page, it is canceled.
+        If a Job was already scheduled for the page, it is canceled, unless
+        both jobs render a tile of the page at the same size.
         The page's update() method will be called when the Job has completed.
         
+        If prefetch is True, the page is not displayed yet; the job gets the
+        lowest priority and the page's update() method is not called.
+        
+        If a tile is given, only that part of the page is rendered.
+        
         """
         # uniquely identify the image to be generated
         key = (page.pageNumber(), page.rotation(), page.width(), page.height())
+        if tile is not None:
+            key += (tile.x(), tile.y())
         try:
             job = self._jobs[key]
         except KeyError:
-            job = self._jobs[key] = Job(page)
+            job = self._jobs[key] = Job(page, tile)
             job.key = key
+            job.prefetch = prefetch
         else:
+            if prefetch:
+                return
+            job.prefetch = False
             self._schedule.remove(job)
         self._schedule.append(job)
-        self._waiting[page] = job
+        if not prefetch:
+            jobs = self._waiting.get(page)
+            if tile is None or not jobs or jobs[0].tile is None or jobs[0].key[:4] != key[:4]:
+                jobs = self._waiting[page] = []
+            if job not in jobs:
+                jobs.append(job)
         self.checkStart()
         
     def checkStart(self):
-        """Starts a job if none is running and at least one is waiting."""
-        while self._schedule and not self._running:
-            job = self._schedule[-1]
-            document = job.document()
-            if document and job in self._waiting.values():
-                self._running = Runner(self, document, job)
+        """Starts jobs while jobs are waiting and a document is available to render with.
+        
+        At most workers() jobs run at the same time, unused copies of the
+        document above that number are dropped.
+        
+        """
+        while self._copies and self._ncopies + 1 > workers():
+            del self._copies[-1]
+            self._ncopies -= 1
+        document = self._document()
+        while document and self._schedule and len(self._running) < workers():
+            if not any(r.renderdoc is document for r in self._running.values()):
+                renderdoc = document
+            elif self.copy(document):
+                renderdoc = None
+            else:
+                break
+            job = self.nextJob()
+            if not job:
                 break
+            if renderdoc is None:
+                renderdoc = self._copies.pop()
+            self._running[job] = Runner(self, document, job, renderdoc)
+    
+    def copy(self, document):
+        """Returns True if an unused independent copy of the document is available.
+        
+        Creates a new copy if possible.
+        
+        """
+        if self._copies:
+            return True
+        if self._ncopies + 1 < workers():
+            data = _data.get(document)
+            if data is not None:
+                copy = popplerqt4.Poppler.Document.loadFromData(data)
+                if copy:
+                    self._ncopies += 1
+                    self._copies.append(copy)
+                    return True
+        return False
+    
+    def nextJob(self):
+        """Returns the most urgent job that is not running yet.
+        
+        Jobs that have no waiting pages anymore and jobs of which all pages are
+        known to be out of view are dropped. Visible pages come first, in the
+        order of their position; the other jobs are handled latest first.
+        Prefetch jobs come last, in the order they were scheduled, and are
+        dropped when their page has changed size or has disappeared.
+        
+        """
+        pages = {}
+        for page, jobs in self._waiting.items():
+            for job in jobs:
+                pages.setdefault(job, []).append(page)
+        best, bestkey = None, None
+        for index, job in enumerate(self._schedule):
+            if job in self._running:
+                continue
+            if job.prefetch:
+                page = job.page()
+                if not page or (page.width(), page.height()) != (job.width, job.height):
+                    self.drop(job)
+                    continue
+                key = (2, index)
+                if bestkey is None or key < bestkey:
+                    best, bestkey = job, key
+                continue
+            visible = [_visible(page, job.tile) for page in pages.get(job, ())]
+            if not visible or all(v is False for v in visible):
+                self.drop(job, pages.get(job, ()))
+                continue
+            rects = [_rect(page, job.tile) for page, v in zip(pages[job], visible) if v]
+            if rects:
+                key = (0, min((r.top(), r.left()) for r in rects))
             else:
-                self.done(job)
+                key = (1, -index)
+            if bestkey is None or key < bestkey:
+                best, bestkey = job, key
+        return best
+    
+    def drop(self, job, pages=()):
+        """Removes a job that is not needed anymore, without updating the pages."""
+        del self._jobs[job.key]
+        self._schedule.remove(job)
+        for page in pages:
+            self._unwait(page, job)
+    
+    def _unwait(self, page, job):
+        """Removes the job from the jobs the page is waiting for."""
+        jobs = self._waiting[page]
+        jobs.remove(job)
+        if not jobs:
+            del self._waiting[page]
             
-    def done(self, job):
+    def done(self, job, renderdoc):
         """Called when the job has completed."""
+        global _prefetched
+        if job.prefetch:
+            _prefetched += 1
         del self._jobs[job.key]
         self._schedule.remove(job)
-        self._running = None
-        for page in list(self._waiting):
-            if self._waiting[page] is job:
+        del self._running[job]
+        if renderdoc is not self._document():
+            self._copies.append(renderdoc)
+        for page, jobs in list(self._waiting.items()):
+            if job in jobs:
                 page.update()
-                del self._waiting[page]
+                self._unwait(page, job)
+
+
+def _rect(page, tile=None):
+    """Returns the rectangle of the page or the tile of it, relative to the layout."""
+    if tile is None:
+        return page.rect()
+    return tile.translated(page.pos())
+
+
+def _visible(page, tile=None):
+    """Returns whether the page (or tile of it) is visible in the view of its layout.
+    
+    Returns None if that is not known, e.g. if the page has no layout.
+    
+    """
+    try:
+        layout = page.layout()
+    except AttributeError:
+        return
+    if layout:
+        rect = layout.visibleRect()
+        if not rect.isNull():
+            return _rect(page, tile).intersects(rect)
 
 
 class Job(object):
     """Simply contains data needed to create an image later."""
-    def __init__(self, page):
+    prefetch = False
+    
+    def __init__(self, page, tile=None):
+        self.page = weakref.ref(page)
         self.document = weakref.ref(page.document())
         self.pageNumber = page.pageNumber()
         self.rotation = page.rotation()
         self.width = page.width()
         self.height = page.height()
+        self.tile = tile
 
 
 class Runner(QThread):
-    """Immediately runs a Job in a background thread."""
-    def __init__(self, scheduler, document, job):
+    """Immediately runs a Job in a background thread.
+    
+    The page is rendered using renderdoc, which is the document itself or an
+    independent copy of it.
+    
+    """
+    def __init__(self, scheduler, document, job, renderdoc):
         super(Runner, self).__init__()
         self.scheduler = scheduler
         self.job = job
         self.document = document # keep reference now so that it does not die during this thread
+        self.renderdoc = renderdoc
         self.finished.connect(self.slotFinished)
         self.start()
         
     def run(self):
         """Main method of this thread, called by Qt on start()."""
-        page = self.document.page(self.job.pageNumber)
+        page = self.renderdoc.page(self.job.pageNumber)
         pageSize = page.pageSize()
         if self.job.rotation & 1:
             pageSize.transpose()
@@ -287,16 +659,19 @@ class Runner(QThread):
         yres = 72.0 * self.job.height / pageSize.height()
         threshold = options().oversampleThreshold() or options(self.document).oversampleThreshold()
         multiplier = 2 if xres < threshold else 1
-        with lock(self.document):
-            options().write(self.document)
-            options(self.document).write(self.document)
-            self.image = page.renderToImage(xres * multiplier, yres * multiplier, 0, 0, self.job.width * multiplier, self.job.height * multiplier, self.job.rotation)
+        tile = self.job.tile or QRect(0, 0, self.job.width, self.job.height)
+        with lock(self.renderdoc):
+            options().write(self.renderdoc)
+            options(self.document).write(self.renderdoc)
+            self.image = page.renderToImage(xres * multiplier, yres * multiplier,
+                tile.x() * multiplier, tile.y() * multiplier,
+                tile.width() * multiplier, tile.height() * multiplier, self.job.rotation)
         if multiplier == 2:
-            self.image = self.image.scaledToWidth(self.job.width, Qt.SmoothTransformation)
+            self.image = self.image.scaledToWidth(tile.width(), Qt.SmoothTransformation)
         
     def slotFinished(self):
         """Called when the thread has completed."""
-        add(self.image, self.document, self.job.pageNumber, self.job.rotation, self.job.width, self.job.height)
-        self.scheduler.done(self.job)
+        add(self.image, self.document, self.job.pageNumber, self.job.rotation,
+            self.job.width, self.job.height, self.job.tile)
+        self.scheduler.done(self.job, self.renderdoc)
         self.scheduler.checkStart()
-
@@ -22,6 +22,7 @@
 Manages and positions a group of Page instances.
 """
 
+import bisect
 import weakref
 
 from PyQt4.QtCore import QObject, QPoint, QRect, QSize, Qt, pyqtSignal
@@ -58,6 +59,9 @@ class AbstractLayout(QObject):
         self._scale = 1.0
         self._scaleChanged = False
         self._dpi = (72, 72)
+        self._visibleRect = QRect()
+        self._pageIndex = None      # maps (document, pageNumber) to Page
+        self._positionIndex = None  # see setPositionIndex()
         
     def own(self, page):
         """(Internal) Makes the page have ourselves as layout."""
@@ -65,10 +69,12 @@ class AbstractLayout(QObject):
             page.layout().remove(page)
         page._layout = weakref.ref(self)
         page.computeSize()
+        self._pageIndex = self._positionIndex = None
     
     def disown(self, page):
         """(Internal) Removes ourselves as owner of the page."""
         page._layout = lambda: None
+        self._pageIndex = self._positionIndex = None
         
     def append(self, page):
         self.own(page)
@@ -243,6 +249,20 @@ class AbstractLayout(QObject):
         """
         pass
     
+    def setVisibleRect(self, rect):
+        """Sets the rectangle of the layout that is currently visible in a view.
+        
+        The cache uses this to render visible pages first, and to drop
+        rendering jobs for pages that are not visible anymore.
+        A null QRect() (the default) means that it is unknown what is visible.
+        
+        """
+        self._visibleRect = QRect(rect)
+    
+    def visibleRect(self):
+        """Returns the rectangle set by setVisibleRect()."""
+        return self._visibleRect
+        
     def updatePage(self, page):
         """Called by the Page when an image has been generated."""
         self.redraw.emit(page.rect())
@@ -253,17 +273,11 @@ class AbstractLayout(QObject):
         Returns None if that page is not available.
         
         """
-        # Specific layouts may use faster algorithms to find the page.
-        try:
-            page = self[pageNumber]
-        except IndexError:
-            pass
-        else:
-            if page.document() == document:
-                return page
-        for page in self:
-            if page.document() == document and page.pageNumber() == pageNumber:
-                return page
+        if self._pageIndex is None:
+            # the first page wins if the same page is added more than once
+            self._pageIndex = dict(((page.document(), page.pageNumber()), page)
+                                   for page in reversed(self._pages))
+        return self._pageIndex.get((document, pageNumber))
     
     def pages(self):
         """Yields our pages that are visible()."""
@@ -271,19 +285,96 @@ class AbstractLayout(QObject):
             if page.visible():
                 yield page
         
+    def setPositionIndex(self, pages, orientation):
+        """Lets pageAt() and pagesAt() find pages using a binary search.
+        
+        Layouts can call this at the end of reLayout(), with the visible pages
+        in the order they are positioned along the orientation (Qt.Vertical or
+        Qt.Horizontal), without overlapping in that direction.
+        The index is cleared when pages are added or removed.
+        
+        """
+        pages = list(pages)
+        if orientation == Qt.Vertical:
+            spans = [(page.rect().top(), page.rect().bottom()) for page in pages]
+        else:
+            spans = [(page.rect().left(), page.rect().right()) for page in pages]
+        starts = [start for start, end in spans]
+        ends = [end for start, end in spans]
+        self._positionIndex = pages, starts, ends, orientation
+    
     def pageAt(self, point):
         """Returns the page that contains the given QPoint."""
-        # Specific layouts may use faster algorithms to find the page.
-        for page in self.pages():
-            if page.rect().contains(point):
+        if self._positionIndex is None:
+            for page in self.pages():
+                if page.rect().contains(point):
+                    return page
+            return
+        pages, starts, ends, orientation = self._positionIndex
+        pos = point.y() if orientation == Qt.Vertical else point.x()
+        i = bisect.bisect_right(starts, pos) - 1
+        if i >= 0:
+            page = pages[i]
+            if page.visible() and page.rect().contains(point):
                 return page
     
     def pagesAt(self, rect):
         """Yields the pages touched by the given QRect."""
-        # Specific layouts may use faster algorithms to find the pages.
-        for page in self.pages():
-            if page.rect().intersects(rect):
+        if self._positionIndex is None:
+            for page in self.pages():
+                if page.rect().intersects(rect):
+                    yield page
+            return
+        pages, starts, ends, orientation = self._positionIndex
+        if orientation == Qt.Vertical:
+            first, last = rect.top(), rect.bottom()
+        else:
+            first, last = rect.left(), rect.right()
+        for i in range(bisect.bisect_left(ends, first), len(pages)):
+            if starts[i] > last:
+                break
+            page = pages[i]
+            if page.visible() and page.rect().intersects(rect):
                 yield page
+    
+    def pagesAround(self, rect, count):
+        """Returns the pages touched by the given QRect and the pages around them.
+        
+        Returns a three-tuple (pages, before, after). pages is the list of the
+        pages touched by rect, before contains at most count pages preceding
+        them and after at most count pages following them, both starting with
+        the nearest page. Uses the position index, if set.
+        
+        """
+        if self._positionIndex is None:
+            pages = list(self.pages())
+            indices = [i for i, page in enumerate(pages) if page.rect().intersects(rect)]
+        else:
+            pages, starts, ends, orientation = self._positionIndex
+            if orientation == Qt.Vertical:
+                first, last = rect.top(), rect.bottom()
+            else:
+                first, last = rect.left(), rect.right()
+            indices = []
+            for i in range(bisect.bisect_left(ends, first), len(pages)):
+                if starts[i] > last:
+                    break
+                page = pages[i]
+                if page.visible() and page.rect().intersects(rect):
+                    indices.append(i)
+        if not indices:
+            return [], [], []
+        def around(indices):
+            result = []
+            for i in indices:
+                if len(result) == count:
+                    break
+                if pages[i].visible():
+                    result.append(pages[i])
+            return result
+        before = around(range(indices[0] - 1, -1, -1))
+        after = around(range(indices[-1] + 1, len(pages)))
+        return [pages[i] for i in indices], before, after
         
     def linkAt(self, point):
         """Returns (page, link) if pos points to a Poppler.Link in a Page, else (None, None)."""
@@ -349,6 +440,7 @@ class Layout(AbstractLayout):
                 top += page.height() + self._spacing
             top += self._margin - self._spacing
             self.setSize(QSize(width, top))
+            self.setPositionIndex(self.pages(), Qt.Vertical)
         else:
             height = self.maxHeight() + self._margin * 2
             left = self._margin
@@ -357,5 +449,6 @@ class Layout(AbstractLayout):
                 left += page.width() + self._spacing
             left += self._margin - self._spacing
             self.setSize(QSize(left, height))
+            self.setPositionIndex(self.pages(), Qt.Horizontal)
             
 
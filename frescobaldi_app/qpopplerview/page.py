@@ -23,6 +23,8 @@ A Page is resposible for drawing a page of a Poppler document
 inside a layout.
 """
 
+import time
+
 try:
     import popplerqt4
 except ImportError:
@@ -56,6 +58,7 @@ class Page(object):
         self._visible = True
         self._layout = lambda: None
         self._waiting = True # whether image still needs to be generated
+        self._waitStart = None # when we started waiting for an exact image
         
     def document(self):
         """Returns the document."""
@@ -179,27 +182,57 @@ class Page(object):
         if not update_rect:
             return
         image_rect = QRect(update_rect.topLeft() - self.rect().topLeft(), update_rect.size())
-        image = cache.image(self)
-        self._waiting = not image
-        if image:
-            painter.drawImage(update_rect, image, image_rect)
+        if cache.istiled(self):
+            # paint a mosaic of the tiles that are needed
+            waiting = False
+            for tile in cache.tiles(self, image_rect):
+                tile_rect = tile & image_rect
+                target_rect = tile_rect.translated(self.pos())
+                image = cache.image(self, tile=tile)
+                if image:
+                    painter.drawImage(target_rect, image, tile_rect.translated(-tile.topLeft()))
+                else:
+                    waiting = True
+                    cache.generate(self, tile)
+                    self.paintPlaceholder(painter, target_rect, tile_rect)
         else:
-            # schedule an image to be generated, if done our update() method is called
-            cache.generate(self)
-            # find suitable image to be scaled from other size
-            image = cache.image(self, False)
+            image = cache.image(self)
+            waiting = not image
             if image:
-                hscale = float(image.width()) / self.width()
-                vscale = float(image.height()) / self.height()
-                image_rect = QRectF(image_rect.x() * hscale, image_rect.y() * vscale,
-                                    image_rect.width() * hscale, image_rect.height() * vscale)
-                painter.drawImage(QRectF(update_rect), image, image_rect)
+                painter.drawImage(update_rect, image, image_rect)
             else:
-                # draw blank paper, using the background color of the cache rendering (if set)
-                # or from the document itself.
-                color = (cache.options(self.document()).paperColor()
-                         or cache.options().paperColor() or self.document().paperColor())
-                painter.fillRect(update_rect, color)
+                # schedule an image to be generated, if done our update() method is called
+                cache.generate(self)
+                self.paintPlaceholder(painter, update_rect, image_rect)
+        self._waiting = waiting
+        if waiting:
+            if self._waitStart is None:
+                self._waitStart = time.time()
+        elif self._waitStart is not None:
+            cache.waited(time.time() - self._waitStart)
+            self._waitStart = None
+    
+    def paintPlaceholder(self, painter, update_rect, image_rect):
+        """Paints a temporary image while the exact image is being generated.
+        
+        update_rect is the rectangle to paint (relative to the layout), and
+        image_rect the same rectangle, relative to ourselves.
+        
+        """
+        # find suitable image to be scaled from other size
+        image = cache.image(self, False)
+        if image:
+            hscale = float(image.width()) / self.width()
+            vscale = float(image.height()) / self.height()
+            image_rect = QRectF(image_rect.x() * hscale, image_rect.y() * vscale,
+                                image_rect.width() * hscale, image_rect.height() * vscale)
+            painter.drawImage(QRectF(update_rect), image, image_rect)
+        else:
+            # draw blank paper, using the background color of the cache rendering (if set)
+            # or from the document itself.
+            color = (cache.options(self.document()).paperColor()
+                     or cache.options().paperColor() or self.document().paperColor())
+            painter.fillRect(update_rect, color)
 
     def update(self):
         """Called when an image is drawn."""
@@ -210,7 +243,11 @@ class Page(object):
     def repaint(self):
         """Call this to force a repaint (e.g. when the rendering options are changed)."""
         self._waiting = True
-        cache.generate(self)
+        if cache.istiled(self):
+            # the needed tiles are generated when painting
+            self.update()
+        else:
+            cache.generate(self)
     
     def image(self, rect, xdpi=72.0, ydpi=None, options=None):
         """Returns a QImage of the specified rectangle (relative to our layout).
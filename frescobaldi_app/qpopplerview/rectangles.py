@@ -23,6 +23,7 @@ Manages lists of rectangular objects and quickly finds them.
 """
 
 import bisect
+import math
 
 
 Left   = 0
@@ -201,5 +202,122 @@ class Rectangles(object):
                 result = [], []
             self._index[side] = result
             return result
-            
 
+
+class Grid(Rectangles):
+    """
+    A Rectangles list that finds objects using a uniform grid of cells.
+    
+    Every object is stored in the cells its rectangle overlaps, so finding
+    the objects at a point only needs to look at the objects in one cell, and
+    finding objects in a rectangle only at the cells the rectangle covers.
+    This keeps searching fast on pages with thousands of objects.
+    
+    The grid is created on the first search, with about as many cells as
+    there are objects, covering the area of all objects.  Single objects can
+    be added and removed without recreating the grid.
+    
+    """
+    def __init__(self, objects=None, func=None):
+        self._grid = None
+        super(Grid, self).__init__(objects, func)
+        
+    def add(self, obj):
+        """Adds an object to our list. Keeps the index intact."""
+        if obj in self._items:
+            return
+        super(Grid, self).add(obj)
+        if self._grid is not None:
+            for cell in self._cells(*self._items[obj]):
+                self._grid.setdefault(cell, []).append(obj)
+    
+    def bulk_add(self, objects):
+        """Adds many new items to the index using the function given in the constructor.
+        
+        After this, the index is cleared and recreated on the first search operation.
+        
+        """
+        super(Grid, self).bulk_add(objects)
+        self._grid = None
+    
+    def remove(self, obj):
+        """Removes an object from our list. Keeps the index intact."""
+        coords = self._items[obj]
+        super(Grid, self).remove(obj)
+        if self._grid is not None:
+            for cell in self._cells(*coords):
+                self._grid[cell].remove(obj)
+    
+    def clear(self):
+        """Empties the list of items."""
+        super(Grid, self).clear()
+        self._grid = None
+    
+    def at(self, x, y):
+        """Returns a set() of objects that are touched by the given point."""
+        items = self._items
+        return set(obj for obj in self._candidates(x, y, x, y)
+            if items[obj][Left] <= x <= items[obj][Right]
+            and items[obj][Top] <= y <= items[obj][Bottom])
+    
+    def inside(self, left, top, right, bottom):
+        """Returns a set() of objects that are fully in the given rectangle."""
+        items = self._items
+        return set(obj for obj in self._candidates(left, top, right, bottom)
+            if left <= items[obj][Left] and items[obj][Right] <= right
+            and top <= items[obj][Top] and items[obj][Bottom] <= bottom)
+    
+    def intersecting(self, left, top, right, bottom):
+        """Returns a set() of objects intersecting the given rectangle."""
+        items = self._items
+        return set(obj for obj in self._candidates(left, top, right, bottom)
+            if items[obj][Left] <= right and left <= items[obj][Right]
+            and items[obj][Top] <= bottom and top <= items[obj][Bottom])
+    
+    # private helper methods
+    def _candidates(self, left, top, right, bottom):
+        """Yields the objects in the cells covering the rectangle.
+        
+        Objects spanning multiple cells can be yielded more than once.
+        
+        """
+        grid = self._getgrid()
+        for cell in self._cells(left, top, right, bottom):
+            for obj in grid.get(cell, ()):
+                yield obj
+    
+    def _cells(self, left, top, right, bottom):
+        """Yields the (column, row) tuples of the cells covering the rectangle.
+        
+        Coordinates outside the grid are moved to the cells at its border, so
+        objects added later outside the area of the grid are found as well.
+        
+        """
+        x, y, width, height, count = self._geometry
+        last = count - 1
+        col1 = min(last, max(0, int((left - x) / width)))
+        col2 = min(last, max(0, int((right - x) / width)))
+        row1 = min(last, max(0, int((top - y) / height)))
+        row2 = min(last, max(0, int((bottom - y) / height)))
+        for col in range(col1, col2 + 1):
+            for row in range(row1, row2 + 1):
+                yield col, row
+    
+    def _getgrid(self):
+        """Returns the dictionary mapping cells to objects, creating it if needed."""
+        if self._grid is None:
+            if self._items:
+                coords = list(self._items.values())
+                x = min(c[Left] for c in coords)
+                y = min(c[Top] for c in coords)
+                count = max(1, int(math.sqrt(len(coords))))
+                width = (max(c[Right] for c in coords) - x) / float(count) or 1.0
+                height = (max(c[Bottom] for c in coords) - y) / float(count) or 1.0
+                self._geometry = x, y, width, height, count
+            else:
+                self._geometry = 0, 0, 1.0, 1.0, 1
+            self._grid = grid = {}
+            for obj, coords in self._items.items():
+                for cell in self._cells(*coords):
+                    grid.setdefault(cell, []).append(obj)
+        return self._grid
@@ -35,6 +35,7 @@ try:
 except ImportError:
     from . import popplerqt4_dummy as popplerqt4
 
+from . import cache
 from . import layout
 from . import page
 from . import highlight
@@ -267,9 +268,11 @@ class Surface(QWidget):
     def paintEvent(self, ev):
         """Handle PaintEvent on the surface to highlight the selection."""
         painter = QPainter(self)
+        self.pageLayout().setVisibleRect(self.viewportRect())
         pages = list(self.pageLayout().pagesAt(ev.rect()))
         for page in pages:
             page.paint(painter, ev.rect())
+        cache.prefetch(self.pageLayout())
         
         for highlighter, (d, t) in self._highlights.items():
             rects = []
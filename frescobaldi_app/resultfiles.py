@@ -29,6 +29,7 @@ import os
 
 import app
 import documentinfo
+import jobattributes
 import jobmanager
 import plugin
 import util
@@ -40,8 +41,8 @@ def results(document):
 
 # Set the basenames of the resulting documents to expect when a job starts
 @app.jobStarted.connect
-def _init_basenames(document):
-    results(document).saveDocumentInfo()
+def _init_basenames(document, job):
+    results(document).saveDocumentInfo(job)
     
 
 
@@ -52,7 +53,7 @@ class Results(plugin.DocumentPlugin):
         self._basenames = None
         document.saved.connect(self.forgetDocumentInfo)
         
-    def saveDocumentInfo(self):
+    def saveDocumentInfo(self, job=None):
         """Takes over some vital information from a DocumentInfo instance.
         
         The file a job is run on and the basenames expected to be created are saved.
@@ -63,7 +64,15 @@ class Results(plugin.DocumentPlugin):
         document was modified but saving it would result in DocumentInfo.jobinfo()[0] pointing
         to the real document instead.
         
+        If the job has the jobfile and basenames attributes set (see jobattributes),
+        those are used instead, e.g. for a Job that engraves a part of the document.
+        
         """
+        attrs = jobattributes.get(job) if job else None
+        if attrs and attrs.jobfile:
+            self._jobfile = attrs.jobfile
+            self._basenames = attrs.basenames
+            return
         info = documentinfo.info(self.document())
         self._jobfile = info.jobinfo()[0]
         self._basenames = info.basenames()
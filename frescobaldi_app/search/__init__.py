@@ -27,7 +27,7 @@ import bisect
 import re
 import weakref
 
-from PyQt4.QtCore import QEvent, Qt
+from PyQt4.QtCore import QEvent, QPoint, Qt
 from PyQt4.QtGui import (
     QAction, QApplication, QCheckBox, QGridLayout, QKeySequence, QLabel,
     QLineEdit, QPalette, QPushButton, QStyle, QTextCursor, QToolButton, QWidget)
@@ -42,12 +42,16 @@ import wordboundary
 import viewhighlighter
 import widgets.borderlayout
 
+from . import engine
+
 
 class Search(QWidget, plugin.MainWindowPlugin):
     def __init__(self, mainwindow):
         super(Search, self).__init__(mainwindow)
         self._currentView = None
-        self._positions = None
+        self._engine = engine.Engine()
+        self._engine.changed.connect(self.slotEngineChanged)
+        self._highlighting = False
         self._replace = False  # are we in replace mode?
         
         mainwindow.currentViewChanged.connect(self.viewChanged)
@@ -125,7 +129,15 @@ class Search(QWidget, plugin.MainWindowPlugin):
         return self._currentView and self._currentView()
     
     def setCurrentView(self, view):
+        old = self.currentView()
+        if old:
+            try:
+                old.verticalScrollBar().valueChanged.disconnect(self.updateHighlighting)
+            except (RuntimeError, TypeError):
+                pass
         self._currentView = weakref.ref(view) if view else None
+        if view:
+            view.verticalScrollBar().valueChanged.connect(self.updateHighlighting)
         
     def showWidget(self):
         if self.isVisible():
@@ -205,75 +217,107 @@ class Search(QWidget, plugin.MainWindowPlugin):
     def slotSearchChanged(self):
         self.updatePositions()
         self.highlightingOn()
-        if not self._replace and self._positions:
-            positions = [c.position() for c in self._positions]
+        if not self._replace and self._engine.document():
             cursor = self.currentView().textCursor()
-            index = bisect.bisect_left(positions, cursor.selectionStart())
-            if index == len(positions):
+            self._engine.ensure(cursor.selectionStart())
+            starts, ends = self._engine.starts(), self._engine.ends()
+            if not starts:
+                return
+            index = bisect.bisect_left(starts, cursor.selectionStart())
+            if index == len(starts):
                 index -= 1
             elif index > 0:
                 # it might be possible that the text cursor currently already
                 # is in a search result. This happens when the search is pop up
                 # with an empty text and the current word is then set as search
                 # text.
-                if cursortools.contains(self._positions[index-1], cursor):
+                if (starts[index-1] <= cursor.selectionStart()
+                    and ends[index-1] >= cursor.selectionEnd()):
                     index -= 1
-            self.currentView().setTextCursor(self._positions[index])
+            self.currentView().setTextCursor(self._engine.cursor(index))
 
     def highlightingOn(self, view=None):
+        """Highlights the search results in the visible part of the view."""
         if view is None:
             view = self.currentView()
         if view:
-            viewhighlighter.highlighter(view).highlight("search", self._positions, 1)
+            self._highlighting = True
+            viewport = view.viewport()
+            start = view.cursorForPosition(QPoint(0, 0)).position()
+            end = view.cursorForPosition(QPoint(viewport.width(), viewport.height())).position()
+            # also highlight the page above and below, for smooth scrolling
+            size = end - start
+            cursors = self._engine.cursors(max(0, start - size), end + size)
+            viewhighlighter.highlighter(view).highlight("search", cursors, 1)
     
     def highlightingOff(self, view=None):
         if view is None:
             view = self.currentView()
         if view:
+            self._highlighting = False
             viewhighlighter.highlighter(view).clear("search")
-            
+    
+    def updateHighlighting(self):
+        """Called when the view scrolls or the search results change."""
+        if self._highlighting and self.isVisible():
+            self.highlightingOn()
+    
+    def slotEngineChanged(self):
+        """Called when the search engine found new results."""
+        self.updateCount()
+        self.updateHighlighting()
+    
+    def updateCount(self):
+        """Displays the number of matches, with a '+' if the search is not complete."""
+        count = format(self._engine.count())
+        if not self._engine.isDone():
+            count += "+"
+        self.countLabel.setText(count)
+    
     def updatePositions(self):
+        """Starts searching the document in the background."""
         search = self.searchEntry.text()
         view = self.currentView()
         document = view.document()
-        self._positions = []
+        rx = None
         if search:
-            text = document.toPlainText()
             flags = re.MULTILINE | re.DOTALL
             if not self.caseCheck.isChecked():
                 flags |= re.IGNORECASE
             if not self.regexCheck.isChecked():
                 search = re.escape(search)
             try:
-                matches = re.finditer(search, text, flags)
+                rx = re.compile(search, flags)
             except re.error:
                 pass
-            else:
-                for m in matches:
-                    c = QTextCursor(document)
-                    c.setPosition(m.end())
-                    c.setPosition(m.start(), QTextCursor.KeepAnchor)
-                    self._positions.append(c)
-        self.countLabel.setText(format(len(self._positions)))
+        self._engine.search(document, rx)
+        self.updateCount()
         
     def findNext(self):
         view = self.currentView()
-        if view and self._positions:
-            positions = [c.position() for c in self._positions]
-            index = bisect.bisect_right(positions, view.textCursor().position())
-            if index < len(positions):
-                view.setTextCursor(self._positions[index])
-            else:
-                view.setTextCursor(self._positions[0])
-            view.ensureCursorVisible()
+        if view and self._engine.document():
+            position = view.textCursor().position()
+            self._engine.ensure(position + 1)
+            starts = self._engine.starts()
+            if starts:
+                index = bisect.bisect_right(starts, position)
+                if index == len(starts):
+                    index = 0
+                view.setTextCursor(self._engine.cursor(index))
+                view.ensureCursorVisible()
 
     def findPrevious(self):
         view = self.currentView()
-        positions = [c.position() for c in self._positions]
-        if view and positions:
-            index = bisect.bisect_left(positions, view.textCursor().position()) - 1
-            view.setTextCursor(self._positions[index])
-            view.ensureCursorVisible()
+        if view and self._engine.document():
+            position = view.textCursor().position()
+            self._engine.ensure(position)
+            index = bisect.bisect_left(self._engine.starts(), position) - 1
+            if index < 0:
+                self._engine.complete()
+                index = self._engine.count() - 1
+            if index >= 0:
+                view.setTextCursor(self._engine.cursor(index))
+                view.ensureCursorVisible()
 
     def event(self, ev):
         if ev == QKeySequence.HelpContents:
@@ -296,7 +340,7 @@ class Search(QWidget, plugin.MainWindowPlugin):
         
     def keyPressEvent(self, ev):
         # if in search mode, Up and Down jump between search results
-        if not self._replace and self._positions and self.searchEntry.text() and not ev.modifiers():
+        if not self._replace and self._engine.count() and self.searchEntry.text() and not ev.modifiers():
             if ev.key() == Qt.Key_Up:
                 self.findPrevious()
                 return
@@ -331,31 +375,43 @@ class Search(QWidget, plugin.MainWindowPlugin):
         
     def slotReplace(self):
         view = self.currentView()
-        if view and self._positions:
-            positions = [c.position() for c in self._positions]
-            index = bisect.bisect_left(positions, view.textCursor().position())
-            if index >= len(positions):
+        if view and self._engine.document():
+            position = view.textCursor().position()
+            self._engine.ensure(position)
+            starts = self._engine.starts()
+            if not starts:
+                return
+            index = bisect.bisect_left(starts, position)
+            if index >= len(starts):
                 index = 0
-            if self.doReplace(self._positions[index]):
+            cursor = self._engine.cursor(index)
+            if self.doReplace(cursor):
+                # the engine has updated the matches after the replacement
+                end = cursor.selectionEnd()
+                self._engine.ensure(end)
+                starts = self._engine.starts()
+                if starts:
+                    index = bisect.bisect_left(starts, end)
+                    if index >= len(starts):
+                        index = 0
+                    view.setTextCursor(self._engine.cursor(index))
                 self.highlightingOn(view)
-                if index < len(positions) - 1:
-                    view.setTextCursor(self._positions[index+1])
-                else:
-                    view.setTextCursor(self._positions[0])
-                del self._positions[index]
                 view.ensureCursorVisible()
     
     def slotReplaceAll(self):
         view = self.currentView()
-        if view:
+        if view and self._engine.document():
             replaced = False
-            cursors = self._positions
+            cursors = self._engine.cursors()
             if view.textCursor().hasSelection():
                 cursors = [cursor for cursor in cursors if cursortools.contains(view.textCursor(), cursor)]
+            # do not update the matches after every single replacement
+            self._engine.stop()
             with cursortools.compress_undo(view.textCursor()):
                 for cursor in cursors:
                     if self.doReplace(cursor):
                         replaced = True
+            self.updatePositions()
             if replaced:
                 self.highlightingOn()
 
@@ -0,0 +1,280 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Finds all matches of a regular expression in a document, in the background.
+
+The matches are stored as two sorted lists with the start and end positions,
+and QTextCursors are only created when a match is actually needed.
+
+The document is searched in slices of at most a few milliseconds, so the
+user interface stays responsive, even for a pattern that matches very often.
+When the document changes, only the changed region is searched again, until
+the new matches coincide with the old ones. For a pattern that can match
+across lines, this starts at the last old match that still matches the same
+text; otherwise at the start of the changed line.
+
+"""
+
+from __future__ import unicode_literals
+
+import bisect
+import re
+import time
+
+from PyQt4.QtCore import QTimer
+from PyQt4.QtGui import QTextCursor
+
+import signals
+
+
+# the time in seconds a search slice may take
+budget = 0.02
+
+# how many matches to find before looking at the time again
+_check = 100
+
+# pattern tokens that can match a newline (the patterns use DOTALL)
+_multiline_tokens = frozenset(('.', '\n', '[^',
+    r'\n', r'\s', r'\S', r'\W', r'\D', r'\x', r'\0', '\\u', '\\U'))
+
+
+def multiline(regexp):
+    """Returns True if the matches of regexp may span more than one line."""
+    for token in re.findall(r'\\.|\[\^|.', regexp.pattern, re.DOTALL):
+        if token in _multiline_tokens:
+            return True
+    return False
+
+
+class Engine(object):
+    """Finds the matches of a compiled regular expression in a QTextDocument."""
+    
+    changed = signals.Signal()  # emitted when matches are added or changed
+    
+    def __init__(self):
+        self._document = None
+        self._regexp = None
+        self._text = None
+        self._starts = []
+        self._ends = []
+        self._scanpos = 0
+        self._done = True
+        self._multiline = False
+        self._timer = QTimer(singleShot=True, timeout=self._slice)
+    
+    def search(self, document, regexp):
+        """Starts searching regexp in the document (None stops searching)."""
+        if self._document:
+            self._document.contentsChange.disconnect(self.slotContentsChange)
+        self._timer.stop()
+        self._text = None
+        self._starts = []
+        self._ends = []
+        self._scanpos = 0
+        self._done = not (document and regexp)
+        if self._done:
+            self._document = self._regexp = None
+        else:
+            self._document = document
+            self._regexp = regexp
+            self._multiline = multiline(regexp)
+            document.contentsChange.connect(self.slotContentsChange)
+            self._timer.start()
+    
+    def stop(self):
+        """Stops searching and forgets all matches."""
+        self.search(None, None)
+    
+    def document(self):
+        """Returns the document we are searching."""
+        return self._document
+    
+    def isDone(self):
+        """Returns True if the whole document has been searched."""
+        return self._done
+    
+    def count(self):
+        """Returns the number of matches found so far."""
+        return len(self._starts)
+    
+    def starts(self):
+        """Returns the sorted list of the start positions of the matches."""
+        return self._starts
+    
+    def ends(self):
+        """Returns the sorted list of the end positions of the matches."""
+        return self._ends
+    
+    def text(self):
+        """Returns the (cached) text of the document."""
+        if self._text is None:
+            self._text = self._document.toPlainText()
+        return self._text
+    
+    def complete(self):
+        """Searches the rest of the document at once."""
+        if not self._done:
+            self._timer.stop()
+            self._scan()
+            self.changed()
+    
+    def ensure(self, position):
+        """Searches until there is a match starting at or after position.
+        
+        After this method returns, either such a match is found or the whole
+        document has been searched.
+        
+        """
+        if not self._done and (not self._starts or self._starts[-1] < position):
+            self._timer.stop()
+            self._scan(until=position)
+            if not self._done:
+                self._timer.start()
+            self.changed()
+    
+    def cursor(self, index):
+        """Returns a QTextCursor selecting the match with index.
+        
+        The position is at the start of the match, the anchor at the end.
+        
+        """
+        c = QTextCursor(self._document)
+        c.setPosition(self._ends[index])
+        c.setPosition(self._starts[index], QTextCursor.KeepAnchor)
+        return c
+    
+    def cursors(self, start=0, end=None):
+        """Returns QTextCursors for the matches between start and end.
+        
+        If the region is not yet searched, it is searched separately, without
+        storing the matches, so that e.g. the visible part of a document
+        can be highlighted before the search is complete. If end is None,
+        the search is completed first.
+        
+        """
+        if end is None:
+            self.complete()
+        if self._done or end < self._scanpos:
+            first = bisect.bisect_left(self._ends, start)
+            if end is None:
+                last = len(self._starts)
+            else:
+                last = bisect.bisect_right(self._starts, end)
+            return [self.cursor(i) for i in range(first, last)]
+        text = self.text()
+        cursors = []
+        for m in self._regexp.finditer(text, text.rfind('\n', 0, start) + 1):
+            if m.start() > end:
+                break
+            elif m.end() >= start:
+                c = QTextCursor(self._document)
+                c.setPosition(m.end())
+                c.setPosition(m.start(), QTextCursor.KeepAnchor)
+                cursors.append(c)
+        return cursors
+    
+    def _slice(self):
+        """Called by the timer, searches during at most budget seconds."""
+        if self._done:
+            return
+        self._scan(time.time() + budget)
+        if not self._done:
+            self._timer.start()
+        self.changed()
+    
+    def _scan(self, deadline=None, until=None):
+        """Searches from the scan position.
+        
+        Stops before the first match that is found after the deadline, or
+        that follows a match starting at or after until.
+        
+        """
+        starts, ends = self._starts, self._ends
+        count = 0
+        for m in self._regexp.finditer(self.text(), self._scanpos):
+            count += 1
+            if ((deadline and count % _check == 0 and time.time() > deadline)
+                or (until is not None and starts and starts[-1] >= until)):
+                # resuming at the start of this match finds it again
+                self._scanpos = m.start()
+                return
+            starts.append(m.start())
+            ends.append(m.end())
+        self._scanpos = len(self.text())
+        self._done = True
+    
+    def slotContentsChange(self, position, removed, added):
+        """Called when the document changes, updates the matches."""
+        self._text = None
+        text = self.text()
+        delta = added - removed
+        starts, ends = self._starts, self._ends
+        if self._multiline:
+            # a match may start on an earlier line, search again from the
+            # last match before the change that is still the same
+            i = bisect.bisect_left(ends, position)
+            start = 0
+            while i:
+                i -= 1
+                m = self._regexp.match(text, starts[i])
+                if m and m.span() == (starts[i], ends[i]):
+                    start = starts[i]
+                    break
+        else:
+            # search again from the start of the changed line
+            start = text.rfind('\n', 0, position) + 1
+            i = bisect.bisect_left(ends, start)
+            if i < len(starts):
+                start = min(start, starts[i])
+        if start >= self._scanpos and not self._done:
+            return
+        # the old matches after the change, moved
+        j = bisect.bisect_left(starts, position + removed)
+        tail = [(s + delta, e + delta) for s, e in zip(starts[j:], ends[j:])]
+        scanpos = self._scanpos + delta
+        del starts[i:], ends[i:]
+        changed_end = position + added
+        t = 0
+        deadline = time.time() + budget
+        count = 0
+        for m in self._regexp.finditer(text, start):
+            count += 1
+            s, e = m.span()
+            while t < len(tail) and tail[t][0] < s:
+                t += 1
+            if t < len(tail) and tail[t] == (s, e) and s > changed_end:
+                # the matches are the same again, keep the rest
+                starts.extend(s for s, e in tail[t:])
+                ends.extend(e for s, e in tail[t:])
+                self._scanpos = scanpos
+                break
+            if s >= scanpos or (count % _check == 0 and time.time() > deadline):
+                # continue in the background
+                self._scanpos = s
+                self._done = False
+                self._timer.start()
+                break
+            starts.append(s)
+            ends.append(e)
+        else:
+            self._scanpos = len(text)
+            self._done = True
+            self._timer.stop()
+        self.changed()
@@ -474,29 +474,78 @@ class FallthroughParser(Parser):
 
 
 class Fridge(object):
-    """Stores frozen States under an integer number."""
-    def __init__(self, stateClass = State):
+    """Stores frozen States under an integer number.
+    
+    Frozen states are interned in a dictionary, so storing a state that is
+    already in the Fridge does not depend on the number of stored states.
+    
+    The numbers returned by freeze() are never reused. If maxcount is given,
+    full() returns True as soon as more than maxcount states are stored; the
+    owner of the Fridge can then call compact() with the numbers it still uses
+    to remove all other states. After compaction, the limit is raised to twice
+    the number of states that were kept (but never lower than maxcount), so
+    a long-lived Fridge does not grow without limit, while compacting remains
+    cheap on average.
+    
+    """
+    def __init__(self, stateClass = State, maxcount = None):
         self._stateClass = stateClass
-        self._states = []
+        self._states = {}
+        self._numbers = {}
+        self._next = 0
+        self._maxcount = self._limit = maxcount
     
     def freeze(self, state):
         """Stores a state and return an identifying integer."""
-        frozen = state.freeze()
+        return self.store(state.freeze())
+    
+    def store(self, frozen):
+        """Stores an already frozen state and return an identifying integer.
+        
+        The frozen state is a tuple as returned by State.freeze().
+        
+        """
         try:
-            return self._states.index(frozen)
-        except ValueError:
-            i = len(self._states)
-            self._states.append(frozen)
-            return i
+            return self._numbers[frozen]
+        except KeyError:
+            num = self._numbers[frozen] = self._next
+            self._states[num] = frozen
+            self._next += 1
+            return num
 
     def thaw(self, num):
         """Returns the state stored under the specified number."""
-        if 0 <= num < len(self._states):
-            return self._stateClass.thaw(self._states[num])
+        try:
+            frozen = self._states[num]
+        except KeyError:
+            return
+        return self._stateClass.thaw(frozen)
 
     def count(self):
         """Returns the number of stored frozen states."""
         return len(self._states)
+    
+    def full(self):
+        """Returns True if the Fridge should be compacted.
+        
+        This is never the case if no maxcount was given on construction.
+        
+        """
+        return self._limit is not None and len(self._states) > self._limit
+    
+    def compact(self, keep):
+        """Removes all frozen states whose number is not in the keep iterable.
+        
+        The numbers of the kept states remain valid.
+        
+        """
+        keep = set(keep)
+        self._states = dict((num, frozen)
+            for num, frozen in self._states.items() if num in keep)
+        self._numbers = dict((frozen, num)
+            for num, frozen in self._states.items())
+        if self._maxcount is not None:
+            self._limit = max(self._maxcount, len(self._states) * 2)
 
 
 def uniq(iterable):
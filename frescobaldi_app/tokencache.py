@@ -0,0 +1,210 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Persistent on-disk cache of the tokens of files.
+
+For every file, the token boundaries and classes and the frozen lexer state
+at the end of every line are stored in the user's cache directory. When the
+same file is loaded again (in a later session) and its size and modification
+time did not change, a ly.document.Document can be restored without
+tokenizing the text again.
+
+The cache files are marshalled and compressed. The least recently used files
+are removed when the cache becomes larger than maxsize() bytes.
+
+"""
+
+from __future__ import unicode_literals
+
+import hashlib
+import importlib
+import marshal
+import os
+import sys
+import zlib
+
+import ly.document
+import ly.pkginfo
+import util
+
+
+# increase this when the file format changes
+_FORMAT = 1
+
+# the lexer version: cache files of other versions are not used
+_VERSION = (_FORMAT, ly.pkginfo.version, sys.version_info[:2])
+
+_maxsize = 50 * 1024 * 1024
+
+
+def maxsize():
+    """Returns the maximum size in bytes of the cache directory."""
+    return _maxsize
+
+
+def setmaxsize(size):
+    """Sets the maximum size in bytes of the cache directory."""
+    global _maxsize
+    _maxsize = size
+
+
+def directory():
+    """Returns the cache directory, or None if it is not available."""
+    return util.cachedir("tokens")
+
+
+def _cachefile(filename):
+    """Returns the name of the cache file for the (real) filename."""
+    d = directory()
+    if d:
+        name = hashlib.sha1(filename.encode('utf-8')).hexdigest()
+        return os.path.join(d, name + '.tokens')
+
+
+def _key(filename, stat, mode):
+    """Returns the tuple that must match for a cache file to be valid."""
+    return (_VERSION, filename, stat.st_mtime, stat.st_size, mode)
+
+
+def load(filename, stat, text, mode=None, cls=ly.document.Document):
+    """Returns a document of class cls restored from the cache, or None.
+
+    filename must be the real path of the file, stat the result of os.stat()
+    (taken before reading the file), and text the decoded contents of the
+    file. None is returned if there is no valid cache for this file.
+
+    """
+    cachefile = _cachefile(filename)
+    if not cachefile:
+        return
+    try:
+        with open(cachefile, 'rb') as f:
+            data = marshal.loads(zlib.decompress(f.read()))
+        key, classnames, states, lines = data
+        if key != _key(filename, stat, mode):
+            return
+        classes = [_find_class(name) for name in classnames]
+        states = [tuple((classes[c], attrs) for c, attrs in s) for s in states]
+        blocks = []
+        for line, (state, tokens) in zip(text.replace('\r', '').split('\n'), lines):
+            blocks.append((tuple(classes[tokens[i]](line[tokens[i+1]:tokens[i+2]], tokens[i+1])
+                                 for i in range(0, len(tokens), 3)), states[state]))
+        doc = cls.from_tokens(text, mode, blocks)
+    except Exception:
+        # invalid, old or unreadable cache file
+        return
+    # mark this cache file as recently used
+    try:
+        os.utime(cachefile, None)
+    except (IOError, OSError):
+        pass
+    return doc
+
+
+def save(filename, stat, doc, mode=None):
+    """Stores the tokens of the document in the cache.
+
+    The arguments filename, stat and mode must be the same as used for load().
+
+    """
+    cachefile = _cachefile(filename)
+    if not cachefile:
+        return
+    classes, classnames = {}, []
+    frozens, states = {}, []
+    lines = []
+
+    def class_index(cls):
+        try:
+            return classes[cls]
+        except KeyError:
+            classnames.append(cls.__module__ + ':' + cls.__name__)
+            i = classes[cls] = len(classes)
+            return i
+
+    for block in doc:
+        frozen = doc.state_end(block).freeze()
+        try:
+            state = frozens[frozen]
+        except KeyError:
+            state = frozens[frozen] = len(states)
+            states.append(tuple((class_index(c), attrs) for c, attrs in frozen))
+        tokens = []
+        for t in doc.tokens(block):
+            tokens.extend((class_index(type(t)), t.pos, t.end))
+        lines.append((state, tuple(tokens)))
+    data = (_key(filename, stat, mode), classnames, states, lines)
+    try:
+        data = zlib.compress(marshal.dumps(data))
+        temp = cachefile + '.tmp'
+        with open(temp, 'wb') as f:
+            f.write(data)
+        try:
+            os.rename(temp, cachefile)
+        except OSError:
+            # Windows does not overwrite an existing file
+            os.remove(cachefile)
+            os.rename(temp, cachefile)
+    except (IOError, OSError, ValueError):
+        return
+    purge()
+
+
+def purge():
+    """Removes the least recently used cache files until maxsize() is met."""
+    d = directory()
+    if not d:
+        return
+    files = []
+    total = 0
+    for name in os.listdir(d):
+        path = os.path.join(d, name)
+        try:
+            s = os.stat(path)
+        except (IOError, OSError):
+            continue
+        files.append((s.st_mtime, s.st_size, path))
+        total += s.st_size
+    if total > maxsize():
+        for mtime, size, path in sorted(files):
+            try:
+                os.remove(path)
+            except (IOError, OSError):
+                continue
+            total -= size
+            if total <= maxsize():
+                break
+
+
+def clear():
+    """Removes all cache files."""
+    d = directory()
+    if d:
+        for name in os.listdir(d):
+            try:
+                os.remove(os.path.join(d, name))
+            except (IOError, OSError):
+                pass
+
+
+def _find_class(name):
+    """Returns the class for a name in the 'module:classname' form."""
+    module, name = name.split(':')
+    return getattr(importlib.import_module(module), name)
@@ -108,6 +108,25 @@ def tempdir():
     return tempfile.mkdtemp(dir=_tempdir)
 
 
+def cachedir(name):
+    """Returns a subdirectory with name in the user's cache directory.
+    
+    The directory is created if needed. Returns None if that fails.
+    
+    """
+    from PyQt4.QtGui import QDesktopServices
+    base = QDesktopServices.storageLocation(QDesktopServices.CacheLocation)
+    if not base:
+        base = os.path.join(os.path.expanduser('~'), '.cache', info.name)
+    path = os.path.join(base, name)
+    if not os.path.isdir(path):
+        try:
+            os.makedirs(path)
+        except (IOError, OSError):
+            return
+    return path
+
+
 def files(basenames, extension = '.*'):
     """Yields filenames with the given basenames matching the given extension."""
     def source():
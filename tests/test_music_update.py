@@ -0,0 +1,140 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2014 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Tests ly.music.items.Document.update() against a full re-read.
+
+Run with: python -m unittest discover tests
+"""
+
+from __future__ import unicode_literals
+
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'frescobaldi_app'))
+
+import ly.document
+import ly.lex
+from ly.music import items
+
+
+TEXT = r'''\version "2.18.0"
+\header { title = "Test" }
+global = { \key c \major \time 4/4 }
+melody = \relative c'' {
+  c4 d e f | g2 g | \times 2/3 { a8 b c } d4 e2 |
+  \repeat volta 2 { f1 } \alternative { { g1 } { a1 } }
+}
+bass = { c,4 <c e g>8 d16 e \grace { f16 } g2 | r1 | s2 c4. d8 }
+\score {
+  << \new Staff { \global \melody } \new Staff \bass >>
+  \layout { }
+}
+\markup { hello }
+words = \lyricmode { a -- b c }
+'''
+
+SNIPPETS = [
+    'c4 ', 'd8. ', '{ ', '} ', '{ d2 } ', "\\relative c' ", '<< ', '>> ',
+    'x = ', 'x = { c }\n', '\n', '% c\n', '%{ ', '%} ', '"str" ', '"',
+    '\\times 2/3 ', '\\score { ', '#(+ 1 2) ', '#(', ')', '\\markup { m } ',
+    '\\language "english" ', '\\repeat volta 2 ', '|', ' ',
+]
+
+
+def dump(node):
+    """Returns a comparable structure for node and all its descendants."""
+    def value(v):
+        if isinstance(v, items.Document):
+            return 'document'
+        elif isinstance(v, items.Item):
+            return dump(v)
+        elif isinstance(v, ly.lex.Token):
+            return (type(v).__name__, v[:], v.pos, v.end)
+        elif isinstance(v, (tuple, list)):
+            return tuple(value(i) for i in v)
+        elif isinstance(v, ly.document.DocumentBase):
+            return 'lydocument'
+        return repr(v)
+    attrs = tuple(sorted((name, value(v)) for name, v in vars(node).items()
+                         if name not in ('document', '_starts')))
+    return (type(node).__name__, node.position, attrs,
+            tuple(dump(n) for n in node))
+
+
+class UpdateTest(unittest.TestCase):
+    """Checks that an updated tree is the same as a newly read tree."""
+    def edit(self, doc, music, start, end, text):
+        """Changes the text and updates the music, then compares it."""
+        with doc:
+            doc[start:end] = text
+        music.update(start, end - start, len(text))
+        self.assertEqual(dump(music), dump(items.Document(doc)),
+            "edit {0}:{1} {2!r}".format(start, end, text))
+
+    def test_edit_overlapping_first_item(self):
+        doc = ly.document.Document('  { c4 }')
+        music = items.Document(doc)
+        self.edit(doc, music, 0, 8, 'c')
+
+    def test_insert_before_first_item(self):
+        doc = ly.document.Document('  { c4 }')
+        music = items.Document(doc)
+        self.edit(doc, music, 0, 3, '{ d2 } { ')
+        self.assertEqual(len(music), 2)
+
+    def test_insert_after_last_item(self):
+        doc = ly.document.Document(TEXT)
+        music = items.Document(doc)
+        self.edit(doc, music, len(TEXT), len(TEXT), '{ d2 }')
+
+    def test_change_language(self):
+        doc = ly.document.Document(TEXT)
+        music = items.Document(doc)
+        self.edit(doc, music, 0, 0, '\\language "english"\n')
+
+    def test_random_edits(self):
+        for seed in range(3):
+            rnd = random.Random(seed)
+            for trial in range(20):
+                doc = ly.document.Document(TEXT * rnd.randint(1, 2))
+                music = items.Document(doc)
+                for step in range(10):
+                    length = len(doc.plaintext())
+                    # edits at the start of the document and at the start of
+                    # toplevel items are the tricky ones, choose them often
+                    choice = rnd.random()
+                    if choice < .2:
+                        start = 0
+                    elif choice < .4 and len(music):
+                        start = rnd.choice(music).position
+                    else:
+                        start = rnd.randint(0, length)
+                    end = min(length, start + rnd.choice([0, 0, 1, 3, 10, 40]))
+                    text = ''.join(rnd.choice(SNIPPETS)
+                                   for i in range(rnd.randint(0, 3)))
+                    self.edit(doc, music, start, end, text)
+
+
+if __name__ == '__main__':
+    unittest.main()
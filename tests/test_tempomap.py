@@ -0,0 +1,102 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2014 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Tests midifile.song.TempoMap against a linear walk over the tempo changes.
+
+Run with: python -m unittest discover tests
+"""
+
+from __future__ import unicode_literals
+
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'frescobaldi_app'))
+
+from midifile import event, song
+
+
+def tempo_event(tempo):
+    """Returns a Set Tempo Meta-event for tempo microseconds per quarter."""
+    # the parser's data is a str of bytes; get_tempo() only indexes it
+    data = tuple(chr(b) for b in (tempo >> 16, (tempo >> 8) & 0xFF, tempo & 0xFF))
+    return event.MetaEvent(0x51, data)
+
+
+def linear_real_time(times, division, midi_time):
+    """Computes the real time like TempoMap did before it used bisect."""
+    real_time = 0
+    for i in range(1, len(times)):
+        if times[i][0] >= midi_time:
+            real_time += (midi_time - times[i-1][0]) * times[i-1][1]
+            break
+        real_time += (times[i][0] - times[i-1][0]) * times[i-1][1]
+    else:
+        real_time += (midi_time - times[-1][0]) * times[-1][1]
+    return real_time // division
+
+
+class TempoMapTest(unittest.TestCase):
+    def check(self, d, division, midi_times):
+        t = song.TempoMap(d, division)
+        div = song.smpte_division(division)
+        for midi_time in midi_times:
+            self.assertEqual(t.real_time(midi_time),
+                linear_real_time(t.times, div, midi_time), midi_time)
+        midi_times = sorted(midi_times)
+        self.assertEqual(t.msecs(midi_times), [t.msec(m) for m in midi_times])
+
+    def test_no_tempo(self):
+        self.check({0: [], 480: []}, 384, [0, 1, 480, 10000])
+
+    def test_empty(self):
+        self.check({}, 384, [0, 100])
+
+    def test_tempo_not_at_start(self):
+        d = {0: [], 960: [tempo_event(400000)]}
+        self.check(d, 480, [0, 959, 960, 961, 5000])
+
+    def test_smpte_division(self):
+        d = {0: [tempo_event(600000)], 100: [tempo_event(300000)]}
+        self.check(d, 0xE728, [0, 50, 100, 150])
+
+    def test_per_track_events(self):
+        d = {0: {0: [tempo_event(600000)], 1: []},
+             240: {1: [tempo_event(450000)]}}
+        self.check(d, 480, [0, 239, 240, 241, 2000])
+
+    def test_random(self):
+        rnd = random.Random(0)
+        for trial in range(50):
+            d = {}
+            for i in range(rnd.randint(0, 50)):
+                d[rnd.randrange(0, 10000)] = [
+                    tempo_event(rnd.randint(100000, 1500000))]
+            midi_times = [rnd.randrange(0, 12000) for i in range(200)]
+            # times exactly at tempo changes
+            midi_times.extend(d)
+            self.check(d, rnd.choice([96, 384, 480, 960]), midi_times)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2014 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Tests that ly.document.TreeDocument behaves like ly.document.Document.
+
+Run with: python -m unittest discover tests
+"""
+
+from __future__ import unicode_literals
+
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'frescobaldi_app'))
+
+import ly.document
+
+
+TEXT = r'''\version "2.18.0"
+music = \relative c' {
+  c4 d e f | g2 g |
+  #(define x "a
+  string")
+}
+\markup { \bold text }
+'''
+
+SNIPPETS = ['c4 ', '\n', '\n\n', '{ ', '} ', '"', '%{', '%}', '#(', ')',
+            '\\markup { ', '% comment', 'x', '']
+
+
+def dump(doc):
+    """Returns a comparable structure for the blocks and tokens of doc."""
+    result = []
+    for block in doc:
+        result.append((doc.index(block), doc.position(block), doc.text(block),
+            tuple((type(t).__name__, t[:], t.pos) for t in doc.tokens(block)),
+            doc.state_end(block).freeze()))
+    return doc.mode(), len(doc), doc.size(), result
+
+
+class TreeDocumentTest(unittest.TestCase):
+    def test_random_edits(self):
+        rnd = random.Random(0)
+        for trial in range(30):
+            text = TEXT * rnd.randint(1, 5)
+            doc = ly.document.Document(text)
+            tree = ly.document.TreeDocument(text)
+            for step in range(20):
+                size = doc.size()
+                start = rnd.randint(0, size)
+                end = min(size, start + rnd.choice([0, 0, 1, 5, 30]))
+                text = ''.join(rnd.choice(SNIPPETS)
+                               for i in range(rnd.randint(0, 3)))
+                for d in doc, tree:
+                    with d:
+                        d[start:end] = text
+                self.assertEqual(dump(tree), dump(doc))
+                for i in range(10):
+                    pos = rnd.randint(0, doc.size())
+                    self.assertEqual(tree.index(tree.block(pos)),
+                                     doc.index(doc.block(pos)))
+
+    def test_several_changes(self):
+        doc = ly.document.Document(TEXT)
+        tree = ly.document.TreeDocument(TEXT)
+        for d in doc, tree:
+            with d:
+                d[0:0] = '% top\n'
+                d[30:40] = ''
+                d[d.size():] = '\n{ c }'
+        self.assertEqual(dump(tree), dump(doc))
+
+    def test_setplaintext(self):
+        tree = ly.document.TreeDocument(TEXT)
+        tree.setplaintext('{ c }\n{ d }')
+        self.assertEqual(dump(tree),
+                         dump(ly.document.Document('{ c }\n{ d }')))
+
+
+if __name__ == '__main__':
+    unittest.main()